@@ -0,0 +1,279 @@
+"""
+Announcement calendar: the listing date a submission appears under.
+
+arXiv closes a submission window at 14:00 US Eastern every weekday and
+mails the new listing at 20:00 the evening before the listing date, which
+is the next weekday (Friday's window is mailed on Sunday, dated Monday). The
+cutoff follows daylight saving time, i.e. 19:00 UTC in winter and 18:00 UTC
+in summer. On holidays there is no announcement: the window that would have
+been announced that day stays open until the next deadline.
+
+Holidays are announcement dates, given in ARXIV_LOCAL_HOLIDAYS either as a
+comma-separated list (2026-12-25,2027-01-01) or as the path of a file with
+one date per line. Nothing is assumed by default.
+
+A Calendar precomputes the deadlines of every window from FIRST_YEAR on as
+a sorted array, so a timestamp is dated by binary search, and whole arrays
+of timestamps at once with numpy.searchsorted (numpy is only imported for
+the array functions, which the app's startup path does not use). The
+same table is kept in the announcement_windows table, which lets redate()
+re-date every paper with one UPDATE after the calendar changes:
+
+    python -m arxiv_local.app.announcements check
+    python -m arxiv_local.app.announcements redate
+"""
+import argparse
+import bisect
+import datetime
+import os
+import threading
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import migrations, rankings
+
+TIMEZONE = ZoneInfo("America/New_York")
+CUTOFF = datetime.time(14, 0)
+MAILING = datetime.time(20, 0)
+FIRST_YEAR = 1991
+HOLIDAYS = os.getenv("ARXIV_LOCAL_HOLIDAYS", "")
+# Rows read per batch by check()
+CHECK_BATCH = 5000
+
+UTC = datetime.timezone.utc
+
+
+def load_holidays(value=None):
+    """Parses ARXIV_LOCAL_HOLIDAYS (or value): a date list or a file of dates."""
+    value = HOLIDAYS if value is None else value
+    if os.path.isfile(value):
+        with open(value) as f:
+            items = [line.split("#")[0] for line in f]
+    else:
+        items = value.split(",")
+    return {datetime.date.fromisoformat(item.strip()) for item in items if item.strip()}
+
+
+def _to_utc(ts: datetime.datetime):
+    # Naive timestamps are UTC, as stored in the DB
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=UTC)
+    return ts.astimezone(UTC)
+
+
+def _listing_date(day: datetime.date):
+    # Listing date of the window that closes on weekday `day`
+    return day + datetime.timedelta(days=3 if day.weekday() == 4 else 1)
+
+
+class Calendar:
+    """Submission windows of the years first_year..last_year."""
+
+    def __init__(self, first_year, last_year, holidays=()):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.holidays = frozenset(holidays)
+
+        deadlines, mailings, dates = [], [], []
+        day = datetime.date(first_year, 1, 1)
+        # Run a week into the next year so that late-December submissions
+        # still find their deadline
+        end = datetime.date(last_year + 1, 1, 8)
+        while day < end:
+            if day.weekday() < 5:
+                listing = _listing_date(day)
+                if listing not in self.holidays:
+                    deadlines.append(datetime.datetime.combine(day, CUTOFF, tzinfo=TIMEZONE).timestamp())
+                    # Friday's window is mailed on Sunday evening
+                    mailing_day = listing - datetime.timedelta(days=1)
+                    mailings.append(datetime.datetime.combine(mailing_day, MAILING, tzinfo=TIMEZONE).timestamp())
+                    dates.append(listing)
+            day += datetime.timedelta(days=1)
+
+        self.deadline_list = deadlines
+        self.mailing_list = mailings
+        self.date_list = dates
+        self.date_set = frozenset(dates)
+        # numpy copies for announcement_dates(), made on first use
+        self._arrays = None
+
+    def covering(self, year):
+        """This calendar, or one with the same holidays extended through year."""
+        if year is None or year <= self.last_year:
+            return self
+        return Calendar(self.first_year, year, self.holidays)
+
+    def _index(self, t):
+        # A submission at the deadline second itself misses it
+        i = bisect.bisect_right(self.deadline_list, t)
+        if i == len(self.deadline_list):
+            raise ValueError(f"timestamp after the calendar's last year ({self.last_year})")
+        return i
+
+    def announcement_date(self, ts: datetime.datetime) -> datetime.date:
+        return self.date_list[self._index(_to_utc(ts).timestamp())]
+
+    def announcement_dates(self, timestamps):
+        """
+        Dates for an array of UTC timestamps (numpy datetime64, or naive UTC
+        datetimes). Returns a datetime64[D] array.
+        """
+        import numpy as np
+        if self._arrays is None:
+            self._arrays = (np.array(self.deadline_list, dtype=np.int64),
+                            np.array(self.date_list, dtype="datetime64[D]"))
+        deadlines, dates = self._arrays
+        seconds = np.asarray(timestamps, dtype="datetime64[s]").astype(np.int64)
+        idx = np.searchsorted(deadlines, seconds, side="right")
+        if len(idx) and idx.max() == len(deadlines):
+            raise ValueError(f"timestamp after the calendar's last year ({self.last_year})")
+        return dates[idx]
+
+    def is_announcement_day(self, day: datetime.date):
+        return day in self.date_set
+
+    def next_mailing(self, after: datetime.datetime):
+        """(listing date, UTC mailing time) of the first mailing after `after`."""
+        i = bisect.bisect_right(self.mailing_list, _to_utc(after).timestamp())
+        if i == len(self.mailing_list):
+            raise ValueError(f"no mailing left in the calendar's last year ({self.last_year})")
+        return self.date_list[i], datetime.datetime.fromtimestamp(self.mailing_list[i], UTC)
+
+    def windows(self):
+        """Rows for the announcement_windows table (naive UTC deadlines)."""
+        return [
+            {"deadline": datetime.datetime.fromtimestamp(t, UTC).replace(tzinfo=None), "date": d}
+            for t, d in zip(self.deadline_list, self.date_list)
+        ]
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def calendar(until_year=None) -> Calendar:
+    """The shared calendar, covering FIRST_YEAR through at least until_year and next year."""
+    global _calendar
+    until_year = max(until_year or 0, datetime.date.today().year + 1)
+    cal = _calendar
+    if cal is not None and cal.last_year >= until_year:
+        return cal
+    with _calendar_lock:
+        if _calendar is None or _calendar.last_year < until_year:
+            _calendar = Calendar(FIRST_YEAR, until_year, load_holidays())
+        return _calendar
+
+
+def reset(holidays=None):
+    """Rebuilds the shared calendar, e.g. after changing HOLIDAYS."""
+    global _calendar, HOLIDAYS
+    with _calendar_lock:
+        if holidays is not None:
+            HOLIDAYS = holidays
+        _calendar = None
+    return calendar()
+
+
+def announcement_date(ts: datetime.datetime) -> datetime.date:
+    return calendar(ts.year).announcement_date(ts)
+
+
+def _last_year(timestamps):
+    return int(timestamps.max().astype("datetime64[Y]").astype(int)) + 1970 if len(timestamps) else None
+
+
+def announcement_dates(timestamps):
+    import numpy as np
+    timestamps = np.asarray(timestamps, dtype="datetime64[s]")
+    return calendar(_last_year(timestamps)).announcement_dates(timestamps)
+
+
+# --- Re-dating the DB ---
+
+def sync_windows(db: Session, cal: Calendar = None):
+    """Replaces announcement_windows with the calendar's deadlines."""
+    cal = cal or calendar()
+    db.execute(delete(models.AnnouncementWindow))
+    db.execute(insert(models.AnnouncementWindow), cal.windows())
+    return len(cal.deadline_list)
+
+
+def _window_date():
+    # Date of the first deadline after the paper's submission (uses the
+    # deadline primary key, so one index probe per paper)
+    return select(models.AnnouncementWindow.date).where(
+        models.AnnouncementWindow.deadline > models.Paper.submitted_at
+    ).order_by(models.AnnouncementWindow.deadline).limit(1).scalar_subquery()
+
+
+def _redate(db: Session, cal):
+    last = db.query(func.max(models.Paper.submitted_at)).scalar()
+    cal = cal.covering(last.year if last else None)
+    sync_windows(db, cal)
+    new_date = _window_date()
+    moved = models.Paper.submitted_at.isnot(None), models.Paper.published_date.is_distinct_from(new_date)
+    dates = set()
+    for old, new in db.query(models.Paper.published_date, new_date).filter(*moved).distinct():
+        dates.update((old, new))
+    count = db.execute(update(models.Paper).where(*moved).values(published_date=new_date)).rowcount
+    db.commit()
+    return count, dates
+
+
+def redate(db: Session, cal: Calendar = None):
+    """
+    Re-dates every paper with a stored submission time from the calendar in
+    a single UPDATE, then rebuilds the rankings of the dates involved.
+    Returns the number of papers moved.
+    """
+    cal = cal or calendar()
+    db.rollback()
+    count, dates = database.writer.run(_redate, cal)
+    if dates:
+        database.writer.run(rankings.rebuild_days, dates)
+    print(f"Re-dated {count} papers ({len(dates)} announcement dates affected).")
+    return count
+
+
+def check(db: Session, cal: Calendar = None):
+    """
+    Compares stored dates with the calendar without changing anything.
+    Returns {"checked", "mismatched", "undated"}; undated papers were stored
+    before submission times were kept and cannot be re-dated.
+    """
+    import numpy as np
+    cal = cal or calendar()
+    checked = mismatched = 0
+    rows = db.execute(
+        select(models.Paper.submitted_at, models.Paper.published_date).where(models.Paper.submitted_at.isnot(None))
+    ).yield_per(CHECK_BATCH)
+    for batch in rows.partitions():
+        submitted = np.array([s for s, _ in batch], dtype="datetime64[s]")
+        stored = np.array([d for _, d in batch], dtype="datetime64[D]")
+        cal = cal.covering(_last_year(submitted))
+        mismatched += int((cal.announcement_dates(submitted) != stored).sum())
+        checked += len(batch)
+    undated = db.query(models.Paper.id).filter(models.Paper.submitted_at.is_(None)).count()
+    return {"checked": checked, "mismatched": mismatched, "undated": undated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "redate"])
+    parser.add_argument("--holidays", default=None, help="Overrides ARXIV_LOCAL_HOLIDAYS")
+    args = parser.parse_args()
+
+    cal = reset(args.holidays) if args.holidays is not None else calendar()
+    migrations.migrate(database.engine)
+    with database.SessionLocal() as db:
+        if args.command == "check":
+            print(check(db, cal))
+        else:
+            redate(db, cal)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Normalized authors and categories.
+
+`Paper.authors` stays as the display string, but the author list of each
+paper is also stored in byline order in `paper_authors` (pointing at one
+`authors` row per distinct name), and every listed category, cross-lists
+included, in `paper_categories`. Both have (key, paper_id) indexes, so
+"papers by X" and "papers in category C" are index lookups. Rows are
+written during ingestion and removed with their papers by cleanup.
+"""
+import string
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .database import models
+
+CHUNK = 500
+MAX_PER_PAGE = 100
+
+# authors.name uses SQLite's NOCASE collation, which only folds ASCII letters
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _key(name):
+    return name.translate(_NOCASE)
+
+
+def _chunks(items, size=CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def split_authors(authors):
+    """Splits a legacy comma-joined author string (only used for migration)."""
+    return [a.strip() for a in (authors or "").split(", ") if a.strip()]
+
+
+def _author_ids(db: Session, names):
+    """Returns {folded name: author id}, creating missing authors."""
+    unique = {}
+    for name in names:
+        unique.setdefault(_key(name), name)
+    ids = {}
+    for chunk in _chunks(unique.values()):
+        db.execute(sqlite_insert(models.Author).on_conflict_do_nothing(), [{"name": n} for n in chunk])
+        ids.update((_key(name), author_id) for author_id, name in db.query(
+            models.Author.id, models.Author.name
+        ).filter(models.Author.name.in_(chunk)))
+    return ids
+
+
+def link_papers(db: Session, records):
+    """
+    Writes author and category links for paper records (dicts with id,
+    author_names, categories and arxiv_category). Does not commit; it runs
+    inside the ingestion transaction.
+    """
+    records = [r for r in records if r.get("id")]
+    if not records:
+        return
+    ids = _author_ids(db, (n for r in records for n in r.get("author_names") or ()))
+
+    author_rows, category_rows = [], []
+    for r in records:
+        for position, name in enumerate(r.get("author_names") or ()):
+            author_rows.append({"paper_id": r["id"], "position": position, "author_id": ids[_key(name)]})
+        primary = r.get("arxiv_category")
+        categories = list(dict.fromkeys(c for c in (r.get("categories") or [primary]) if c))
+        if primary and primary not in categories:
+            categories.insert(0, primary)
+        for category in categories:
+            category_rows.append({"paper_id": r["id"], "category": category, "is_primary": category == primary})
+
+    if author_rows:
+        db.execute(sqlite_insert(models.PaperAuthor).on_conflict_do_nothing(), author_rows)
+    if category_rows:
+        db.execute(sqlite_insert(models.PaperCategory).on_conflict_do_nothing(), category_rows)
+
+
+def unlink_papers(db: Session, paper_ids):
+    """Deletes the links of papers being removed (paper_ids may be a subquery)."""
+    db.execute(delete(models.PaperAuthor).where(models.PaperAuthor.paper_id.in_(paper_ids)))
+    db.execute(delete(models.PaperCategory).where(models.PaperCategory.paper_id.in_(paper_ids)))
+
+
+def relink_authors(db: Session, records):
+    """
+    Replaces the author links of papers whose display string changed
+    (records of id and author_names). Does not commit.
+    """
+    db.execute(delete(models.PaperAuthor).where(models.PaperAuthor.paper_id.in_([r["id"] for r in records])))
+    link_papers(db, records)
+
+
+def prune_authors(db: Session):
+    """Drops authors left without papers."""
+    return db.execute(delete(models.Author).where(
+        models.Author.id.notin_(select(models.PaperAuthor.author_id))
+    )).rowcount
+
+
+def ensure_backfilled(db: Session):
+    """
+    One-off migration for DBs created before the link tables existed:
+    splits the stored author strings and records the primary category
+    (cross-lists of old papers are unknown until they are fetched again).
+    """
+    if db.query(models.PaperAuthor.paper_id).first() is not None \
+            or db.query(models.PaperCategory.paper_id).first() is not None \
+            or db.query(models.Paper.id).first() is None:
+        return 0
+    print("Building author and category tables...")
+    count = 0
+    rows = db.query(models.Paper.id, models.Paper.authors, models.Paper.arxiv_category).yield_per(CHUNK)
+    batch = []
+    for paper_id, authors, category in rows:
+        batch.append({"id": paper_id, "author_names": split_authors(authors),
+                      "categories": [category] if category else [], "arxiv_category": category})
+        if len(batch) >= CHUNK:
+            link_papers(db, batch)
+            count += len(batch)
+            batch = []
+    link_papers(db, batch)
+    count += len(batch)
+    db.commit()
+    print(f"Linked {count} papers.")
+    return count
+
+
+def authors_of(db: Session, paper_ids):
+    """Returns {paper_id: [author names in byline order]}."""
+    result = {}
+    for chunk in _chunks(paper_ids):
+        for paper_id, name in db.query(models.PaperAuthor.paper_id, models.Author.name).join(
+            models.Author, models.Author.id == models.PaperAuthor.author_id
+        ).filter(models.PaperAuthor.paper_id.in_(chunk)).order_by(
+            models.PaperAuthor.paper_id, models.PaperAuthor.position
+        ):
+            result.setdefault(paper_id, []).append(name)
+    return result
+
+
+def categories_of(db: Session, paper_ids):
+    """Returns {paper_id: [categories, primary first]}."""
+    result = {}
+    for chunk in _chunks(paper_ids):
+        for paper_id, category in db.query(models.PaperCategory.paper_id, models.PaperCategory.category).filter(
+            models.PaperCategory.paper_id.in_(chunk)
+        ).order_by(models.PaperCategory.paper_id, models.PaperCategory.is_primary.desc(),
+                   models.PaperCategory.category):
+            result.setdefault(paper_id, []).append(category)
+    return result
+
+
+def find_authors(db: Session, prefix: str, limit: int = 20):
+    """Authors whose name starts with prefix (case-insensitive), with paper counts."""
+    prefix = (prefix or "").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if not prefix:
+        return []
+    matches = db.query(models.Author.id, models.Author.name).filter(
+        models.Author.name.like(prefix + "%", escape="\\")
+    ).order_by(models.Author.name).limit(limit).subquery()
+    return db.query(matches.c.name, func.count(models.PaperAuthor.paper_id)).join(
+        models.PaperAuthor, models.PaperAuthor.author_id == matches.c.id
+    ).group_by(matches.c.id, matches.c.name).order_by(matches.c.name).all()
+
+
+def _page(query, page, per_page):
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    total = query.count()
+    ids = [pid for (pid,) in query.order_by(
+        models.Paper.published_date.desc(), models.Paper.id.desc()
+    ).limit(per_page).offset((page - 1) * per_page)]
+    return {"total": total, "page": page, "per_page": per_page, "paper_ids": ids}
+
+
+def papers_by_author(db: Session, name: str, page: int = 1, per_page: int = 25):
+    """Papers of one author (exact name, case-insensitive), newest first."""
+    query = db.query(models.Paper.id).join(
+        models.PaperAuthor, models.PaperAuthor.paper_id == models.Paper.id
+    ).join(
+        models.Author, models.Author.id == models.PaperAuthor.author_id
+    ).filter(models.Author.name == name)
+    return _page(query, page, per_page)
+
+
+def papers_in_category(db: Session, category: str, page: int = 1, per_page: int = 25):
+    """Papers listed in a category, cross-lists included, newest first."""
+    query = db.query(models.Paper.id).join(
+        models.PaperCategory, models.PaperCategory.paper_id == models.Paper.id
+    ).filter(models.PaperCategory.category == category)
+    return _page(query, page, per_page)
+
+
+def category_counts(db: Session):
+    """Returns [(category, paper count)] for every category, largest first."""
+    return db.query(models.PaperCategory.category, func.count()).group_by(
+        models.PaperCategory.category
+    ).order_by(func.count().desc()).all()
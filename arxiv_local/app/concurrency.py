@@ -0,0 +1,54 @@
+"""
+Thread pools for blocking work called from async request handlers.
+
+SQLAlchemy sessions and pyzotero are synchronous, so handlers run them in
+one of two sized pools instead of on the event loop: one for DB/CPU work
+(queries, scoring, template rendering) and a separate one for outbound
+network calls, so a slow Zotero request cannot starve page loads of DB
+threads. Each job opens and closes its own session inside the worker.
+
+Follow-up work a handler does not wait for (rescoring after a like) goes
+to run_after(), a one-thread pool outside the request: it neither holds a
+DB worker nor counts towards the request's latency and SQL metrics.
+"""
+import asyncio
+import functools
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+DB_WORKERS = int(os.getenv("ARXIV_LOCAL_DB_WORKERS", "8"))
+NETWORK_WORKERS = int(os.getenv("ARXIV_LOCAL_NETWORK_WORKERS", "4"))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+network_executor = ThreadPoolExecutor(max_workers=NETWORK_WORKERS, thread_name_prefix="net")
+# One thread, so queued follow-ups run in the order they were submitted
+after_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="after")
+
+
+async def run_db(func, *args, **kwargs):
+    """Runs blocking DB/CPU work on the DB pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, metrics.carry(functools.partial(func, *args, **kwargs)))
+
+
+async def run_network(func, *args, **kwargs):
+    """Runs a blocking outbound HTTP call on the network pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(network_executor, metrics.carry(functools.partial(func, *args, **kwargs)))
+
+
+def _report_failure(future):
+    error = future.exception()
+    if error is not None:
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+
+def run_after(func, *args, **kwargs):
+    """Queues func(*args, **kwargs) on the follow-up pool and returns its future without waiting."""
+    # Submitted without the request context (no metrics.carry), so it is not counted against it
+    future = after_executor.submit(func, *args, **kwargs)
+    future.add_done_callback(_report_failure)
+    return future
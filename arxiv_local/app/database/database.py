@@ -1,12 +1,41 @@
-from sqlalchemy import create_engine
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./arxiv_papers.db"
+from .. import metrics
+
+SQLALCHEMY_DATABASE_URL = os.getenv("ARXIV_LOCAL_DB_URL", "sqlite:///./arxiv_papers.db")
+
+# Applied to every new SQLite connection. WAL lets the UI read while a
+# background task writes; busy_timeout makes a writer wait for the lock
+# instead of failing with "database is locked". auto_vacuum only takes
+# effect on a new file (retention.vacuum converts existing ones).
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("ARXIV_LOCAL_BUSY_TIMEOUT_MS", "10000")),
+    "cache_size": -64000, # KiB, i.e. 64 MB per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -17,3 +46,80 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def upgrade_schema(engine, base):
+    """
+    create_all() never alters existing tables, so columns and indexes added
+    to a model after the DB file was created are added here. Primary key
+    columns are left out: SQLite cannot add them to a key, so a table whose
+    key changed is rebuilt by its migration step instead.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and not column.primary_key:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+class SerializedWriter:
+    """
+    One thread that runs every background write job in turn, each in its
+    own short transaction. Background tasks hand it small batches instead of
+    holding write transactions themselves, so they never contend with each
+    other and a like from the UI waits for at most one batch.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            future, func, args, kwargs = self._jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            db = self.session_factory()
+            try:
+                result = func(db, *args, **kwargs)
+                db.commit()
+            except BaseException as e:
+                db.rollback()
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                db.close()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """Queues func(db, *args, **kwargs); db is a session owned by the writer."""
+        self._ensure_started()
+        future = Future()
+        # Runs in the caller's context, so its queries count against the caller's request
+        self._jobs.put((future, metrics.carry(func), args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Runs func(db, *args, **kwargs) on the writer and waits for its result."""
+        if threading.current_thread() is self._thread:
+            # Already inside a write job: run inline rather than deadlock
+            with self.session_factory() as db:
+                result = func(db, *args, **kwargs)
+                db.commit()
+                return result
+        return self.submit(func, *args, **kwargs).result()
+
+writer = SerializedWriter(SessionLocal)
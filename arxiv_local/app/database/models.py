@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, Date, DateTime, Float
+from sqlalchemy import Column, Integer, String, Text, Boolean, Date, DateTime, Float, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -7,25 +7,74 @@ class Paper(Base):
 
     id = Column(String, primary_key=True, index=True) # Arxiv ID
     title = Column(String, index=True)
-    authors = Column(String) # Stored as comma-separated string or JSON
+    authors = Column(String) # Comma-separated display string; see PaperAuthor
     abstract = Column(Text)
     published_date = Column(Date, index=True)
     updated_date = Column(Date)
     arxiv_category = Column(String, index=True)
     link = Column(String)
-    
-    # For recommendation sorting
-    score = Column(Float, default=0.0)
+    # Submission time (UTC) the announcement date is derived from; NULL for
+    # papers stored before it was kept
+    submitted_at = Column(DateTime)
+    # Recommendation scores are per user, in the scores table
+
+class Author(Base):
+    __tablename__ = "authors"
+
+    id = Column(Integer, primary_key=True)
+    # NOCASE so exact and prefix lookups are case-insensitive and still indexed
+    name = Column(String(collation="NOCASE"), unique=True, nullable=False)
+
+class PaperAuthor(Base):
+    """Author list of a paper, in byline order."""
+    __tablename__ = "paper_authors"
+
+    paper_id = Column(String, primary_key=True)
+    position = Column(Integer, primary_key=True)
+    author_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_paper_authors_author_paper", "author_id", "paper_id"),
+    )
+
+class PaperCategory(Base):
+    """Every category a paper is listed in, cross-lists included."""
+    __tablename__ = "paper_categories"
+
+    paper_id = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    is_primary = Column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_paper_categories_category_paper", "category", "paper_id"),
+    )
+
+# Owns everything recorded before profiles existed; used when a request
+# names no profile (see users.py)
+DEFAULT_USER_ID = 1
+
+class User(Base):
+    """A reader profile; likes, viewed dates, scores and rankings are per user."""
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(collation="NOCASE"), unique=True, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
 
 class Interaction(Base):
     __tablename__ = "interactions"
 
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer) # Foreign key to User.id logically
     paper_id = Column(String, index=True) # Foreign key to Paper.id logically
     is_liked = Column(Boolean, default=False)
     is_zotero = Column(Boolean, default=False)
     viewed_date = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_interactions_user_paper", "user_id", "paper_id"),
+    )
+
 class FetchLog(Base):
     __tablename__ = "fetch_logs"
 
@@ -34,8 +83,152 @@ class FetchLog(Base):
     category = Column(String)
     status = Column(String)
 
+    # Harvest checkpoint: a "running" row is resumed from next_start by the
+    # next harvest instead of starting over.
+    next_start = Column(Integer, default=0)
+    stop_before = Column(Date) # Newest updated_date in the DB when the run began
+    entries_seen = Column(Integer, default=0)
+    new_papers = Column(Integer, default=0)
+    finished_at = Column(DateTime)
+
+class ZoteroQueue(Base):
+    """
+    Papers whose Zotero sync failed; retried by later syncs. Not per user:
+    Zotero sync is only offered to the default profile (see users.py).
+    """
+    __tablename__ = "zotero_queue"
+
+    paper_id = Column(String, primary_key=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+class PaperText(Base):
+    """
+    Full text fetched by fulltext.py: the cached file (by content digest) of
+    a paper version and the start of its body, which goes into the features.
+    """
+    __tablename__ = "paper_texts"
+
+    paper_id = Column(String, primary_key=True)
+    version = Column(Integer)
+    status = Column(String, nullable=False) # downloaded, ok, empty, failed
+    kind = Column(String) # what the file turned out to be: "source" or "pdf"
+    digest = Column(String) # SHA-256 of the cached file
+    body = Column(Text)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime)
+    fetched_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_paper_texts_status_next_attempt", "status", "next_attempt_at"),
+    )
+
 class ViewedDate(Base):
     __tablename__ = "viewed_dates"
 
-    date = Column(Date, primary_key=True, index=True)
+    user_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
     viewed_at = Column(DateTime, server_default=func.now())
+
+class RankedDay(Base):
+    """One row per announcement date that has papers; drives the sidebar."""
+    __tablename__ = "ranked_days"
+
+    date = Column(Date, primary_key=True)
+    paper_count = Column(Integer, default=0)
+    built_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class DayRank(Base):
+    """
+    Materialized daily ranking: papers of each announcement date in each
+    user's score order, with their like/Zotero flags denormalized for the
+    list view.
+    """
+    __tablename__ = "day_ranks"
+
+    user_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    paper_id = Column(String, index=True)
+    is_liked = Column(Boolean, default=False)
+    is_zotero = Column(Boolean, default=False)
+    score = Column(Float)
+    # RankingRevision value of the last change to this row (rank, score or
+    # flags); clients poll for rows newer than the revision they have
+    revision = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_day_ranks_user_date_revision", "user_id", "date", "revision"),
+        Index("ix_day_ranks_user_paper", "user_id", "paper_id"),
+    )
+
+class RankingRevision(Base):
+    """Single-row counter, bumped by every change to day_ranks."""
+    __tablename__ = "ranking_revision"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, default=0)
+
+class AnnouncementWindow(Base):
+    """
+    Submission deadlines (UTC) and the listing date of the window each one
+    closes; a copy of announcements.Calendar used for re-dating in SQL.
+    """
+    __tablename__ = "announcement_windows"
+
+    deadline = Column(DateTime, primary_key=True)
+    date = Column(Date, nullable=False)
+
+class Score(Base):
+    """
+    Recommendation scores, one complete set per training run (generation)
+    for each user it scored; a user's readers use the generation their
+    ScorePointer names. See scores.py.
+    """
+    __tablename__ = "scores"
+
+    generation = Column(Integer, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    paper_id = Column(String, primary_key=True)
+    score = Column(Float)
+
+class ScoreGeneration(Base):
+    __tablename__ = "score_generations"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False) # building, ready, rolled_back
+    source = Column(String) # "train", "like", "import"
+    papers = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+    activated_at = Column(DateTime)
+
+class ScorePointer(Base):
+    """One row per user (id is the user's ID) naming the generation they see."""
+    __tablename__ = "score_pointer"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer)
+
+class Job(Base):
+    """A background fetch/train/sync run with its progress; see jobs.py."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False) # queued, running, succeeded, failed, interrupted
+    trigger = Column(String) # "user" or "schedule"
+    params = Column(Text) # JSON
+    stage = Column(String)
+    progress = Column(Text) # JSON counters, e.g. {"entries": 400, "written": 380}
+    result = Column(Text) # JSON
+    error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_jobs_kind_status", "kind", "status"),
+    )
@@ -0,0 +1,220 @@
+"""
+Parallel featurization for large corpora.
+
+HashingVectorizer is stateless, so tokenizing can be sharded across a
+process pool and the sparse term-count blocks simply stacked. The counts
+are kept in a persisted feature store (append-only shards of CSR rows plus
+their paper IDs), so a paper is tokenized once; refitting the IDF weights
+(TfidfTransformer) only needs the stored counts.
+
+Used by the recommender when ARXIV_LOCAL_FEATURIZER=hashing.
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy.orm import Session
+
+from .database import models
+
+STATE_DIR = os.path.join(os.getenv("ARXIV_LOCAL_STATE_DIR", "./recommender_state"), "features")
+
+# 2**17 hashed columns: room for the full astro-ph vocabulary with few
+# collisions, while dense per-column vectors (profile, SVD components)
+# stay small
+N_FEATURES = 2 ** 17
+WORKERS = int(os.getenv("ARXIV_LOCAL_FEATURE_WORKERS", "0")) or os.cpu_count() or 1
+# Texts per worker task, and the fewest texts worth starting a pool for
+HASH_BATCH = 2000
+PARALLEL_MIN = 10000
+TEXT_BATCH = 5000
+# Compact the store once this share of its rows belong to deleted papers
+COMPACT_SHARE = 0.25
+
+
+def paper_text(title, abstract, body=None):
+    """The featurized text: title, abstract and the full-text excerpt if fetched (see fulltext.py)."""
+    return f"{title} {abstract} {body}" if body else f"{title} {abstract}"
+
+
+def full_text_ids(db: Session):
+    """IDs of papers with a full-text excerpt."""
+    return {pid for (pid,) in db.query(models.PaperText.paper_id).filter(models.PaperText.body.isnot(None))}
+
+
+def text_query(db: Session):
+    """(id, title, abstract, body) rows for paper_text."""
+    return db.query(models.Paper.id, models.Paper.title, models.Paper.abstract, models.PaperText.body).outerjoin(
+        models.PaperText, models.PaperText.paper_id == models.Paper.id
+    )
+
+
+def _hasher():
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(n_features=N_FEATURES, stop_words="english", alternate_sign=False,
+                             norm=None, dtype=np.float32)
+
+
+def hash_texts(texts):
+    """Term counts of texts as a CSR matrix (also the worker entry point)."""
+    if not texts:
+        return sp.csr_matrix((0, N_FEATURES), dtype=np.float32)
+    return _hasher().transform(texts).tocsr()
+
+
+def hash_batches(batches, workers=None, parallel=True):
+    """
+    Hashes an iterable of text lists, in a process pool when parallel,
+    keeping at most two tasks per worker in flight so the texts are not all
+    held in memory. Returns the stacked counts in input order.
+    """
+    workers = workers or WORKERS
+    if not parallel or workers < 2:
+        blocks = [hash_texts(texts) for texts in batches]
+    else:
+        blocks, pending = [], deque()
+        # spawn: the app has live threads (DB writer, server), which fork does not mix well with
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for texts in batches:
+                pending.append(pool.submit(hash_texts, texts))
+                if len(pending) >= 2 * workers:
+                    blocks.append(pending.popleft().result())
+            blocks.extend(f.result() for f in pending)
+    if not blocks:
+        return sp.csr_matrix((0, N_FEATURES), dtype=np.float32)
+    return sp.vstack(blocks, format="csr")
+
+
+class FeatureStore:
+    """Hashed term counts per paper, persisted as append-only shards."""
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.paper_ids = []
+        self.row_of = {}
+        self.counts = sp.csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self.shards = []
+        self.next_shard = 0
+        # Papers whose stored counts include their full text
+        self.full_text = set()
+
+    @classmethod
+    def load(cls, state_dir=STATE_DIR):
+        store = cls(state_dir)
+        try:
+            with open(os.path.join(state_dir, "shards.json")) as f:
+                index = json.load(f)
+            if index.get("n_features") != N_FEATURES:
+                return store
+            blocks, ids = [], []
+            for name in index["shards"]:
+                blocks.append(sp.load_npz(os.path.join(state_dir, name + ".npz")))
+                with open(os.path.join(state_dir, name + ".json")) as f:
+                    ids.extend(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return cls(state_dir)
+        if blocks:
+            store.counts = sp.vstack(blocks, format="csr")
+        store.paper_ids = ids
+        store.row_of = {pid: i for i, pid in enumerate(ids)}
+        store.shards = list(index["shards"])
+        store.next_shard = index.get("next_shard", len(store.shards))
+        store.full_text = set(index.get("full_text", []))
+        return store
+
+    def _write_shard(self, counts, paper_ids):
+        """Writes a shard file pair and returns its name (not yet in the index)."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        name = f"shard-{self.next_shard:05d}"
+        self.next_shard += 1
+        sp.save_npz(os.path.join(self.state_dir, name + ".npz"), counts)
+        with open(os.path.join(self.state_dir, name + ".json"), "w") as f:
+            json.dump(list(paper_ids), f)
+        return name
+
+    def _write_index(self, shards):
+        # The index is replaced atomically, so readers see old or new shards
+        tmp = os.path.join(self.state_dir, "shards.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"n_features": N_FEATURES, "shards": shards, "next_shard": self.next_shard,
+                       "full_text": sorted(self.full_text)}, f)
+        os.replace(tmp, os.path.join(self.state_dir, "shards.json"))
+        self.shards = list(shards)
+
+    def append(self, paper_ids, counts):
+        """Adds rows and persists them as one new shard."""
+        if not paper_ids:
+            return
+        self._write_index(self.shards + [self._write_shard(counts, paper_ids)])
+        self.counts = sp.vstack([self.counts, counts], format="csr")
+        for pid in paper_ids:
+            self.row_of[pid] = len(self.paper_ids)
+            self.paper_ids.append(pid)
+
+    def compact(self, keep_ids):
+        """Rewrites the store as a single shard holding only keep_ids (their latest rows)."""
+        keep = [i for i, pid in enumerate(self.paper_ids) if pid in keep_ids and self.row_of[pid] == i]
+        self.paper_ids = [self.paper_ids[i] for i in keep]
+        self.row_of = {pid: i for i, pid in enumerate(self.paper_ids)}
+        self.counts = self.counts[keep]
+        self.full_text &= set(self.paper_ids)
+        old = self.shards
+        self._write_index([self._write_shard(self.counts, self.paper_ids)])
+        for name in old:
+            for ext in (".npz", ".json"):
+                try:
+                    os.remove(os.path.join(self.state_dir, name + ext))
+                except OSError:
+                    pass
+
+    def featurize(self, db: Session, paper_ids, workers=None, replace=False):
+        """
+        Tokenizes papers that are not in the store yet (all of paper_ids with
+        replace, e.g. once their full text arrived; the old rows are dropped
+        by the next compaction), in parallel for large batches, and persists
+        them. Returns the number of papers added.
+        """
+        missing = list(paper_ids) if replace else [pid for pid in paper_ids if pid not in self.row_of]
+        if not missing:
+            return 0
+        order, with_text = [], set()
+
+        def batches():
+            for start in range(0, len(missing), TEXT_BATCH):
+                rows = text_query(db).filter(models.Paper.id.in_(missing[start:start + TEXT_BATCH])).all()
+                order.extend(r[0] for r in rows)
+                with_text.update(r[0] for r in rows if r[3])
+                texts = [paper_text(t, a, b) for _, t, a, b in rows]
+                for i in range(0, len(texts), HASH_BATCH):
+                    yield texts[i:i + HASH_BATCH]
+
+        counts = hash_batches(batches(), workers=workers, parallel=len(missing) >= PARALLEL_MIN)
+        self.full_text = (self.full_text - set(order)) | with_text
+        self.append(order, counts)
+        return len(order)
+
+    def sync(self, db: Session, paper_ids, workers=None):
+        """
+        Featurizes new papers, re-featurizes those whose full text arrived
+        since, and compacts away deleted ones when worthwhile.
+        """
+        paper_ids = list(paper_ids)
+        added = self.featurize(db, paper_ids, workers=workers)
+        with_text = full_text_ids(db)
+        stale = [pid for pid in paper_ids if pid in self.row_of and (pid in with_text) != (pid in self.full_text)]
+        if stale:
+            added += self.featurize(db, stale, workers=workers, replace=True)
+        wanted = set(paper_ids)
+        # Rows of deleted papers and rows replaced by a later one
+        stale = len(self.paper_ids) - sum(1 for pid in self.row_of if pid in wanted)
+        if stale and stale > COMPACT_SHARE * len(self.paper_ids):
+            self.compact(wanted)
+        return added
+
+    def rows(self, paper_ids):
+        """Stored counts for paper_ids, in that order (all must be present)."""
+        return self.counts[[self.row_of[pid] for pid in paper_ids]]
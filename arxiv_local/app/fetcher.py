@@ -1,10 +1,22 @@
-import feedparser
 import datetime
+import itertools
+import os
+import time
+import urllib.request
+from xml.etree import ElementTree
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from .database import models
-import dateutil.parser
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .database import models, database
+from . import rankings, catalog, announcements, validation, metrics
 
-ARXIV_API_URL = "http://export.arxiv.org/api/query?"
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query?")
+FEED_TIMEOUT = 120
+
+# Harvester paging. The arXiv API asks clients to wait 3 seconds between calls.
+HARVEST_PAGE_SIZE = 200
+HARVEST_PAGE_DELAY = 3.0
+SEARCH_QUERY = "cat:astro-ph*"
 
 # Categories to fetch
 CATEGORIES = [
@@ -14,153 +26,285 @@ CATEGORIES = [
 
 def get_announcement_date(published_dt: datetime.datetime) -> datetime.date:
     """
-    Calculates the ArXiv announcement date based on the published/submission timestamp.
-    Logic (approximate based on 14:00 EST / 19:00 UTC cutoff):
-    - Submissions < 19:00 UTC are considered 'same day' batch (effectively).
-    - Submissions >= 19:00 UTC are 'next day' batch.
-    
-    Then mapping batch day to announcement:
-    - Mon batch (Fri 19:00 - Mon 19:00) -> Tue
-    - Tue batch (Mon 19:00 - Tue 19:00) -> Wed
-    - Wed batch (Tue 19:00 - Wed 19:00) -> Thu
-    - Thu batch (Wed 19:00 - Thu 19:00) -> Fri
-    - Fri batch (Thu 19:00 - Fri 19:00) -> Mon
-    
-    Simplified Logic for date `d` (where d is date of timestamp if < 19:00, else date+1):
-    - Mon -> Tue (+1)
-    - Tue -> Wed (+1)
-    - Wed -> Thu (+1)
-    - Thu -> Fri (+1)
-    - Fri -> Mon (+3)
-    - Sat -> Tue (+3) (Sat covers Fri post-cutoff)
-    - Sun -> Tue (+2) (Sun covers Fri post-cutoff/Mon pre-cutoff)
+    The arXiv announcement (listing) date of a submission timestamp: the
+    weekday after the next 14:00 US Eastern deadline, skipping holidays.
+    See announcements.py for the calendar.
     """
-    # 1. Apply Cutoff
-    # Check time component. 19:00 UTC = 14:00 EST (Standard).
-    # We use 19:00 as a hard cutoff.
-    cutoff_time = datetime.time(19, 0, 0)
-    
-    base_date = published_dt.date()
-    if published_dt.time() >= cutoff_time:
-        base_date += datetime.timedelta(days=1)
-        
-    # 2. Map to Announcement Day
-    weekday = base_date.weekday() # 0=Mon, 6=Sun
-    
-    if weekday == 0: # Mon -> Tue
-        return base_date + datetime.timedelta(days=1)
-    elif weekday == 1: # Tue -> Wed
-        return base_date + datetime.timedelta(days=1)
-    elif weekday == 2: # Wed -> Thu
-        return base_date + datetime.timedelta(days=1)
-    elif weekday == 3: # Thu -> Fri
-        return base_date + datetime.timedelta(days=1)
-    elif weekday == 4: # Fri -> Mon
-        return base_date + datetime.timedelta(days=3)
-    elif weekday == 5: # Sat -> Tue
-        return base_date + datetime.timedelta(days=3)
-    elif weekday == 6: # Sun -> Tue
-        return base_date + datetime.timedelta(days=2)
-    
-    return base_date # Should not reach
+    return announcements.announcement_date(published_dt)
 
-def fetch_papers(db: Session, max_results=500):
-    # Construct query for all astro-ph categories
-    # cat:astro-ph* covers subcategories usually, but being explicit is safe
-    search_query = "cat:astro-ph*" 
-    
-    # Sort by submittedDate descending to get latest
-    # Increased max_results to cover more history (approx 50-75 papers/day -> 500 covers ~1 week, 1000 ~2 weeks)
-    query_url = f"{ARXIV_API_URL}search_query={search_query}&start=0&max_results={max_results}&sortBy=submittedDate&sortOrder=descending"
-    
-    print(f"Fetching from: {query_url}")
-    feed = feedparser.parse(query_url)
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV = "{http://arxiv.org/schemas/atom}"
+
+# Records are written in batches of this many while the feed is still streaming
+INGEST_BATCH = 500
+# Called as hook(db, paper_ids) after every ingested batch
+POST_INGEST_HOOKS = [validation.ingest_hook]
+
+# Keys of a feed record that are stored as Paper columns
+PAPER_COLUMNS = ("id", "title", "authors", "abstract", "published_date",
+                 "updated_date", "arxiv_category", "link", "submitted_at")
+
+def _parse_timestamp(value):
+    # Atom timestamps look like 2026-01-16T18:59:59Z (UTC)
+    dt = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        # Assume UTC if not specified, though feed usually has it
+        return dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+def _balance_math(text, closer):
+    # Ensure balanced $ to prevent MathJax bleeding
+    text = text.strip().replace('\n', ' ')
+    if text.count('$') % 2 != 0:
+        text += closer
+    return text
+
+def _entry_record(elem):
+    # <id> is like http://arxiv.org/abs/2101.00001v1; we want 2101.00001 and 1
+    abs_id = elem.findtext(f"{ATOM}id", "").split('/abs/')[-1]
+    paper_id, _, version = abs_id.rpartition('v')
+
+    submitted = _parse_timestamp(elem.findtext(f"{ATOM}published"))
+    updated = _parse_timestamp(elem.findtext(f"{ATOM}updated"))
+
+    link = None
+    for link_elem in elem.iterfind(f"{ATOM}link"):
+        if link_elem.get("rel") == "alternate":
+            link = link_elem.get("href")
+            break
+
+    # All listed categories, primary first
+    categories = [c.get("term") for c in elem.iterfind(f"{ATOM}category")]
+    primary = elem.find(f"{ARXIV}primary_category")
+    primary_cat = primary.get("term") if primary is not None else (categories[0] if categories else None)
+
+    author_names = [n for n in (a.findtext(f"{ATOM}name", "").strip() for a in elem.iterfind(f"{ATOM}author")) if n]
+
+    return {
+        "id": paper_id,
+        "version": int(version) if version.isdigit() else 1,
+        "submitted": submitted,
+        "submitted_at": submitted.replace(tzinfo=None),
+        "title": _balance_math(elem.findtext(f"{ATOM}title", ""), "$"),
+        "authors": ", ".join(author_names),
+        "author_names": author_names,
+        "abstract": _balance_math(elem.findtext(f"{ATOM}summary", ""), " $"),
+        "published_date": get_announcement_date(submitted),
+        "updated_date": updated.date(),
+        "arxiv_category": primary_cat,
+        "categories": categories,
+        "link": link,
+    }
+
+def iter_feed_records(source):
+    """
+    Streams an arXiv Atom feed from a file-like object (e.g. an HTTP
+    response) and yields one normalized record per <entry>, including
+    revisions; check record["version"]. Each entry element is discarded
+    once read, so memory stays flat however long the feed is.
+    """
+    root = None
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        if root is None:
+            root = elem
+        elif event == "end" and elem.tag == f"{ATOM}entry":
+            yield _entry_record(elem)
+            # Drop the finished entry (and anything before it) from the tree
+            root.clear()
+
+def open_feed(url):
+    return urllib.request.urlopen(url, timeout=FEED_TIMEOUT)
+
+def ingest_records(db: Session, records):
+    """
+    Writes normalized paper records in one batch. Existing IDs and dates for
+    the batch's ID range are preloaded with a single query; new papers,
+    announcement-date corrections and missing submission times then go
+    through one INSERT ... ON CONFLICT DO UPDATE executemany. Returns
+    (new_count, updated_count).
+    """
+    # Revisions (v2+) are updates of already announced papers; skip them.
+    # The feed can repeat an ID; keep the first occurrence
+    by_id = {}
+    for r in records:
+        if r.get("version", 1) == 1 and r["id"] not in by_id:
+            by_id[r["id"]] = r
+    if not by_id:
+        return 0, 0
+
+    existing = {pid: (date, submitted_at) for pid, date, submitted_at in db.query(
+        models.Paper.id, models.Paper.published_date, models.Paper.submitted_at
+    ).filter(
+        models.Paper.id.between(min(by_id), max(by_id))
+    )}
 
+    rows = []
+    new_records = []
+    touched_dates = set()
     new_count = 0
     updated_count = 0
-    
-    for entry in feed.entries:
-        # Check for version to filter updates if desired
-        # entry.id is like http://arxiv.org/abs/2101.00001v1
-        if not entry.id.endswith('v1'):
+    for paper_id, record in by_id.items():
+        if paper_id not in existing:
+            new_count += 1
+            new_records.append(record)
+        elif existing[paper_id][0] != record["published_date"]:
+            # Fixing DB: only the announcement date (and submission time) is corrected
+            updated_count += 1
+            touched_dates.add(existing[paper_id][0])
+        elif existing[paper_id][1] is None and record.get("submitted_at"):
+            # Stored before submission times were kept: fill it in, the date stays
+            rows.append({k: record.get(k) for k in PAPER_COLUMNS})
             continue
-
-        # Arxiv ID is usually like http://arxiv.org/abs/2101.00001v1
-        # We want just 2101.00001
-        paper_id = entry.id.split('/abs/')[-1].split('v')[0]
-        
-        # Parse timestamp (UTC)
-        pub_dt = dateutil.parser.parse(entry.published)
-        if pub_dt.tzinfo is None:
-            # Assume UTC if not specified, though feed usually has it
-            pub_dt = pub_dt.replace(tzinfo=datetime.timezone.utc)
         else:
-            pub_dt = pub_dt.astimezone(datetime.timezone.utc)
-            
-        announcement_date = get_announcement_date(pub_dt)
-        
-        upd_date = dateutil.parser.parse(entry.updated).date()
-        
-        # Authors
-        authors = ", ".join([a.name for a in entry.authors])
-        
-        # Category
-        # entry.tags is a list of dicts [{'term': 'astro-ph.CO', ...}, ...]
-        primary_cat = entry.arxiv_primary_category['term'] if 'arxiv_primary_category' in entry else entry.tags[0]['term']
-
-        # Ensure balanced $ to prevent MathJax bleeding
-        title = entry.title.replace('\n', ' ')
-        if title.count('$') % 2 != 0:
-            title += "$"
-            
-        abstract = entry.summary.replace('\n', ' ')
-        if abstract.count('$') % 2 != 0:
-            abstract += " $"
-
-        # Check if exists
-        existing_paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
-        if existing_paper:
-            # Check if we need to update the date (Fixing DB)
-            if existing_paper.published_date != announcement_date:
-                existing_paper.published_date = announcement_date
-                updated_count += 1
             continue
+        rows.append({k: record.get(k) for k in PAPER_COLUMNS})
+        touched_dates.add(record["published_date"])
 
-        new_paper = models.Paper(
-            id=paper_id,
-            title=title,
-            authors=authors,
-            abstract=abstract,
-            published_date=announcement_date,
-            updated_date=upd_date,
-            arxiv_category=primary_cat,
-            link=entry.link
+    if rows:
+        stmt = sqlite_insert(models.Paper.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.Paper.id],
+            set_={
+                "published_date": stmt.excluded.published_date,
+                "submitted_at": func.coalesce(stmt.excluded.submitted_at, models.Paper.__table__.c.submitted_at),
+            },
         )
-        
-        db.add(new_paper)
-        new_count += 1
-    
+        db.execute(stmt, rows)
+    catalog.link_papers(db, new_records)
     db.commit()
-    print(f"Fetched {len(feed.entries)} entries. Added {new_count} new papers. Updated dates for {updated_count} papers.")
-    return new_count
+    if touched_dates:
+        rankings.rebuild_days(db, touched_dates)
+    return new_count, updated_count
+
+def build_query_url(start, max_results, api_url=None):
+    # Construct query for all astro-ph categories
+    # cat:astro-ph* covers subcategories usually, but being explicit is safe
+    # Sort by submittedDate descending to get latest
+    return (f"{api_url or ARXIV_API_URL}search_query={SEARCH_QUERY}&start={start}"
+            f"&max_results={max_results}&sortBy=submittedDate&sortOrder=descending")
+
+def fetch_papers(db: Session, max_results=500):
+    # Increased max_results to cover more history (approx 50-75 papers/day -> 500 covers ~1 week, 1000 ~2 weeks)
+    query_url = build_query_url(0, max_results)
+    
+    print(f"Fetching from: {query_url}")
+    stats = {"entries": 0, "new": 0, "updated": 0}
+    with metrics.span("fetch"), open_feed(query_url) as response:
+        _ingest_stream(db, iter_feed_records(response), stats)
 
-def cleanup_old_papers(db: Session, days_to_keep: int = 90):
+    print(f"Fetched {stats['entries']} entries. Added {stats['new']} new papers. Updated dates for {stats['updated']} papers.")
+    print(f"Timings: parse {stats['parse']:.2f}s, write {stats['write']:.2f}s")
+    return stats["new"]
+
+def _ingest_stream(db: Session, records, stats, progress=None):
     """
-    Removes papers older than days_to_keep, unless they are liked.
+    Consumes a record stream in INGEST_BATCH-sized batches, accumulating
+    counts, the oldest submission time seen and per-phase timings (parse
+    covers download and normalization, which are interleaved; write includes
+    the POST_INGEST_HOOKS) into stats. progress(stats) is called after every
+    batch.
     """
-    cutoff_date = datetime.date.today() - datetime.timedelta(days=days_to_keep)
-    print(f"Running cleanup: Pruning unliked papers older than {cutoff_date}...")
-    
-    # 1. Identify liked papers (never delete these)
-    liked_ids_query = db.query(models.Interaction.paper_id).filter(models.Interaction.is_liked == True)
-    
-    # 2. Delete papers that are OLD and NOT in the liked list
-    # Note: .delete() with synchronization logic
-    deleted_count = db.query(models.Paper).filter(
-        models.Paper.published_date < cutoff_date,
-        models.Paper.id.notin_(liked_ids_query)
-    ).delete(synchronize_session=False)
-    
+    stats.setdefault("parse", 0.0)
+    stats.setdefault("write", 0.0)
+    records = iter(records)
+    while True:
+        t0 = time.perf_counter()
+        batch = list(itertools.islice(records, INGEST_BATCH))
+        t1 = time.perf_counter()
+        if not batch:
+            break
+        # Each batch is one short transaction on the serialized writer
+        new_count, updated_count = database.writer.run(ingest_records, batch)
+        paper_ids = [r["id"] for r in batch if r.get("version", 1) == 1]
+        for hook in POST_INGEST_HOOKS:
+            hook(db, paper_ids)
+        t2 = time.perf_counter()
+
+        stats["entries"] = stats.get("entries", 0) + len(batch)
+        stats["new"] = stats.get("new", 0) + new_count
+        stats["updated"] = stats.get("updated", 0) + updated_count
+        stats["oldest"] = batch[-1]["submitted"]
+        stats["parse"] += t1 - t0
+        stats["write"] += t2 - t1
+        metrics.observe("parse", t1 - t0)
+        metrics.observe("ingest", t2 - t1)
+        if progress:
+            progress(stats)
+    return stats
+
+def harvest_papers(db: Session, max_results=2000, page_size=HARVEST_PAGE_SIZE,
+                   incremental=True, delay=None, api_url=None, progress=None):
+    """
+    Pages through the API newest-first in chunks of page_size. In incremental
+    mode the run stops at the first page that reaches papers submitted before
+    the newest updated_date already stored, so a daily run only downloads
+    the day's new papers. Progress is checkpointed in FetchLog after every
+    page; an interrupted run is resumed from its last page on the next call.
+    progress(entries=..., written=...) is called with running totals after
+    every ingested batch. Returns the number of new papers.
+    """
+    log = db.query(models.FetchLog).filter(
+        models.FetchLog.category == SEARCH_QUERY,
+        models.FetchLog.status == "running"
+    ).order_by(models.FetchLog.id.desc()).first()
+
+    if log:
+        print(f"Resuming harvest #{log.id} from entry {log.next_start}")
+        log_id, stop_before = log.id, log.stop_before
+        next_start, entries_seen, new_papers = log.next_start, log.entries_seen, log.new_papers
+    else:
+        stop_before = None
+        if incremental:
+            stop_before = db.query(func.max(models.Paper.updated_date)).scalar()
+        log_id = database.writer.run(_start_log, stop_before)
+        next_start = entries_seen = new_papers = 0
+
+    if delay is None:
+        delay = HARVEST_PAGE_DELAY
+    updated_count = 0
+    while next_start < max_results:
+        if next_start > 0 and delay:
+            time.sleep(delay)
+
+        chunk = min(page_size, max_results - next_start)
+        query_url = build_query_url(next_start, chunk, api_url)
+        print(f"Fetching from: {query_url}")
+        def page_progress(stats):
+            if progress:
+                progress(entries=entries_seen + stats["entries"],
+                         written=new_papers + updated_count + stats["new"] + stats["updated"])
+
+        with metrics.span("fetch"), open_feed(query_url) as response:
+            page = _ingest_stream(db, iter_feed_records(response), {"entries": 0, "new": 0, "updated": 0},
+                                  progress=page_progress)
+        if not page["entries"]:
+            break
+        updated_count += page["updated"]
+
+        # Checkpoint: the page is committed, the next run starts after it
+        next_start += page["entries"]
+        entries_seen += page["entries"]
+        new_papers += page["new"]
+        database.writer.run(_update_log, log_id, next_start=next_start,
+                            entries_seen=entries_seen, new_papers=new_papers)
+
+        if stop_before and page["oldest"].date() < stop_before:
+            break
+        if page["entries"] < chunk:
+            break
+
+    database.writer.run(_update_log, log_id, status="complete", finished_at=datetime.datetime.now())
+    print(f"Harvest #{log_id}: {entries_seen} entries in total, added {new_papers} new papers, "
+          f"updated dates for {updated_count} papers.")
+    return new_papers
+
+def _start_log(db: Session, stop_before):
+    log = models.FetchLog(category=SEARCH_QUERY, status="running", next_start=0,
+                          stop_before=stop_before, entries_seen=0, new_papers=0)
+    db.add(log)
+    db.commit()
+    return log.id
+
+def _update_log(db: Session, log_id, **values):
+    db.query(models.FetchLog).filter(models.FetchLog.id == log_id).update(values)
     db.commit()
-    print(f"Cleanup complete. Deleted {deleted_count} old papers.")
-    return deleted_count
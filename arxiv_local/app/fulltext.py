@@ -0,0 +1,498 @@
+"""
+Optional full-text ingestion (ARXIV_LOCAL_FULLTEXT=1).
+
+Title and abstract are short and noisy, so after each fetch has been
+scored, a "fulltext" job downloads the LaTeX source (or PDF) of up to
+PER_RUN papers without full text and stores the start of the body in the
+paper_texts table; the recommender's features append it to the title and
+abstract, and the job rescores.
+
+    - Downloads run on one httpx AsyncClient, at most CONCURRENCY at a
+      time and at most one request per HOST_INTERVAL seconds per host (a
+      503/429 Retry-After pushes the host back further).
+    - Files are cached under CACHE_DIR by content (blobs/ab/<sha256>); the
+      paper_texts row maps the paper ID and version to the digest, so each
+      version is downloaded once.
+    - Text is extracted in a process pool: LaTeX sources (tarballs or
+      single gzipped files) with the standard library, PDFs with the
+      optional pypdf package. The body is truncated to BODY_CHARS.
+    - Work is recorded after every BATCH papers. A failed download is
+      skipped until its next_attempt_at (RETRY_DELAY, doubling per
+      attempt) and for good after MAX_ATTEMPTS; an interrupted run resumes
+      with what it had not finished, extracting files it had downloaded.
+
+    python -m arxiv_local.app.fulltext fetch [--limit N] [--retry-failed]
+    python -m arxiv_local.app.fulltext status
+    python -m arxiv_local.app.fulltext gc
+
+arxiv_local/fake_files_server.py stands in for arXiv when FILES_URL points
+at it.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import tarfile
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import features, metrics, migrations
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+ENABLED = os.getenv("ARXIV_LOCAL_FULLTEXT", "0") == "1"
+FILES_URL = os.getenv("ARXIV_FILES_URL", "https://arxiv.org")
+# "e-print" (LaTeX source; arXiv serves the PDF for PDF-only submissions) or "pdf"
+SOURCE = os.getenv("ARXIV_LOCAL_FULLTEXT_SOURCE", "e-print")
+CACHE_DIR = os.getenv("ARXIV_LOCAL_FULLTEXT_DIR", "./fulltext_cache")
+CONCURRENCY = int(os.getenv("ARXIV_LOCAL_FULLTEXT_CONCURRENCY", "4"))
+# arXiv asks crawlers for no more than one request every few seconds
+HOST_INTERVAL = float(os.getenv("ARXIV_LOCAL_FULLTEXT_INTERVAL", "3"))
+BODY_CHARS = int(os.getenv("ARXIV_LOCAL_FULLTEXT_CHARS", "6000"))
+# Most papers one "fulltext" job (started after each fetch) works on. They
+# are taken newest first, so the day's papers come first and a backlog,
+# e.g. when this is first enabled, drains over the following runs
+PER_RUN = int(os.getenv("ARXIV_LOCAL_FULLTEXT_PER_RUN", "300"))
+EXTRACT_WORKERS = features.WORKERS
+# Fewest papers worth starting the extraction pool for (smaller runs
+# extract on a thread)
+PARALLEL_MIN = 200
+
+BATCH = 100
+DOWNLOAD_TIMEOUT = 60
+MAX_BYTES = 50 * 2 ** 20
+# Uncompressed LaTeX read from one source, however big the tarball
+MAX_TEX_BYTES = 4 * 2 ** 20
+RETRY_DELAY = datetime.timedelta(hours=6)
+MAX_ATTEMPTS = 4
+USER_AGENT = "arxiv-local/1.0 (personal recommender; full-text fetch)"
+
+
+class DownloadError(Exception):
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+# --- Content-addressed cache ---
+
+class FileCache:
+    """Files stored by SHA-256: <root>/blobs/ab/abcdef..."""
+
+    def __init__(self, root=None):
+        self.root = root or CACHE_DIR
+
+    def path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def has(self, digest):
+        return bool(digest) and os.path.exists(self.path(digest))
+
+    def open_temp(self):
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        path = os.path.join(self.root, "tmp", f"{os.getpid()}-{time.monotonic_ns()}")
+        return path, open(path, "wb")
+
+    def commit(self, temp_path, digest):
+        """Moves a finished download into place (identical content is stored once)."""
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path
+
+    def digests(self):
+        for dirpath, _, names in os.walk(os.path.join(self.root, "blobs")):
+            yield from names
+
+    def remove(self, digest):
+        try:
+            os.remove(self.path(digest))
+            return True
+        except OSError:
+            return False
+
+
+# --- Downloading ---
+
+class HostRateLimiter:
+    """Spaces requests to each host at least `interval` seconds apart."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            if start > now:
+                await asyncio.sleep(start - now)
+            self._next[host] = start + self.interval
+
+    def back_off(self, host, seconds):
+        self._next[host] = max(self._next.get(host, 0.0), time.monotonic() + seconds)
+
+
+def file_url(paper_id, version, source=None, base_url=None):
+    return f"{(base_url or FILES_URL).rstrip('/')}/{source or SOURCE}/{paper_id}v{version}"
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return HOST_INTERVAL
+
+
+async def _download(client, limiter, semaphore, cache, url):
+    """Streams url into the cache. Returns the digest; raises DownloadError."""
+    host = urllib.parse.urlsplit(url).netloc
+    async with semaphore:
+        await limiter.wait(host)
+        temp_path, f = cache.open_temp()
+        try:
+            with f:
+                async with client.stream("GET", url) as response:
+                    if response.status_code in (429, 503):
+                        limiter.back_off(host, _retry_after(response))
+                        raise DownloadError(f"HTTP {response.status_code}")
+                    if response.status_code != 200:
+                        # 404 and friends: retried later, as a withdrawn or
+                        # not yet processed paper may come back
+                        raise DownloadError(f"HTTP {response.status_code}")
+                    if int(response.headers.get("content-length") or 0) > MAX_BYTES:
+                        raise DownloadError("file too large", permanent=True)
+                    digest, size = hashlib.sha256(), 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > MAX_BYTES:
+                            raise DownloadError("file too large", permanent=True)
+                        digest.update(chunk)
+                        f.write(chunk)
+            digest = digest.hexdigest()
+            cache.commit(temp_path, digest)
+            return digest
+        except Exception as e:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            if isinstance(e, DownloadError):
+                raise
+            raise DownloadError(f"{type(e).__name__}: {e}") from e
+
+
+# --- Text extraction (runs in worker processes) ---
+
+_DROP_ENVIRONMENTS = re.compile(
+    r"\\begin\{(figure|table|equation|align|eqnarray|gather|multline|displaymath|tabular|deluxetable)(\*?)\}"
+    r".*?\\end\{\1\2\}", re.S
+)
+_DROP_COMMANDS = re.compile(
+    r"\\(?:cite[a-z]*|ref|eqref|autoref|label|url|includegraphics|bibliographystyle|bibliography)\*?"
+    r"(?:\[[^\]]*\])*\{[^}]*\}"
+)
+_INPUTS = re.compile(r"\\(?:input|include)\{([^}]+)\}")
+
+
+def _decode(data):
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def _sources(data):
+    """{name: LaTeX text} of an e-print: a (gzipped) tarball or a single gzipped file."""
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as tar:
+            found, total = {}, 0
+            for member in tar:
+                if member.isfile() and member.name.endswith(".tex") and total + member.size <= MAX_TEX_BYTES:
+                    found[member.name] = _decode(tar.extractfile(member).read())
+                    total += member.size
+            return found
+    except tarfile.TarError:
+        pass
+    if data[:2] == b"\x1f\x8b":
+        data = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(data, MAX_TEX_BYTES)
+    return {"main.tex": _decode(data)}
+
+
+def _main_source(sources):
+    """The main file (the largest with \\documentclass), with \\input files inlined."""
+    if not sources:
+        return ""
+    mains = [name for name, text in sources.items() if "\\documentclass" in text] or list(sources)
+    main = max(mains, key=lambda name: len(sources[name]))
+    by_stem = {os.path.splitext(name)[0]: text for name, text in sources.items()}
+
+    def inline(match):
+        name = match.group(1).strip()
+        return by_stem.get(os.path.splitext(name)[0], "")
+    text = sources[main]
+    for _ in range(3):
+        text = _INPUTS.sub(inline, text)
+    return text
+
+
+def latex_to_text(source):
+    """Plain body text of a LaTeX document: no preamble, abstract, math, floats or bibliography."""
+    text = re.sub(r"(?<!\\)%.*", "", source)
+    start = text.find("\\begin{document}")
+    if start >= 0:
+        text = text[start + len("\\begin{document}"):]
+    for marker in ("\\end{abstract}", "\\maketitle"):
+        start = text.find(marker)
+        if start >= 0:
+            text = text[start + len(marker):]
+    for marker in ("\\begin{thebibliography}", "\\bibliography{", "\\end{document}"):
+        end = text.find(marker)
+        if end >= 0:
+            text = text[:end]
+    text = _DROP_ENVIRONMENTS.sub(" ", text)
+    text = re.sub(r"\$\$.*?\$\$|\\\[.*?\\\]|\\\(.*?\\\)|(?<!\\)\$.*?(?<!\\)\$", " ", text, flags=re.S)
+    text = _DROP_COMMANDS.sub("", text)
+    text = re.sub(r"\\[a-zA-Z]+\*?(?:\[[^\]]*\])?", " ", text)
+    text = re.sub(r"[{}~\\]", " ", text)
+    return " ".join(text.split())
+
+
+def _pdf_text(data):
+    if pypdf is None:
+        raise RuntimeError("PDF text needs the pypdf package")
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    parts, size = [], 0
+    for page in reader.pages:
+        page_text = page.extract_text() or ""
+        parts.append(page_text)
+        size += len(page_text)
+        if size >= BODY_CHARS * 2:
+            break
+    return " ".join(" ".join(parts).split())
+
+
+def extract_file(path, max_chars=None):
+    """
+    Returns (kind, body text truncated to max_chars (default BODY_CHARS),
+    error) for a cached file; the worker entry point.
+    """
+    max_chars = max_chars or BODY_CHARS
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:5] == b"%PDF-":
+            return "pdf", _pdf_text(data)[:max_chars], None
+        return "source", latex_to_text(_main_source(_sources(data)))[:max_chars], None
+    except Exception as e:
+        return None, "", f"{type(e).__name__}: {e}"
+
+
+# --- Bookkeeping ---
+
+def _version(link):
+    match = re.search(r"v(\d+)$", link or "")
+    return int(match.group(1)) if match else 1
+
+
+def pending(db: Session, now=None, retry_failed=False, limit=None):
+    """
+    Papers to work on, newest first: [(paper_id, version, digest of an
+    already downloaded file or None), ...]. Failures are skipped until due
+    (or all retried with retry_failed).
+    """
+    now = now or datetime.datetime.now()
+    failed = models.PaperText.status == "failed"
+    if not retry_failed:
+        failed = and_(failed, models.PaperText.attempts < MAX_ATTEMPTS,
+                      or_(models.PaperText.next_attempt_at.is_(None), models.PaperText.next_attempt_at <= now))
+    query = db.query(models.Paper.id, models.Paper.link, models.PaperText.status, models.PaperText.digest).outerjoin(
+        models.PaperText, models.PaperText.paper_id == models.Paper.id
+    ).filter(or_(
+        models.PaperText.paper_id.is_(None), models.PaperText.status == "downloaded", failed
+    )).order_by(models.Paper.published_date.desc(), models.Paper.id.desc())
+    if limit:
+        query = query.limit(limit)
+    return [(pid, _version(link), digest if status == "downloaded" else None)
+            for pid, link, status, digest in query]
+
+
+def _upsert(db: Session, values_by_id):
+    rows = {r.paper_id: r for r in db.query(models.PaperText).filter(
+        models.PaperText.paper_id.in_(list(values_by_id))
+    )}
+    for paper_id, values in values_by_id.items():
+        row = rows.get(paper_id)
+        if row is None:
+            row = models.PaperText(paper_id=paper_id, attempts=0)
+            db.add(row)
+        for key, value in values.items():
+            setattr(row, key, value)
+
+
+def _record_downloads(db: Session, versions, downloaded, failed):
+    """Records downloaded {paper_id: digest} and failed {paper_id: DownloadError}."""
+    now = datetime.datetime.now()
+    _upsert(db, {pid: {"version": versions[pid], "status": "downloaded", "digest": digest,
+                       "fetched_at": now, "last_error": None, "next_attempt_at": None}
+                 for pid, digest in downloaded.items()})
+    attempts = dict(db.query(models.PaperText.paper_id, models.PaperText.attempts).filter(
+        models.PaperText.paper_id.in_(list(failed))
+    )) if failed else {}
+    _upsert(db, {pid: {
+        "version": versions[pid], "status": "failed", "last_error": str(error),
+        "attempts": MAX_ATTEMPTS if error.permanent else (attempts.get(pid) or 0) + 1,
+        "next_attempt_at": now + RETRY_DELAY * 2 ** (attempts.get(pid) or 0),
+    } for pid, error in failed.items()})
+    db.commit()
+
+
+def _record_texts(db: Session, results):
+    """Records {paper_id: (kind, body, error)} of extracted files."""
+    _upsert(db, {pid: {"kind": kind, "body": body or None, "status": "ok" if body else "empty",
+                       "last_error": error}
+                 for pid, (kind, body, error) in results.items()})
+    db.commit()
+
+
+# --- Pipeline ---
+
+async def _run(items, cache, progress):
+    import httpx
+
+    limiter = HostRateLimiter(HOST_INTERVAL)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    versions = {pid: version for pid, version, _ in items}
+    stats = {"downloaded": 0, "failed": 0, "extracted": 0, "empty": 0}
+    pool = None
+    if EXTRACT_WORKERS > 1 and len(items) >= PARALLEL_MIN:
+        # spawn: the app has live threads (DB writer, server), which fork does not mix well with
+        pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    try:
+        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT, limits=limits, follow_redirects=True,
+                                     headers={"User-Agent": USER_AGENT}) as client:
+            for start in range(0, len(items), BATCH):
+                batch = items[start:start + BATCH]
+                t0 = time.perf_counter()
+                digests = {pid: digest for pid, _, digest in batch if cache.has(digest)}
+                todo = [(pid, version) for pid, version, _ in batch if pid not in digests]
+                results = await asyncio.gather(*(
+                    _download(client, limiter, semaphore, cache, file_url(pid, version)) for pid, version in todo
+                ), return_exceptions=True)
+                downloaded, failed = {}, {}
+                for (pid, _), result in zip(todo, results):
+                    if isinstance(result, DownloadError):
+                        failed[pid] = result
+                    elif isinstance(result, BaseException):
+                        raise result
+                    else:
+                        downloaded[pid] = result
+                await asyncio.to_thread(database.writer.run, _record_downloads, versions, downloaded, failed)
+                t1 = time.perf_counter()
+
+                digests.update(downloaded)
+                texts = await asyncio.gather(*(
+                    loop.run_in_executor(pool, extract_file, cache.path(digest), BODY_CHARS)
+                    for digest in digests.values()
+                ))
+                results = dict(zip(digests, texts))
+                await asyncio.to_thread(database.writer.run, _record_texts, results)
+                metrics.observe("fulltext_download", t1 - t0)
+                metrics.observe("fulltext_extract", time.perf_counter() - t1)
+
+                stats["downloaded"] += len(downloaded)
+                stats["failed"] += len(failed)
+                stats["extracted"] += sum(1 for _, body, _ in texts if body)
+                stats["empty"] += sum(1 for _, body, _ in texts if not body)
+                if progress:
+                    progress(**stats)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return stats
+
+
+def fetch_missing(db: Session, limit=None, retry_failed=False, progress=None):
+    """
+    Downloads and extracts the full text of papers that do not have it yet
+    (see module docstring). Returns {"downloaded", "failed", "extracted",
+    "empty"} counts.
+    """
+    items = pending(db, retry_failed=retry_failed, limit=limit)
+    db.rollback()
+    if not items:
+        return {"downloaded": 0, "failed": 0, "extracted": 0, "empty": 0}
+    print(f"Fetching full text of {len(items)} papers...")
+    stats = asyncio.run(_run(items, FileCache(), progress))
+    print(f"Full text: {stats['extracted']} extracted, {stats['empty']} without text, "
+          f"{stats['failed']} failed (retried later).")
+    return stats
+
+
+def _referenced(db: Session):
+    return {d for (d,) in db.query(models.PaperText.digest).filter(models.PaperText.digest.isnot(None))}
+
+
+def _drop_orphans(db: Session):
+    deleted = db.query(models.PaperText).filter(
+        models.PaperText.paper_id.notin_(db.query(models.Paper.id))
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def collect_garbage(db: Session, cache=None):
+    """Drops rows of deleted papers and cached files no row refers to. Returns the files removed."""
+    cache = cache or FileCache()
+    database.writer.run(_drop_orphans)
+    referenced = _referenced(db)
+    db.rollback()
+    return sum(cache.remove(digest) for digest in list(cache.digests()) if digest not in referenced)
+
+
+def status_counts(db: Session):
+    return dict(db.query(models.PaperText.status, func.count()).group_by(models.PaperText.status).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("fetch", help="Download and extract missing full text")
+    fetch.add_argument("--limit", type=int, default=None)
+    fetch.add_argument("--retry-failed", action="store_true", help="Also retry failures that are not due")
+    commands.add_parser("status", help="Count papers by full-text status")
+    commands.add_parser("gc", help="Delete cached files no paper refers to")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    with database.SessionLocal() as db:
+        if args.command == "fetch":
+            fetch_missing(db, limit=args.limit, retry_failed=args.retry_failed)
+        elif args.command == "status":
+            counts = status_counts(db)
+            counts["missing"] = db.query(func.count(models.Paper.id)).scalar() - sum(counts.values())
+            for status, n in sorted(counts.items()):
+                print(f"{status:<11} {n:8d}")
+        else:
+            print(f"Removed {collect_garbage(db)} cached files.")
+
+
+if __name__ == "__main__":
+    main()
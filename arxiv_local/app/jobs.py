@@ -0,0 +1,227 @@
+"""
+Background jobs (fetch, training, full text, Zotero sync) with persisted status.
+
+Every run is a row in the jobs table. Jobs are single-flight per kind:
+submitting a kind that is already queued or running returns the existing
+job instead of starting a second one, so a double-clicked "Fetch" cannot
+start two harvests fighting over the DB. A job function is called as
+func(job, **params) on its own thread and reports progress through
+job.update(stage=..., **counters); the live progress is served from memory
+by /jobs and written to the row at most every PROGRESS_INTERVAL seconds
+(and on every stage change).
+
+Rows still "running" when the server stopped are marked "interrupted" at
+startup; an interrupted fetch resumes from its FetchLog checkpoint when it
+is run again.
+
+With ARXIV_LOCAL_SCHEDULE=daily, DailySchedule submits a job shortly after
+each arXiv mailing (20:00 US Eastern before every listing date of the
+announcement calendar).
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import traceback
+
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import announcements, metrics
+
+PROGRESS_INTERVAL = 1.0
+ACTIVE_STATUSES = ("queued", "running")
+
+SCHEDULE = os.getenv("ARXIV_LOCAL_SCHEDULE", "")
+# The scheduled run waits this long after the mailing
+SCHEDULE_DELAY = datetime.timedelta(minutes=int(os.getenv("ARXIV_LOCAL_SCHEDULE_DELAY_MIN", "30")))
+# Longest single sleep, so the schedule recovers from clock jumps (suspend)
+SCHEDULE_MAX_SLEEP = 3600
+
+
+def _now():
+    return datetime.datetime.now()
+
+
+def _create_job(db: Session, kind, trigger, params):
+    job = models.Job(kind=kind, status="queued", trigger=trigger, params=json.dumps(params))
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def _update_job(db: Session, job_id, **values):
+    db.query(models.Job).filter(models.Job.id == job_id).update(values)
+    db.commit()
+
+
+def _mark_interrupted(db: Session):
+    count = db.query(models.Job).filter(models.Job.status.in_(ACTIVE_STATUSES)).update(
+        {"status": "interrupted", "finished_at": _now()}, synchronize_session=False
+    )
+    db.commit()
+    return count
+
+
+class Job:
+    """Handle passed to a running job function; tracks its live progress."""
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.stage = None
+        self.progress = {}
+        self._flushed = 0.0
+
+    def update(self, stage=None, **counters):
+        """Sets the stage and/or progress counters (persisted with throttling)."""
+        changed_stage = stage is not None and stage != self.stage
+        if stage is not None:
+            self.stage = stage
+        self.progress.update(counters)
+        now = time.monotonic()
+        if changed_stage or now - self._flushed >= PROGRESS_INTERVAL:
+            self._flushed = now
+            database.writer.run(_update_job, self.id, stage=self.stage, progress=json.dumps(self.progress))
+
+
+class JobRunner:
+    """Starts jobs on their own threads, at most one per kind at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+
+    def submit(self, kind, func, trigger="user", **params):
+        """
+        Runs func(job, **params) in the background unless a job of this
+        kind is already active. Returns (job_id, started).
+        """
+        with self._lock:
+            active = self._active.get(kind)
+            if active is not None:
+                return active.id, False
+            job = Job(database.writer.run(_create_job, kind, trigger, params), kind, params)
+            self._active[kind] = job
+        threading.Thread(target=self._run, args=(job, func), name=f"job-{kind}", daemon=True).start()
+        return job.id, True
+
+    def _run(self, job, func):
+        start = time.perf_counter()
+        try:
+            job.status = "running"
+            database.writer.run(_update_job, job.id, status="running", started_at=_now())
+            try:
+                result = func(job, **job.params)
+            except Exception as e:
+                traceback.print_exc()
+                job.status = "failed"
+                values = {"error": f"{type(e).__name__}: {e}"}
+            else:
+                job.status = "succeeded"
+                values = {"result": json.dumps(result, default=str)}
+            database.writer.run(_update_job, job.id, status=job.status, stage=job.stage,
+                                progress=json.dumps(job.progress), finished_at=_now(), **values)
+        finally:
+            metrics.job_seconds.observe(time.perf_counter() - start, job.kind, job.status)
+            # Only now can another job of this kind start
+            with self._lock:
+                self._active.pop(job.kind, None)
+
+    def active(self):
+        """Live handles of the jobs currently queued or running, by id."""
+        with self._lock:
+            return {job.id: job for job in self._active.values()}
+
+
+runner = JobRunner()
+
+
+def mark_interrupted(db: Session):
+    """Marks jobs left active by a previous server process as interrupted."""
+    count = _mark_interrupted(db)
+    if count:
+        print(f"Marked {count} unfinished job(s) from a previous run as interrupted.")
+    return count
+
+
+def _job_json(job: models.Job, live=None):
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "trigger": job.trigger,
+        "params": json.loads(job.params) if job.params else {},
+        "stage": job.stage,
+        "progress": json.loads(job.progress) if job.progress else {},
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if live is not None:
+        # The row lags behind the throttled progress writes
+        data.update(status=live.status, stage=live.stage, progress=dict(live.progress))
+    return data
+
+
+def list_jobs(db: Session, kind=None, limit=20):
+    """Most recent jobs first, with live progress for the active ones."""
+    query = db.query(models.Job)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    live = runner.active()
+    return [_job_json(job, live.get(job.id)) for job in query.order_by(models.Job.id.desc()).limit(limit)]
+
+
+def get_job(db: Session, job_id):
+    job = db.get(models.Job, job_id)
+    if job is None:
+        return None
+    return _job_json(job, runner.active().get(job_id))
+
+
+# --- Daily schedule ---
+
+def next_run(now: datetime.datetime):
+    """The first scheduled time after now (both timezone-aware, UTC)."""
+    _, mailing = announcements.calendar(now.year + 1).next_mailing(now - SCHEDULE_DELAY)
+    return mailing + SCHEDULE_DELAY
+
+
+class DailySchedule:
+    """Submits a job to the runner after every announcement."""
+
+    def __init__(self, kind, func, runner=runner, **params):
+        self.kind = kind
+        self.func = func
+        self.runner = runner
+        self.params = params
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"schedule-{self.kind}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        at = next_run(datetime.datetime.now(datetime.timezone.utc))
+        print(f"Next scheduled {self.kind}: {at:%Y-%m-%d %H:%M} UTC")
+        while True:
+            remaining = (at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            if remaining > 0:
+                if self._stop.wait(min(remaining, SCHEDULE_MAX_SLEEP)):
+                    return
+                continue
+            job_id, started = self.runner.submit(self.kind, self.func, trigger="schedule", **self.params)
+            print(f"Scheduled {self.kind}: {'started' if started else 'already running as'} job #{job_id}")
+            at = next_run(datetime.datetime.now(datetime.timezone.utc))
+            print(f"Next scheduled {self.kind}: {at:%Y-%m-%d %H:%M} UTC")
@@ -1,18 +1,46 @@
-from fastapi import FastAPI, Depends, Request, Form, BackgroundTasks
+from fastapi import FastAPI, Depends, Request, Form, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response
+from sqlalchemy import and_
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from .database import models, database
-from . import fetcher, recommender, zotero_service
+# recommender (scikit-learn, NumPy, SciPy), zotero_service (pyzotero) and
+# fulltext (NumPy, SciPy via features) are imported where they are used, so
+# startup does not pay for them
+from . import fetcher, rankings, page_cache, search, catalog, jobs, retention, migrations, scores, metrics, users
+from .concurrency import run_db, run_network, run_after
+import contextlib
 import datetime
+import urllib.parse
 
-models.Base.metadata.create_all(bind=database.engine)
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Schema migrations (a no-op on an up-to-date DB) and leftovers from
+    # the previous run, before the first request
+    migrations.migrate(database.engine)
+    users.reset()
+    with database.SessionLocal() as db:
+        jobs.mark_interrupted(db)
 
-app = FastAPI()
+    # Optional daily fetch after each arXiv announcement
+    schedule = None
+    if jobs.SCHEDULE == "daily":
+        schedule = jobs.DailySchedule("fetch", task_fetch_and_score)
+        schedule.start()
+    yield
+    if schedule:
+        schedule.stop()
 
-app.mount("/static", StaticFiles(directory="arxiv_local/app/static"), name="static")
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(database.engine)
+
+app.mount("/static", StaticFiles(directory="arxiv_local/app/static", check_dir=False), name="static")
 templates = Jinja2Templates(directory="arxiv_local/app/templates")
+# The Zotero library configured in .env belongs to this profile (see users.py)
+templates.env.globals["ZOTERO_USER"] = users.ZOTERO_USER
 
 # Dependency
 def get_db():
@@ -22,171 +50,584 @@ def get_db():
     finally:
         db.close()
 
+def current_user(request: Request):
+    """The profile picked with the sidebar switcher (see users.py)."""
+    return users.resolve(request.cookies.get(users.USER_COOKIE))
+
+def invalidate_user_pages(user_id):
+    """Drops the cached pages of one profile (keys are "<user_id>:<date>")."""
+    page_cache.pages.invalidate_prefix(f"{user_id}:")
+
 @app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request, date: str = None, db: Session = Depends(get_db)):
+async def read_root(request: Request, date: str = None):
+    user_id = current_user(request)
     # 1. Determine Target Date
     if date:
         try:
             target_date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
         except ValueError:
             target_date = datetime.date.today()
+        cache_key = f"{user_id}:{target_date.isoformat()}"
     else:
-        # Default to the most recent date in DB or today
-        last_paper = db.query(models.Paper).order_by(models.Paper.published_date.desc()).first()
-        target_date = last_paper.published_date if last_paper else datetime.date.today()
-
-    # 2. Mark this date as Viewed
-    viewed_entry = db.query(models.ViewedDate).filter(models.ViewedDate.date == target_date).first()
-    if not viewed_entry:
-        viewed_entry = models.ViewedDate(date=target_date)
-        db.add(viewed_entry)
+        # The default page follows the newest date, which only a fetch changes
+        cache_key = f"{user_id}:latest"
+
+    # A cached page implies the date was already marked as viewed
+    cached = page_cache.pages.get(cache_key)
+    if cached:
+        etag, body = cached
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if page_cache.etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+    # Cache miss: queries and template rendering run on the DB pool
+    return await run_db(_render_root, request, user_id, target_date if date else None, cache_key)
+
+def _render_root(request: Request, user_id, target_date, cache_key):
+    with database.SessionLocal() as db:
+        if target_date is None:
+            # Default to the most recent date in DB or today
+            target_date = rankings.latest_date(db) or datetime.date.today()
+
+        # 2. Mark this date as Viewed (concurrent first views may race here)
+        marked = db.execute(
+            sqlite_insert(models.ViewedDate).values(user_id=user_id, date=target_date).on_conflict_do_nothing()
+        )
         db.commit()
+        if marked.rowcount:
+            # The user's cached sidebars still show this date as new
+            invalidate_user_pages(user_id)
+        # Read after our own invalidation: a change from here on means the
+        # page may be stale, so put() will not cache it
+        epoch = page_cache.pages.epoch
 
-    # 3. Fetch History for Sidebar (Dates with papers)
-    # Get all unique published dates descending
-    available_dates_query = db.query(models.Paper.published_date).distinct().order_by(models.Paper.published_date.desc()).limit(60).all()
-    available_dates = [d[0] for d in available_dates_query]
-    
-    # Get all viewed dates
-    viewed_dates_query = db.query(models.ViewedDate.date).all()
-    viewed_dates_set = {d[0] for d in viewed_dates_query}
-
-    # Construct history list: [(date, is_viewed, is_active), ...]
-    history = []
-    for d in available_dates:
-        history.append({
-            "date": d,
-            "is_viewed": d in viewed_dates_set,
-            "is_active": d == target_date
+        # 3. Fetch History for Sidebar (Dates with papers, with viewed flag)
+        # Construct history list: [(date, is_viewed, is_active), ...]
+        history = []
+        for d, is_viewed in rankings.get_history(db, user_id, limit=60):
+            history.append({
+                "date": d,
+                "is_viewed": bool(is_viewed) or d == target_date,
+                "is_active": d == target_date
+            })
+
+        # 4. Fetch papers for the target date, already in score order, with
+        # flags. The revision is read first, so the page's script can ask
+        # /api/scores for anything that changes after it.
+        revision = rankings.current_revision(db)
+        ranked = rankings.get_day(db, target_date, user_id)
+        papers = [p for p, *_ in ranked]
+        liked_ids = {p.id for p, is_liked, _, _ in ranked if is_liked}
+        zotero_ids = {p.id for p, _, is_zotero, _ in ranked if is_zotero}
+
+        prev_date = target_date - datetime.timedelta(days=1)
+        next_date = target_date + datetime.timedelta(days=1)
+
+        response = templates.TemplateResponse(request, "index.html", {
+            "papers": papers,
+            "current_date": target_date,
+            "prev_date": prev_date,
+            "next_date": next_date,
+            "liked_ids": liked_ids,
+            "zotero_ids": zotero_ids,
+            "scores_by_id": {p.id: score for p, _, _, score in ranked},
+            "authors_by_id": catalog.authors_of(db, [p.id for p in papers]),
+            "history": history,
+            "revision": revision,
+            "users": users.list_users(db),
+            "current_user": user_id,
         })
+        response.headers["ETag"] = page_cache.pages.put(cache_key, response.body, epoch)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
 
-    # 4. Fetch papers for the target date
-    papers = db.query(models.Paper).filter(models.Paper.published_date == target_date).all()
-    
-    # Sort papers based on recommendation score (descending)
-    papers.sort(key=lambda x: x.score or 0, reverse=True)
-
-    # Get likes for these papers
-    paper_ids = [p.id for p in papers]
-    interactions = db.query(models.Interaction).filter(
-        models.Interaction.paper_id.in_(paper_ids)
-    ).all()
-    liked_ids = {i.paper_id for i in interactions if i.is_liked}
-    zotero_ids = {i.paper_id for i in interactions if i.is_zotero}
-
-    prev_date = target_date - datetime.timedelta(days=1)
-    next_date = target_date + datetime.timedelta(days=1)
-
-    return templates.TemplateResponse("index.html", {
-        "request": request,
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _load_listing(db: Session, paper_ids, user_id):
+    """
+    Loads papers (keeping the order of paper_ids) with user_id's flags and
+    scores, their authors and the sidebar.
+    """
+    rows = db.query(
+        models.Paper, models.Interaction.is_liked, models.Interaction.is_zotero, models.Score.score
+    ).outerjoin(models.Interaction, and_(
+        models.Interaction.user_id == user_id,
+        models.Interaction.paper_id == models.Paper.id
+    )).outerjoin(
+        models.ScorePointer, models.ScorePointer.id == user_id
+    ).outerjoin(models.Score, and_(
+        models.Score.generation == models.ScorePointer.generation,
+        models.Score.user_id == user_id,
+        models.Score.paper_id == models.Paper.id
+    )).filter(models.Paper.id.in_(paper_ids)).all() if paper_ids else []
+    by_id = {p.id: (p, bool(liked), bool(zotero), score) for p, liked, zotero, score in rows}
+    return {
+        "papers": [by_id[pid] for pid in paper_ids if pid in by_id],
+        "authors_by_id": catalog.authors_of(db, paper_ids),
+        "history": rankings.get_history(db, user_id, limit=60),
+        "users": users.list_users(db),
+        "user_id": user_id,
+    }
+
+def _paper_json(paper, is_liked, is_zotero, score, authors=None):
+    return {
+        "id": paper.id,
+        "title": paper.title,
+        "authors": authors if authors is not None else catalog.split_authors(paper.authors),
+        "published_date": paper.published_date.isoformat() if paper.published_date else None,
+        "arxiv_category": paper.arxiv_category,
+        "link": paper.link,
+        "score": score,
+        "is_liked": is_liked,
+        "is_zotero": is_zotero,
+    }
+
+def _page_json(result, listing, **extra):
+    return dict(extra, total=result["total"], page=result["page"], per_page=result["per_page"], results=[
+        _paper_json(p, liked, zotero, score, listing["authors_by_id"].get(p.id))
+        for p, liked, zotero, score in listing["papers"]
+    ])
+
+def _render_listing(request: Request, heading, result, listing, path, params, search_form=None):
+    """Renders a paged list of papers (search results, author or category pages) with index.html."""
+    n_pages = max(1, -(-result["total"] // result["per_page"]))
+    def page_url(page):
+        return path + "?" + urllib.parse.urlencode(dict(params, page=page))
+    papers = [p for p, *_ in listing["papers"]]
+    return templates.TemplateResponse(request, "index.html", {
         "papers": papers,
-        "current_date": target_date,
-        "prev_date": prev_date,
-        "next_date": next_date,
-        "liked_ids": liked_ids,
-        "zotero_ids": zotero_ids,
-        "history": history
+        "liked_ids": {p.id for p, liked, _, _ in listing["papers"] if liked},
+        "zotero_ids": {p.id for p, _, zotero, _ in listing["papers"] if zotero},
+        "scores_by_id": {p.id: score for p, _, _, score in listing["papers"]},
+        "authors_by_id": listing["authors_by_id"],
+        "history": [{"date": d, "is_viewed": bool(v), "is_active": False} for d, v in listing["history"]],
+        "listing": {
+            "heading": heading, "total": result["total"], "page": result["page"], "n_pages": n_pages,
+            "prev_url": page_url(result["page"] - 1) if result["page"] > 1 else None,
+            "next_url": page_url(result["page"] + 1) if result["page"] < n_pages else None,
+        },
+        "search": search_form,
+        "users": listing["users"],
+        "current_user": listing["user_id"],
     })
 
-# --- Background Tasks ---
-def task_fetch_and_score():
+def _run_search(q, date_from, date_to, category, page, per_page, user_id):
+    """Runs a search and loads the matching papers (in rank order) with user_id's flags."""
+    with database.SessionLocal() as db:
+        result = search.search_papers(
+            db, q, date_from=_parse_date(date_from), date_to=_parse_date(date_to),
+            category=category or None, page=page, per_page=per_page
+        )
+        return result, _load_listing(db, [pid for pid, _ in result["results"]], user_id)
+
+@app.get("/api/search")
+async def api_search(request: Request, q: str, date_from: str = None, date_to: str = None, category: str = None,
+                     page: int = 1, per_page: int = 25):
+    result, listing = await run_db(_run_search, q, date_from, date_to, category, page, per_page,
+                                   current_user(request))
+    return _page_json(result, listing, query=q)
+
+@app.get("/search", response_class=HTMLResponse)
+async def search_page(request: Request, q: str = "", date_from: str = None, date_to: str = None,
+                      category: str = None, page: int = 1, per_page: int = 25):
+    result, listing = await run_db(_run_search, q, date_from, date_to, category, page, per_page,
+                                   current_user(request))
+    form = {"q": q, "date_from": date_from or "", "date_to": date_to or "", "category": category or ""}
+    heading = f"{result['total']} result{'' if result['total'] == 1 else 's'} for \u201c{q}\u201d"
+    return _render_listing(request, heading, result, listing, "/search", form, search_form=form)
+
+# --- Daily list JSON API (used by the page to update in place) ---
+
+MAX_DAY_PAGE = 200
+
+def _run_day(day, page, per_page, user_id):
+    with database.SessionLocal() as db:
+        revision = rankings.current_revision(db)
+        ranked = rankings.get_day(db, day, user_id, offset=(page - 1) * per_page, limit=per_page)
+        return revision, rankings.day_count(db, day), ranked, catalog.authors_of(db, [p.id for p, *_ in ranked])
+
+@app.get("/api/day/{date}")
+async def api_day(request: Request, date: str, page: int = 1, per_page: int = 50):
+    day = _parse_date(date)
+    if day is None:
+        raise HTTPException(status_code=400, detail="Expected a YYYY-MM-DD date")
+    page, per_page = max(1, page), max(1, min(per_page, MAX_DAY_PAGE))
+    revision, total, ranked, authors_by_id = await run_db(_run_day, day, page, per_page, current_user(request))
+    offset = (page - 1) * per_page
+    return {
+        "date": day.isoformat(), "revision": revision, "total": total, "page": page, "per_page": per_page,
+        "results": [dict(_paper_json(p, bool(liked), bool(zotero), score, authors_by_id.get(p.id)),
+                         rank=offset + i + 1, abstract=p.abstract)
+                    for i, (p, liked, zotero, score) in enumerate(ranked)],
+    }
+
+@app.get("/api/scores")
+async def api_scores(request: Request, since: int = 0, date: str = None):
+    """
+    The current profile's ranking rows (score, rank, flags) changed after
+    revision `since`. With a date, the day's full order is included
+    whenever something changed.
+    """
+    day = _parse_date(date)
+    user_id = current_user(request)
+    def load():
+        with database.SessionLocal() as db:
+            revision, rows = rankings.changes_since(db, since, user_id, day)
+            order = rankings.day_order(db, day, user_id) if day is not None and rows else None
+            return revision, rows, order
+    revision, rows, order = await run_db(load)
+    return {
+        "revision": revision,
+        "changes": [{"id": pid, "date": d.isoformat(), "rank": rank, "score": score,
+                     "is_liked": bool(liked), "is_zotero": bool(zotero)}
+                    for d, rank, pid, score, liked, zotero in rows],
+        "order": order,
+    }
+
+# --- Author and category browsing ---
+
+def _run_browse(kind, key, page, per_page, user_id):
+    with database.SessionLocal() as db:
+        if kind == "author":
+            result = catalog.papers_by_author(db, key, page=page, per_page=per_page)
+        else:
+            result = catalog.papers_in_category(db, key, page=page, per_page=per_page)
+        return result, _load_listing(db, result["paper_ids"], user_id)
+
+@app.get("/author", response_class=HTMLResponse)
+async def author_page(request: Request, name: str, page: int = 1, per_page: int = 25):
+    result, listing = await run_db(_run_browse, "author", name, page, per_page, current_user(request))
+    return _render_listing(request, f"{result['total']} papers by {name}", result, listing,
+                           "/author", {"name": name})
+
+@app.get("/category/{category}", response_class=HTMLResponse)
+async def category_page(request: Request, category: str, page: int = 1, per_page: int = 25):
+    result, listing = await run_db(_run_browse, "category", category, page, per_page, current_user(request))
+    return _render_listing(request, f"{result['total']} papers in {category}", result, listing,
+                           f"/category/{urllib.parse.quote(category)}", {})
+
+@app.get("/api/author")
+async def api_author(request: Request, name: str, page: int = 1, per_page: int = 25):
+    result, listing = await run_db(_run_browse, "author", name, page, per_page, current_user(request))
+    return _page_json(result, listing, author=name)
+
+@app.get("/api/category/{category}")
+async def api_category(request: Request, category: str, page: int = 1, per_page: int = 25):
+    result, listing = await run_db(_run_browse, "category", category, page, per_page, current_user(request))
+    return _page_json(result, listing, category=category)
+
+@app.get("/api/authors")
+async def api_authors(prefix: str, limit: int = 20):
+    def find():
+        with database.SessionLocal() as db:
+            return catalog.find_authors(db, prefix, limit=min(limit, 100))
+    return [{"name": name, "papers": n} for name, n in await run_db(find)]
+
+@app.get("/api/categories")
+async def api_categories():
+    def counts():
+        with database.SessionLocal() as db:
+            return catalog.category_counts(db)
+    return [{"category": c, "papers": n} for c, n in await run_db(counts)]
+
+# --- More like this ---
+
+def _run_similar(paper_id, k, user_id):
+    from . import recommender
+    with database.SessionLocal() as db:
+        paper = db.get(models.Paper, paper_id)
+        if paper is None:
+            return None, None, None
+        neighbours = recommender.similar_papers(db, paper_id, k=k) or []
+        listing = _load_listing(db, [pid for pid, _ in neighbours], user_id)
+        return paper.title, neighbours, listing
+
+@app.get("/similar/{paper_id}")
+async def similar(request: Request, paper_id: str, k: int = 10):
+    title, neighbours, listing = await run_db(_run_similar, paper_id, max(1, min(k, 100)), current_user(request))
+    if title is None:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    similarity_of = dict(neighbours)
+    return {
+        "paper_id": paper_id,
+        "results": [dict(_paper_json(p, liked, zotero, score, listing["authors_by_id"].get(p.id)),
+                         similarity=similarity_of[p.id])
+                    for p, liked, zotero, score in listing["papers"]],
+    }
+
+@app.get("/similar/{paper_id}/view", response_class=HTMLResponse)
+async def similar_page(request: Request, paper_id: str, k: int = 25):
+    k = max(1, min(k, 100))
+    title, neighbours, listing = await run_db(_run_similar, paper_id, k, current_user(request))
+    if title is None:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    result = {"total": len(listing["papers"]), "page": 1, "per_page": k}
+    return _render_listing(request, f"Papers like \u201c{title}\u201d", result, listing,
+                           f"/similar/{paper_id}/view", {"k": k})
+
+# --- Background jobs (see jobs.py) ---
+def task_fetch_and_score(job):
     """Runs fetch then immediately trains the model."""
+    from . import recommender, fulltext
     db = database.SessionLocal()
     try:
         print("Starting background fetch...")
-        # Fetching 2000 papers covers approx 3-4 weeks of history
-        fetcher.fetch_papers(db, max_results=2000)
+        job.update(stage="fetching")
+        # Pages back until it reaches papers we already have; on an empty DB
+        # 2000 papers covers approx 3-4 weeks of history
+        new_papers = fetcher.harvest_papers(db, max_results=2000, progress=job.update)
         
         # Cleanup old papers (keep 90 days)
-        fetcher.cleanup_old_papers(db, days_to_keep=90)
-        
+        job.update(stage="cleanup")
+        cleanup = retention.prune(db, days_to_keep=90, progress=job.update)
+
         print("Fetch complete. Starting scoring...")
-        recommender.train_and_score(db)
+        updated = recommender.train_and_score(db, progress=job.update)
+        result = dict(cleanup, new_papers=new_papers, scores_updated=updated)
+
+        # Full text is rate limited to a request every few seconds, so it is
+        # its own job, started once the new scores are out
+        if fulltext.ENABLED:
+            result["full_text_job"], _ = jobs.runner.submit("fulltext", task_fetch_full_text)
         print("Background task complete.")
+        return result
     finally:
         db.close()
+        page_cache.pages.invalidate()
 
-def task_train_only():
-    """Runs only the training/scoring."""
+def task_fetch_full_text(job, limit=None):
+    """
+    Downloads missing full text, newest papers first and at most
+    fulltext.PER_RUN of them, then rescores if any text came in.
+    """
+    from . import recommender, fulltext
     db = database.SessionLocal()
     try:
-        recommender.train_and_score(db)
+        job.update(stage="full text")
+        fulltext.collect_garbage(db)
+        stats = fulltext.fetch_missing(db, limit=limit or fulltext.PER_RUN, progress=job.update)
+        updated = 0
+        if stats["extracted"]:
+            updated = recommender.train_and_score(db, progress=job.update)
+        return dict(stats, scores_updated=updated)
     finally:
         db.close()
+        page_cache.pages.invalidate()
+
+def task_train_only(job, full: bool = False):
+    """Runs only the training/scoring (full=True refits the vocabulary)."""
+    from . import recommender
+    db = database.SessionLocal()
+    try:
+        return {"scores_updated": recommender.train_and_score(db, full=full, progress=job.update)}
+    finally:
+        db.close()
+        page_cache.pages.invalidate()
+
+def task_sync_zotero(job, paper_ids, user_id=models.DEFAULT_USER_ID):
+    from . import zotero_service
+    db = database.SessionLocal()
+    try:
+        job.update(stage="syncing", papers=len(paper_ids))
+        result = zotero_service.sync_papers(db, paper_ids, user_id=user_id)
+        database.writer.run(rankings.set_flags, result["synced"], user_id, is_zotero=True)
+        return {"synced": len(result["synced"])}
+    finally:
+        db.close()
+        invalidate_user_pages(user_id)
+
+async def _submit_job(kind, func, **params):
+    # A job of the same kind that is still queued or running is reused
+    job_id, started = await run_db(jobs.runner.submit, kind, func, **params)
+    return {"status": "started" if started else "already running", "job_id": job_id}
 
 @app.post("/fetch")
-async def trigger_fetch(background_tasks: BackgroundTasks):
-    # We don't need the dependency db here, the task creates its own
-    background_tasks.add_task(task_fetch_and_score)
-    return RedirectResponse(url="/", status_code=303)
+async def trigger_fetch():
+    page_cache.pages.invalidate()
+    return await _submit_job("fetch", task_fetch_and_score)
 
 @app.post("/like/{paper_id}")
-async def like_paper(paper_id: str, db: Session = Depends(get_db)):
-    interaction = db.query(models.Interaction).filter(models.Interaction.paper_id == paper_id).first()
-    if interaction:
-        interaction.is_liked = not interaction.is_liked
-    else:
-        interaction = models.Interaction(paper_id=paper_id, is_liked=True)
-        db.add(interaction)
+async def like_paper(request: Request, paper_id: str):
+    user_id = current_user(request)
+    is_liked = await run_db(_toggle_like, paper_id, user_id)
+    # Rescoring touches every paper's score, so it runs after (and is not
+    # timed with) the response; see concurrency.run_after
+    run_after(task_rescore_like, paper_id, user_id)
+    return {"status": "success", "is_liked": is_liked}
+
+def _user_interaction(db: Session, paper_id: str, user_id):
+    return db.query(models.Interaction).filter(
+        models.Interaction.user_id == user_id, models.Interaction.paper_id == paper_id
+    ).first()
+
+def _toggle_like(paper_id: str, user_id=models.DEFAULT_USER_ID):
+    with database.SessionLocal() as db:
+        interaction = _user_interaction(db, paper_id, user_id)
+        if interaction:
+            interaction.is_liked = not interaction.is_liked
+        else:
+            interaction = models.Interaction(user_id=user_id, paper_id=paper_id, is_liked=True)
+            db.add(interaction)
     
-    db.commit()
-    return {"status": "success", "is_liked": interaction.is_liked}
+        db.commit()
+        rankings.set_flags(db, paper_id, user_id, is_liked=interaction.is_liked)
+        invalidate_user_pages(user_id)
+        return interaction.is_liked
+
+def task_rescore_like(paper_id: str, user_id=models.DEFAULT_USER_ID):
+    """Folds a like/unlike into the user's profile running sum and rescores them incrementally."""
+    from . import recommender
+    db = database.SessionLocal()
+    try:
+        # Read the flag now: quick double-clicks may have flipped it again
+        is_liked = db.query(models.Interaction.is_liked).filter(
+            models.Interaction.user_id == user_id,
+            models.Interaction.paper_id == paper_id
+        ).scalar()
+        recommender.record_interaction(db, paper_id, bool(is_liked), user_id)
+    finally:
+        db.close()
+        invalidate_user_pages(user_id)
 
 @app.post("/zotero/{paper_id}")
-async def add_to_zotero(paper_id: str, db: Session = Depends(get_db)):
-    paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
+async def add_to_zotero(request: Request, paper_id: str):
+    from . import zotero_service
+    if current_user(request) != users.ZOTERO_USER:
+        return {"status": "error", "message": users.ZOTERO_ONLY}
+    paper, author_names = await run_db(_load_paper, paper_id)
     if not paper:
         return {"status": "error", "message": "Paper not found"}
     
-    result = zotero_service.add_arxiv_paper(paper)
+    # The Zotero HTTP call runs on its own pool so it never holds a DB thread
+    result = await run_network(zotero_service.add_arxiv_paper, paper, author_names)
     
     if result["status"] == "success":
-        interaction = db.query(models.Interaction).filter(models.Interaction.paper_id == paper_id).first()
+        await run_db(_mark_zotero, paper_id, current_user(request))
+        
+    return result
+
+def _load_paper(paper_id: str):
+    with database.SessionLocal(expire_on_commit=False) as db:
+        paper = db.query(models.Paper).filter(models.Paper.id == paper_id).first()
+        if not paper:
+            return None, None
+        db.expunge(paper)
+        return paper, catalog.authors_of(db, [paper_id]).get(paper_id)
+
+def _mark_zotero(paper_id: str, user_id=models.DEFAULT_USER_ID):
+    with database.SessionLocal() as db:
+        interaction = _user_interaction(db, paper_id, user_id)
         if interaction:
             interaction.is_zotero = True
         else:
-            interaction = models.Interaction(paper_id=paper_id, is_zotero=True)
+            interaction = models.Interaction(user_id=user_id, paper_id=paper_id, is_zotero=True)
             db.add(interaction)
         db.commit()
-        
-    return result
+        rankings.set_flags(db, paper_id, user_id, is_zotero=True)
+    invalidate_user_pages(user_id)
 
 @app.post("/sync_zotero")
-async def sync_zotero(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    # Find papers that are liked but not yet in Zotero
-    liked_not_zotero_ids = db.query(models.Paper.id).join(
-        models.Interaction, models.Paper.id == models.Interaction.paper_id
-    ).filter(
-        models.Interaction.is_liked == True,
-        models.Interaction.is_zotero == False
-    ).all()
-    
-    liked_not_zotero_ids = [r[0] for r in liked_not_zotero_ids]
+async def sync_zotero(request: Request):
+    # Find papers the profile liked that are not yet in Zotero (skipping
+    # queued failures that are not due for a retry yet)
+    from . import zotero_service
+    user_id = current_user(request)
+    if user_id != users.ZOTERO_USER:
+        return {"status": "error", "message": users.ZOTERO_ONLY}
+    def find_pending():
+        with database.SessionLocal() as db:
+            return zotero_service.pending_paper_ids(db, user_id)
+    pending_ids = await run_db(find_pending)
     
-    if not liked_not_zotero_ids:
+    if not pending_ids:
         return {"status": "success", "message": "All liked papers already in Zotero."}
     
-    def sync_task(ids_to_sync):
-        inner_db = database.SessionLocal()
-        try:
-            for paper_id in ids_to_sync:
-                paper = inner_db.query(models.Paper).filter(models.Paper.id == paper_id).first()
-                if paper:
-                    res = zotero_service.add_arxiv_paper(paper)
-                    if res["status"] == "success":
-                        interaction = inner_db.query(models.Interaction).filter(models.Interaction.paper_id == paper.id).first()
-                        interaction.is_zotero = True
-                        inner_db.commit()
-        finally:
-            inner_db.close()
-            
-    background_tasks.add_task(sync_task, liked_not_zotero_ids)
-    return {"status": "success", "message": f"Syncing {len(liked_not_zotero_ids)} papers in background."}
+    job = await _submit_job("sync_zotero", task_sync_zotero, paper_ids=pending_ids, user_id=user_id)
+    if job["status"] == "already running":
+        return {"status": "success", "message": "A Zotero sync is already running.", "job_id": job["job_id"]}
+    return {"status": "success", "message": f"Syncing {len(pending_ids)} papers in background.",
+            "job_id": job["job_id"]}
 
 @app.post("/train")
-async def train_model(background_tasks: BackgroundTasks):
-    background_tasks.add_task(task_train_only)
-    return {"status": "Training started"}
+async def train_model(full: bool = False):
+    page_cache.pages.invalidate()
+    return await _submit_job("train", task_train_only, full=full)
+
+@app.post("/scores/rollback")
+async def rollback_scores(request: Request, generation: int = None):
+    """Points the profile's rankings back at an earlier score generation (default: the previous one)."""
+    user_id = current_user(request)
+    def rollback():
+        with database.SessionLocal() as db:
+            return scores.rollback(db, user_id, generation)
+    try:
+        previous, current = await run_db(rollback)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    invalidate_user_pages(user_id)
+    return {"status": "success", "previous": previous, "generation": current}
+
+# --- Profiles (see users.py) ---
+
+def _select_user(user_id):
+    response = RedirectResponse("/", status_code=303)
+    response.set_cookie(users.USER_COOKIE, str(user_id), max_age=10 * 365 * 24 * 3600, samesite="lax")
+    return response
+
+@app.get("/users")
+async def list_profiles(request: Request):
+    def load():
+        with database.SessionLocal() as db:
+            return users.list_users(db)
+    user_id = current_user(request)
+    return [{"id": uid, "name": name, "current": uid == user_id} for uid, name in await run_db(load)]
+
+@app.post("/users")
+async def create_profile(name: str = Form(...)):
+    def create():
+        with database.SessionLocal() as db:
+            return users.create_user(db, name)
+    try:
+        user_id = await run_db(create)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Every cached sidebar lists the profiles
+    page_cache.pages.invalidate()
+    return _select_user(user_id)
+
+@app.post("/users/select")
+async def select_profile(user_id: int = Form(...)):
+    if user_id not in users.user_ids():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _select_user(user_id)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs")
+async def list_jobs(kind: str = None, limit: int = 20):
+    def load():
+        with database.SessionLocal() as db:
+            return jobs.list_jobs(db, kind=kind, limit=max(1, min(limit, 200)))
+    return await run_db(load)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    def load():
+        with database.SessionLocal() as db:
+            return jobs.get_job(db, job_id)
+    job = await run_db(load)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/debug_paper")
 def debug_paper(q: str, db: Session = Depends(get_db)):
@@ -0,0 +1,292 @@
+"""
+Performance instrumentation, served on /metrics in the Prometheus text
+format.
+
+    - MetricsMiddleware times every HTTP request by method, route template
+      and status, and counts the SQL statements (and their time) each
+      request issued.
+    - instrument_engine() hooks the engine's cursor events. Statements are
+      counted globally by kind (SELECT, INSERT, ...) and against the
+      current request; a request that runs the same statement
+      N_PLUS_ONE_THRESHOLD times or more is logged as a likely N+1 query.
+    - span(stage) / observe(stage, seconds) time the fetch, parse, ingest,
+      vectorize and score stages of background work.
+
+Request state lives in a context variable. run_db and the serialized
+writer carry it to their threads (see carry()), so work a handler hands
+off is counted against the request.
+
+With ARXIV_LOCAL_PROFILING=1, adding ?profile=1 to any URL replaces the
+response with a cProfile report (top PROFILE_LINES functions by cumulative
+time) of the work the request ran on the DB pool and the writer. It is
+off by default: the report exposes code paths and slows the request down.
+"""
+import collections
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+STAGE_BUCKETS = (0.01, 0.05, 0.25, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0)
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv("ARXIV_LOCAL_N_PLUS_ONE", "10"))
+PROFILING = os.getenv("ARXIV_LOCAL_PROFILING", "0") == "1"
+PROFILE_LINES = 40
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            series[0][i] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += n
+                    le = f'le="{bound if bound == "+Inf" else _number(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [le])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(float(total))}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+request_seconds = Histogram("arxiv_local_request_seconds", "HTTP request latency",
+                            ("method", "route", "status"))
+request_queries = Histogram("arxiv_local_request_sql_queries", "SQL statements per HTTP request",
+                            ("route",), QUERY_BUCKETS)
+request_sql_seconds = Histogram("arxiv_local_request_sql_seconds", "SQL time per HTTP request", ("route",))
+n_plus_one = Counter("arxiv_local_n_plus_one_total",
+                     "Requests that repeated one SQL statement N_PLUS_ONE_THRESHOLD times or more", ("route",))
+sql_queries = Counter("arxiv_local_sql_queries_total", "SQL statements executed", ("kind",))
+sql_seconds = Counter("arxiv_local_sql_seconds_total", "Time spent in SQL statements", ("kind",))
+stage_seconds = Histogram("arxiv_local_stage_seconds", "Duration of background work stages",
+                          ("stage",), STAGE_BUCKETS)
+job_seconds = Histogram("arxiv_local_job_seconds", "Duration of background jobs",
+                        ("kind", "status"), STAGE_BUCKETS)
+
+
+def render():
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# --- Stages ---
+
+def observe(stage, seconds):
+    stage_seconds.observe(seconds, stage)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Times the enclosed block as one observation of stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+# --- Per-request state ---
+
+class RequestStats:
+    def __init__(self, profile=False):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = collections.Counter()
+        # cProfile.Profile per handed-off call when profiling, else None
+        self.profiles = [] if profile else None
+        self._lock = threading.Lock()
+
+    def record(self, statement, seconds):
+        with self._lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+            self.statements[statement] += 1
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current():
+    return _current.get()
+
+
+def carry(func):
+    """
+    Wraps func to run in the caller's context on another thread, so its
+    queries count against the caller's request (and are profiled with it).
+    """
+    context = contextvars.copy_context()
+    stats = _current.get()
+    if stats is None or stats.profiles is None:
+        return functools.partial(context.run, func)
+
+    def profiled(*args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return context.run(profile.runcall, func, *args, **kwargs)
+        finally:
+            with stats._lock:
+                stats.profiles.append(profile)
+    return profiled
+
+
+# --- SQL ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    kind = statement.split(None, 1)[0].upper() if statement.strip() else "?"
+    sql_queries.inc(kind)
+    sql_seconds.inc(kind, amount=elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def instrument_engine(engine):
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- HTTP ---
+
+def _wants_profile(scope):
+    if not PROFILING:
+        return False
+    query = scope.get("query_string", b"").decode("latin-1")
+    return any(part in ("profile=1", "profile=true") for part in query.split("&"))
+
+
+def _profile_report(stats, method, path, status, elapsed):
+    out = io.StringIO()
+    out.write(f"{method} {path} -> {status} in {elapsed * 1000:.1f} ms, "
+              f"{stats.queries} SQL statements ({stats.sql_seconds * 1000:.1f} ms)\n\n")
+    if stats.profiles:
+        report = pstats.Stats(*stats.profiles, stream=out)
+        report.sort_stats("cumulative").print_stats(PROFILE_LINES)
+    else:
+        out.write("No work was handed to the DB pool or the writer.\n")
+    return out.getvalue().encode()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and SQL counts per route (see module docstring)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = _wants_profile(scope)
+        stats = RequestStats(profile=profile)
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            if not profile:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_seconds.observe(elapsed, scope["method"], route, str(status))
+            request_queries.observe(stats.queries, route)
+            request_sql_seconds.observe(stats.sql_seconds, route)
+            if stats.statements:
+                statement, repeats = stats.statements.most_common(1)[0]
+                if repeats >= N_PLUS_ONE_THRESHOLD:
+                    n_plus_one.inc(route)
+                    print(f"Possible N+1 query: {scope['method']} {route} ran this {repeats} times: "
+                          f"{' '.join(statement.split())[:200]}")
+
+        if profile:
+            body = _profile_report(stats, scope["method"], scope["path"], status, elapsed)
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
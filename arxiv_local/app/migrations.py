@@ -0,0 +1,137 @@
+"""
+Versioned schema migrations.
+
+The schema version is kept in SQLite's user_version pragma. migrate() runs
+every step newer than it, in order, and records each step's version as it
+completes; on an up-to-date DB it costs a single pragma read, so startup no
+longer creates tables or scans for missing columns, indexes and backfills
+on every launch. main runs it from its lifespan hook and the command-line
+tools call it before touching the DB.
+
+A DB created before versioning has user_version 0 and runs every step;
+all of them are idempotent. Step 1 brings the tables, columns and indexes
+up to the current models, so the later steps only move data. A later
+change to the models gets a new step at the end of MIGRATIONS whose
+description names the tables or columns it adds (usually another
+_upgrade_tables).
+"""
+from sqlalchemy import insert, inspect, text
+
+from .database import models, database
+from . import search, catalog, rankings
+
+
+def _upgrade_tables(engine):
+    models.Base.metadata.create_all(bind=engine)
+    database.upgrade_schema(engine, models.Base)
+
+
+def _backfill_catalog(engine):
+    with database.SessionLocal(bind=engine) as db:
+        catalog.ensure_backfilled(db)
+
+
+def _build_rankings(engine):
+    with database.SessionLocal(bind=engine) as db:
+        rankings.ensure_built(db)
+
+
+def _import_paper_scores(engine):
+    # Scores used to be a papers column; they become generation 1 (and the
+    # rankings, built by step 4 without them, are rebuilt). The column,
+    # which SQLite cannot easily drop, is left unused
+    with engine.begin() as conn:
+        columns = {c["name"] for c in inspect(conn).get_columns("papers")}
+        conn.execute(text("DROP INDEX IF EXISTS ix_papers_published_date_score"))
+        if "score" not in columns or conn.execute(text("SELECT 1 FROM score_pointer")).first():
+            return
+        conn.execute(text("INSERT INTO score_generations (id, status, source, papers, activated_at) "
+                          "VALUES (1, 'ready', 'import', (SELECT count(*) FROM papers), CURRENT_TIMESTAMP)"))
+        # Created by a later models version, the table may have user_id already
+        user = ", user_id" if "user_id" in {c["name"] for c in inspect(conn).get_columns("scores")} else ""
+        conn.execute(text(f"INSERT INTO scores (generation{user}, paper_id, score) "
+                          f"SELECT 1{', 1' if user else ''}, id, score FROM papers WHERE score IS NOT NULL"))
+        conn.execute(text("INSERT INTO score_pointer (id, generation) VALUES (1, 1)"))
+    with database.SessionLocal(bind=engine) as db:
+        rankings.rebuild_all(db)
+
+
+# Tables whose primary key gained user_id, with how to copy the old rows
+# (None: derived data, rebuilt instead)
+_USER_KEYED = {
+    "viewed_dates": "INSERT INTO viewed_dates (user_id, date, viewed_at) "
+                    "SELECT :user, date, viewed_at FROM viewed_dates_old",
+    "scores": "INSERT INTO scores (generation, user_id, paper_id, score) "
+              "SELECT generation, :user, paper_id, score FROM scores_old",
+    "day_ranks": None,
+}
+
+
+def _add_users(engine):
+    # SQLite cannot change a primary key: the old tables are renamed (their
+    # named indexes dropped, so the new ones can take the names), recreated
+    # and copied. Existing data goes to the default user. The key decides
+    # which tables need it (upgrade_schema leaves key columns alone).
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        renamed = [table for table in _USER_KEYED if inspector.has_table(table) and
+                   "user_id" not in inspector.get_pk_constraint(table)["constrained_columns"]]
+        for table in renamed:
+            indexes = conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"
+            ), {"t": table}).scalars().all()
+            for index in indexes:
+                conn.execute(text(f'DROP INDEX "{index}"'))
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+    _upgrade_tables(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User).prefix_with("OR IGNORE").values(
+            id=models.DEFAULT_USER_ID, name="default"
+        ))
+        for table in renamed:
+            if _USER_KEYED[table]:
+                conn.execute(text(_USER_KEYED[table]), {"user": models.DEFAULT_USER_ID})
+            conn.execute(text(f"DROP TABLE {table}_old"))
+        # Step 1 added interactions.user_id, empty in the existing rows
+        conn.execute(text("UPDATE interactions SET user_id = :user WHERE user_id IS NULL"),
+                     {"user": models.DEFAULT_USER_ID})
+    if renamed:
+        with database.SessionLocal(bind=engine) as db:
+            rankings.rebuild_all(db)
+
+
+# (version, description, step(engine))
+MIGRATIONS = [
+    (1, "tables, columns and indexes", _upgrade_tables),
+    (2, "full-text search index", search.ensure_index),
+    (3, "author and category tables", _backfill_catalog),
+    (4, "per-day rankings with revisions", _build_rankings),
+    (5, "scores moved out of the papers table", _import_paper_scores),
+    (6, "user profiles", _add_users),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def _set_version(engine, version):
+    with engine.begin() as conn:
+        conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def migrate(engine=None):
+    """Brings the DB up to LATEST. Returns the versions applied."""
+    engine = engine or database.engine
+    version = current_version(engine)
+    applied = []
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        print(f"Migrating schema to version {step_version}: {description}...")
+        step(engine)
+        _set_version(engine, step_version)
+        applied.append(step_version)
+    return applied
@@ -0,0 +1,86 @@
+"""
+In-process cache of rendered list pages.
+
+Pages are keyed by "<user_id>:<date>" and carry a content-hash ETag, so a
+browser revisiting a day gets a 304 and the server skips both the queries
+and the template render. Anything that changes what a page shows calls
+invalidate(): fetches, training and new profiles drop every page, while a
+user's likes, Zotero adds, rollbacks and first view of a date drop only
+that user's pages (invalidate_prefix).
+
+A render reads epoch before its queries and hands it to put(); if any
+invalidation happened in between, the page may predate the change and is
+not stored.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+MAX_PAGES = 64
+
+
+class PageCache:
+    def __init__(self, max_pages=MAX_PAGES):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()  # key -> (etag, body)
+        self._lock = threading.Lock()
+        self.epoch = 0  # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body: bytes, epoch=None):
+        """
+        Stores a rendered page and returns its ETag. With epoch (read before
+        rendering), the page is only stored if nothing was invalidated since.
+        """
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return etag
+            self._pages[key] = (etag, body)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return etag
+
+    def invalidate(self, key=None):
+        """Drops one page, or every page when key is None."""
+        with self._lock:
+            self.epoch += 1
+            if key is None:
+                self._pages.clear()
+            else:
+                self._pages.pop(key, None)
+
+    def invalidate_prefix(self, prefix):
+        """Drops every page whose key starts with prefix, e.g. one user's "<user_id>:"."""
+        with self._lock:
+            self.epoch += 1
+            for key in [k for k in self._pages if k.startswith(prefix)]:
+                del self._pages[key]
+
+    def __len__(self):
+        return len(self._pages)
+
+
+pages = PageCache()
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Compare ignoring weak-validator prefixes added by proxies
+    candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag in candidates
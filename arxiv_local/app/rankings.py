@@ -0,0 +1,268 @@
+"""
+Materialized per-day rankings.
+
+The list view reads `day_ranks` (papers of one announcement date in a
+user's score order, with their like/Zotero flags) joined to `papers` in a
+single indexed query, and the sidebar reads `ranked_days`. Both are rebuilt
+incrementally for the dates touched by ingestion, scoring and cleanup (for
+every user, or just those whose scores changed); like/Zotero toggles only
+flip the flags of one row, and the rescoring after a like rewrites only the
+rows whose paper or score changed (rescore()).
+
+Every change to a day_ranks row stamps it with the next value of the
+ranking_revision counter (rows a rebuild leaves as they were keep their
+old stamp), so clients can ask for just the rows changed since the
+revision they rendered; see changes_since().
+"""
+from sqlalchemy import and_, bindparam, delete, exists, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+from .database import models
+
+# SQLite's bound-parameter limit is generous, but keep IN lists modest
+CHUNK = 500
+# Dates and users rebuilt per transaction, to keep write transactions short
+DAYS_PER_TRANSACTION = 30
+USERS_PER_TRANSACTION = 10
+
+
+def _chunks(items, size=CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _flag(column):
+    return exists().where(and_(
+        models.Interaction.paper_id == models.Paper.id,
+        models.Interaction.user_id == models.User.id,
+        column == True
+    ))
+
+
+def _all_users(db: Session):
+    return [uid for (uid,) in db.query(models.User.id).order_by(models.User.id)]
+
+
+def _next_revision(db: Session):
+    """Bumps the revision counter; the UPDATE comes first so it holds the write lock."""
+    bumped = db.execute(update(models.RankingRevision).where(models.RankingRevision.id == 1).values(
+        value=models.RankingRevision.value + 1
+    )).rowcount
+    if not bumped:
+        db.execute(insert(models.RankingRevision).values(id=1, value=1))
+    return db.query(models.RankingRevision.value).filter(models.RankingRevision.id == 1).scalar()
+
+
+def current_revision(db: Session):
+    return db.query(models.RankingRevision.value).filter(models.RankingRevision.id == 1).scalar() or 0
+
+
+def _rebuild_chunk(db: Session, dates, user_ids):
+    revision = _next_revision(db)
+    key = (models.DayRank.user_id, models.DayRank.date, models.DayRank.paper_id)
+    values = (models.DayRank.rank, models.DayRank.score, models.DayRank.is_liked, models.DayRank.is_zotero)
+    where = (models.DayRank.date.in_(dates), models.DayRank.user_id.in_(user_ids))
+    old = {(u, d, pid): rest for u, d, pid, *rest in db.query(*key, *values, models.DayRank.revision).filter(*where)}
+    db.execute(delete(models.DayRank).where(*where))
+
+    # Every user x every paper of the dates, each user ranked by the
+    # scores of the generation their pointer names
+    rank = func.row_number().over(
+        partition_by=(models.User.id, models.Paper.published_date),
+        order_by=(func.coalesce(models.Score.score, 0.0).desc(), models.Paper.id)
+    )
+    ranked = select(
+        models.User.id, models.Paper.published_date, rank, models.Paper.id,
+        _flag(models.Interaction.is_liked), _flag(models.Interaction.is_zotero),
+        models.Score.score, literal(revision)
+    ).select_from(models.Paper).join(models.User, models.User.id.in_(user_ids)).outerjoin(
+        models.ScorePointer, models.ScorePointer.id == models.User.id
+    ).outerjoin(models.Score, and_(
+        models.Score.generation == models.ScorePointer.generation,
+        models.Score.user_id == models.User.id,
+        models.Score.paper_id == models.Paper.id
+    )).where(models.Paper.published_date.in_(dates))
+    db.execute(insert(models.DayRank).from_select(
+        ["user_id", "date", "rank", "paper_id", "is_liked", "is_zotero", "score", "revision"], ranked
+    ))
+    # Rows the rebuild left as they were keep their revision
+    unchanged = []
+    for user_id, date, pid, *current in db.query(*key, *values).filter(*where):
+        previous = old.get((user_id, date, pid))
+        if previous and previous[:4] == current and previous[4] is not None:
+            unchanged.append({"user_id": user_id, "date": date, "rank": current[0], "revision": previous[4]})
+    if unchanged:
+        db.execute(update(models.DayRank), unchanged)
+
+
+def rebuild_days(db: Session, dates, user_ids=None):
+    """Recomputes the ranking of the given announcement dates (for user_ids, default all) from scratch."""
+    dates = {d for d in dates if d is not None}
+    all_users = user_ids is None
+    user_ids = _all_users(db) if all_users else list(user_ids)
+    for chunk in _chunks(sorted(dates), DAYS_PER_TRANSACTION):
+        for users in _chunks(user_ids, USERS_PER_TRANSACTION):
+            _rebuild_chunk(db, chunk, users)
+            db.commit()
+        if all_users:
+            # Also drops rows of users that no longer exist
+            db.execute(delete(models.DayRank).where(
+                models.DayRank.date.in_(chunk), models.DayRank.user_id.notin_(user_ids)
+            ))
+
+        db.execute(delete(models.RankedDay).where(models.RankedDay.date.in_(chunk)))
+        counts = select(
+            models.Paper.published_date, func.count(models.Paper.id)
+        ).where(models.Paper.published_date.in_(chunk)).group_by(models.Paper.published_date)
+        db.execute(insert(models.RankedDay).from_select(["date", "paper_count"], counts))
+        db.commit()
+    return len(dates)
+
+
+def rebuild_all(db: Session, user_ids=None):
+    dates = [d for (d,) in db.query(models.Paper.published_date).distinct()]
+    stale = [d for (d,) in db.query(models.RankedDay.date)]
+    return rebuild_days(db, set(dates) | set(stale), user_ids)
+
+
+def rebuild_for_papers(db: Session, paper_ids, user_ids=None):
+    """Rebuilds every date that contains one of paper_ids (e.g. after rescoring)."""
+    dates = set()
+    for chunk in _chunks(paper_ids):
+        dates.update(d for (d,) in db.query(models.Paper.published_date).filter(
+            models.Paper.id.in_(chunk)
+        ).distinct())
+    return rebuild_days(db, dates, user_ids)
+
+
+def rescore(db: Session, user_id, scores):
+    """
+    Applies new scores ({paper_id: score}) of user_id to their rankings,
+    e.g. after a like: the dates of those papers are re-sorted in memory
+    and only the rank slots whose paper or score changed are updated, in
+    one transaction. Returns the dates whose order changed.
+    """
+    dates = set()
+    for chunk in _chunks(scores):
+        dates.update(d for (d,) in db.query(models.Paper.published_date).filter(
+            models.Paper.id.in_(chunk)
+        ).distinct())
+    dates.discard(None)
+    if not dates:
+        return set()
+
+    table = models.DayRank.__table__
+    days = {}
+    for chunk in _chunks(sorted(dates)):
+        for row in db.execute(select(
+            table.c.date, table.c.rank, table.c.paper_id, table.c.is_liked, table.c.is_zotero, table.c.score
+        ).where(table.c.user_id == user_id, table.c.date.in_(chunk))):
+            days.setdefault(row.date, []).append(row)
+
+    revision = _next_revision(db)
+    reordered, rows = set(), []
+    for date, old in days.items():
+        old.sort(key=lambda r: r.rank)
+        # The order rebuild_days gives: score descending, then paper ID
+        new = sorted(((scores.get(r.paper_id, r.score), r) for r in old),
+                     key=lambda item: (-(item[0] or 0.0), item[1].paper_id))
+        for slot, (score, row) in zip(old, new):
+            if slot.paper_id == row.paper_id and slot.score == score:
+                continue  # keeps its revision
+            if slot.paper_id != row.paper_id:
+                reordered.add(date)
+            rows.append({"slot_date": date, "slot_rank": slot.rank, "paper_id": row.paper_id,
+                         "is_liked": row.is_liked, "is_zotero": row.is_zotero, "score": score})
+    if rows:
+        # Core executemany by primary key; the key (user, date, rank) itself never changes
+        db.execute(update(table).where(
+            table.c.user_id == user_id, table.c.date == bindparam("slot_date"),
+            table.c.rank == bindparam("slot_rank")
+        ).values(revision=revision), rows)
+    db.commit()
+    return reordered
+
+
+def set_flags(db: Session, paper_ids, user_id, **flags):
+    """
+    Mirrors an interaction change (is_liked=/is_zotero=) of user_id into
+    their ranking. paper_ids is a single ID or a list of them.
+    """
+    if isinstance(paper_ids, str):
+        paper_ids = [paper_ids]
+    revision = _next_revision(db)
+    for chunk in _chunks(paper_ids):
+        db.execute(update(models.DayRank).where(
+            models.DayRank.user_id == user_id, models.DayRank.paper_id.in_(chunk)
+        ).values(revision=revision, **flags))
+    db.commit()
+
+
+def ensure_built(db: Session):
+    """Builds the rankings once for a DB created before they (or their revision stamps) existed."""
+    if db.query(models.RankedDay.date).first() is None and db.query(models.Paper.id).first() is not None:
+        print("Building per-day rankings...")
+        rebuild_all(db)
+    elif db.query(models.DayRank.date).filter(models.DayRank.revision.is_(None)).first() is not None:
+        print("Stamping per-day rankings with revisions...")
+        rebuild_all(db)
+
+
+def latest_date(db: Session):
+    return db.query(func.max(models.RankedDay.date)).scalar()
+
+
+def get_day(db: Session, date, user_id, offset=0, limit=None):
+    """
+    Returns [(Paper, is_liked, is_zotero, score), ...] for a date in
+    user_id's ranked order (optionally one page).
+    """
+    query = db.query(models.Paper, models.DayRank.is_liked, models.DayRank.is_zotero, models.DayRank.score).join(
+        models.DayRank, models.DayRank.paper_id == models.Paper.id
+    ).filter(
+        models.DayRank.user_id == user_id,
+        models.DayRank.date == date
+    ).order_by(models.DayRank.rank)
+    if offset:
+        query = query.filter(models.DayRank.rank > offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def day_count(db: Session, date):
+    return db.query(models.RankedDay.paper_count).filter(models.RankedDay.date == date).scalar() or 0
+
+
+def changes_since(db: Session, revision, user_id, date=None):
+    """
+    Returns (current revision, [(date, rank, paper_id, score, is_liked,
+    is_zotero), ...]) for user_id's day_ranks rows changed after revision,
+    optionally for one date only.
+    """
+    current = current_revision(db)
+    query = db.query(
+        models.DayRank.date, models.DayRank.rank, models.DayRank.paper_id, models.DayRank.score,
+        models.DayRank.is_liked, models.DayRank.is_zotero
+    ).filter(models.DayRank.user_id == user_id, models.DayRank.revision > revision)
+    if date is not None:
+        query = query.filter(models.DayRank.date == date)
+    return current, query.order_by(models.DayRank.date, models.DayRank.rank).all()
+
+
+def day_order(db: Session, date, user_id):
+    """Paper IDs of a date in user_id's ranked order."""
+    return [pid for (pid,) in db.query(models.DayRank.paper_id).filter(
+        models.DayRank.user_id == user_id,
+        models.DayRank.date == date
+    ).order_by(models.DayRank.rank)]
+
+
+def get_history(db: Session, user_id, limit=60):
+    """Returns [(date, is_viewed), ...] for the most recent dates with papers."""
+    return db.query(
+        models.RankedDay.date, models.ViewedDate.date.isnot(None)
+    ).outerjoin(models.ViewedDate, and_(
+        models.ViewedDate.user_id == user_id,
+        models.ViewedDate.date == models.RankedDay.date
+    )).order_by(models.RankedDay.date.desc()).limit(limit).all()
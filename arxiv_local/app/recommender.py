@@ -1,54 +1,679 @@
+import json
+import os
+import pickle
+import threading
+import uuid
+
 from sqlalchemy.orm import Session
-from .database import models
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from .database import models, database
+from . import rankings, scores as score_store, similarity, features, metrics
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer
 import numpy as np
+import scipy.sparse as sp
+
+# Fitted vocabulary/IDF, document-term matrix and user profile live here,
+# next to the SQLite file.
+STATE_DIR = os.getenv("ARXIV_LOCAL_STATE_DIR", "./recommender_state")
+
+# Refit the vocabulary once the corpus has grown by this fraction since the
+# last full fit; until then new papers are transformed with the old IDF.
+REFIT_GROWTH = 0.5
+
+# Scores that move less than this count as unchanged (their rankings are
+# not rebuilt).
+SCORE_EPS = 1e-6
+# A like moves nearly every score a little; it only writes back scores that
+# moved more than this. The list shows two decimals, so the rest still show
+# the right value to within one in the last digit, and the next training
+# run rewrites them all.
+LIKE_SCORE_EPS = float(os.getenv("ARXIV_LOCAL_LIKE_SCORE_EPS", "5e-3"))
+
+TEXT_BATCH = 500
+
+# "tfidf" fits a TfidfVectorizer (5000 terms) in-process; "hashing" hashes
+# the full vocabulary in a process pool and keeps the term counts in a
+# feature store (see features.py), which suits large backfills.
+FEATURIZER = os.getenv("ARXIV_LOCAL_FEATURIZER", "tfidf")
+
+# "mean" scores against the average liked vector; "clusters" clusters the
+# liked papers and scores each paper by its best-matching cluster centroid,
+# so separate interests (say exoplanets and cosmology) do not blur together.
+PROFILE_MODE = os.getenv("ARXIV_LOCAL_PROFILE_MODE", "mean")
+MAX_CENTROIDS = 8
+MIN_CLUSTER_SIZE = 2
+# Liked rows are clustered in a small LSA space, where topic structure is
+# far clearer than in the raw sparse vectors
+CLUSTER_DIMS = 10
+# Below this silhouette (cosine) a split is not worth it; one centroid is used
+MIN_SILHOUETTE = 0.2
+
+# Negative feedback: the score is reduced by weight * similarity to the
+# mean of unliked papers (liked, then unliked again) and of skipped papers
+# (shown on a viewed day but not liked). 0 disables either.
+UNLIKED_WEIGHT = float(os.getenv("ARXIV_LOCAL_UNLIKED_WEIGHT", "0"))
+SKIPPED_WEIGHT = float(os.getenv("ARXIV_LOCAL_SKIPPED_WEIGHT", "0"))
+
+# The stacked profile vectors of all users are multiplied as a dense array
+# when it has at most this many entries (hashed features are too wide)
+DENSE_PROFILE_LIMIT = 10_000_000
+
+
+_paper_text = features.paper_text
+
+
+def _unit(vec):
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else None
+
+
+def _unit_row(row):
+    """A sparse (1, n) row scaled to unit length, or None if it is zero."""
+    row = sp.csr_matrix(row)
+    norm = np.sqrt(np.square(row.data).sum())
+    return row / norm if norm else None
+
+
+def cluster_profile(liked_rows, max_k=MAX_CENTROIDS):
+    """
+    Clusters L2-normalised liked rows with k-means in a CLUSTER_DIMS LSA
+    space, choosing k in 2..max_k by cosine silhouette (k=1 if no split
+    reaches MIN_SILHOUETTE). Returns a dense (k, n_features) array of the
+    unit-length mean rows of each cluster.
+    """
+    # Kept sparse: with hashed features a dense copy would be huge
+    rows = sp.csr_matrix(liked_rows)
+    labels = np.zeros(rows.shape[0], dtype=int)
+    dims = min(CLUSTER_DIMS, rows.shape[0] - 1, rows.shape[1] - 1)
+    if rows.shape[0] >= 2 * MIN_CLUSTER_SIZE and dims >= 2:
+        from sklearn.cluster import KMeans
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.metrics import silhouette_score
+        from sklearn.preprocessing import normalize
+
+        reduced = normalize(TruncatedSVD(n_components=dims, random_state=0).fit_transform(rows))
+        best = MIN_SILHOUETTE
+        for k in range(2, min(max_k, rows.shape[0] // MIN_CLUSTER_SIZE) + 1):
+            candidate = KMeans(n_clusters=k, n_init=4, random_state=0).fit_predict(reduced)
+            if len(set(candidate)) < 2:
+                continue
+            quality = silhouette_score(reduced, candidate, metric="cosine")
+            if quality > best:
+                best, labels = quality, candidate
+    centroids = [_unit(np.asarray(rows[labels == c].sum(axis=0)).ravel()) for c in np.unique(labels)]
+    return np.vstack([c for c in centroids if c is not None])
+
+
+def _atomic_write(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class Profile:
+    """One user's liked papers, negative feedback and last published scores."""
+
+    def __init__(self, user_id, n_papers):
+        self.user_id = user_id
+        self.liked_ids = set()
+        # Running sum of the liked rows, a sparse (1, n_features) row
+        self.profile_sum = None
+        self.unliked_ids = set()
+        self.skipped_ids = set()
+        self._centroids = (frozenset(), None)
+        # NaN marks "unknown in DB", so the first scoring pass writes it.
+        self.scores = np.full(n_papers, np.nan)
+        # Score generation the scores were published as
+        self.generation = None
+
+
+class ScoringIndex:
+    """
+    Persisted TF-IDF state shared by all users: the fitted vectorizer and
+    an L2-normalised sparse document-term matrix (one row per paper), plus
+    a Profile per user.
+    """
+
+    def __init__(self, vectorizer, matrix, paper_ids, n_fit, fit_stamp=None, featurizer="tfidf"):
+        # A TfidfVectorizer, or a TfidfTransformer over hashed counts
+        self.vectorizer = vectorizer
+        self.featurizer = featurizer
+        # Identifies the vocabulary; derived state (similarity vectors) is
+        # rebuilt when it changes.
+        self.fit_stamp = fit_stamp
+        self.matrix = sp.csr_matrix(matrix)
+        self.paper_ids = list(paper_ids)
+        self.row_of = {pid: i for i, pid in enumerate(self.paper_ids)}
+        self.n_fit = n_fit
+        self.profiles = {}
+        # Papers transformed with their full-text excerpt (see fulltext.py),
+        # and those re-transformed by the last sync
+        self.full_text = set()
+        self.refreshed = set()
+
+    # --- Persistence ---
+
+    @classmethod
+    def load(cls, state_dir=STATE_DIR):
+        try:
+            with open(os.path.join(state_dir, "vectorizer.pkl"), "rb") as f:
+                vectorizer = pickle.load(f)
+            matrix = sp.load_npz(os.path.join(state_dir, "matrix.npz"))
+            with open(os.path.join(state_dir, "papers.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError, pickle.UnpicklingError):
+            return None
+
+        index = cls(vectorizer, matrix, meta["ids"], meta["n_fit"], meta.get("fit_stamp"),
+                    meta.get("featurizer", "tfidf"))
+        index.full_text = set(meta.get("full_text", []))
+        try:
+            saved = np.load(os.path.join(state_dir, "profile.npz"))
+            index._load_profiles(saved)
+        except (OSError, ValueError, KeyError):
+            pass
+        return index
+
+    def _load_profiles(self, saved):
+        if "users" in saved:
+            users = saved["users"].tolist()
+            generations = saved["generations"].tolist()
+            liked_user, liked = saved["liked_user"].tolist(), saved["liked"].tolist()
+            scores = saved["scores"]
+        else:
+            # Single-user state from before profiles
+            users = [models.DEFAULT_USER_ID]
+            generations = [int(saved["generation"]) if "generation" in saved else -1]
+            liked = saved["liked"].tolist()
+            liked_user = [models.DEFAULT_USER_ID] * len(liked)
+            scores = saved["scores"][None, :]
+        liked_by_user = {user_id: set() for user_id in users}
+        for user_id, pid in zip(liked_user, liked):
+            liked_by_user[user_id].add(pid)
+        self.set_likes(liked_by_user)
+        for i, user_id in enumerate(users):
+            profile = self.profiles[user_id]
+            if scores.shape[1] == len(self.paper_ids):
+                profile.scores = scores[i]
+                profile.generation = generations[i] if generations[i] >= 0 else None
+
+    def save(self, state_dir=STATE_DIR, matrix=True):
+        os.makedirs(state_dir, exist_ok=True)
+        if matrix:
+            _atomic_write(os.path.join(state_dir, "vectorizer.pkl"),
+                          lambda f: pickle.dump(self.vectorizer, f))
+            _atomic_write(os.path.join(state_dir, "matrix.npz"),
+                          lambda f: sp.save_npz(f, self.matrix))
+            meta = {"ids": self.paper_ids, "n_fit": self.n_fit, "fit_stamp": self.fit_stamp,
+                    "featurizer": self.featurizer, "full_text": sorted(self.full_text)}
+            _atomic_write(os.path.join(state_dir, "papers.json"),
+                          lambda f: f.write(json.dumps(meta).encode()))
+        self.save_profile(state_dir)
+
+    def save_profile(self, state_dir=STATE_DIR):
+        os.makedirs(state_dir, exist_ok=True)
+        users = sorted(self.profiles)
+        liked = [(user_id, pid) for user_id in users for pid in sorted(self.profiles[user_id].liked_ids)]
+        scores = [self.profiles[user_id].scores for user_id in users]
+        generations = [self.profiles[user_id].generation for user_id in users]
+        _atomic_write(os.path.join(state_dir, "profile.npz"), lambda f: np.savez(
+            f, users=np.array(users, dtype=int),
+            liked_user=np.array([user_id for user_id, _ in liked], dtype=int),
+            liked=np.array([pid for _, pid in liked], dtype=str),
+            scores=np.vstack(scores) if scores else np.empty((0, len(self.paper_ids))),
+            generations=np.array([-1 if g is None else g for g in generations], dtype=int)
+        ))
+
+    # --- Corpus maintenance ---
+
+    @classmethod
+    def fit(cls, db: Session, featurizer=None):
+        if (featurizer or FEATURIZER) == "hashing":
+            return cls._fit_hashing(db)
+        rows = features.text_query(db).all()
+        if not rows:
+            return None
+        vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+        matrix = vectorizer.fit_transform([_paper_text(t, a, b) for _, t, a, b in rows])
+        # The pruned-term set is only needed for introspection and is large.
+        vectorizer.stop_words_ = None
+        index = cls(vectorizer, matrix, [r[0] for r in rows], len(rows), uuid.uuid4().hex)
+        index.full_text = {r[0] for r in rows if r[3]}
+        return index
+
+    @classmethod
+    def _fit_hashing(cls, db: Session):
+        # Only papers missing from the feature store are tokenized; the IDF
+        # is refit from the stored counts
+        store = _feature_store()
+        ids = [r[0] for r in db.query(models.Paper.id)]
+        store.sync(db, ids)
+        ids = [pid for pid in ids if pid in store.row_of]
+        if not ids:
+            return None
+        counts = store.rows(ids)
+        transformer = TfidfTransformer().fit(counts)
+        index = cls(transformer, transformer.transform(counts), ids, len(ids), uuid.uuid4().hex, "hashing")
+        index.full_text = store.full_text & set(ids)
+        return index
+
+    def needs_refit(self):
+        return len(self.paper_ids) > self.n_fit * (1 + REFIT_GROWTH)
+
+    def sync(self, db: Session):
+        """
+        Brings the matrix in line with the papers table: rows for pruned
+        papers are dropped, and new papers (and those whose full text
+        arrived since they were transformed) are transformed and appended.
+        Returns True if the matrix changed.
+        """
+        db_ids = {r[0] for r in db.query(models.Paper.id)}
+        changed = False
+        if self.featurizer == "hashing":
+            store = _feature_store()
+            store.sync(db, sorted(db_ids))
+            with_text = store.full_text
+        else:
+            with_text = features.full_text_ids(db)
+        self.refreshed = {pid for pid in self.paper_ids
+                          if pid in db_ids and (pid in with_text) != (pid in self.full_text)}
+
+        keep = [i for i, pid in enumerate(self.paper_ids) if pid in db_ids and pid not in self.refreshed]
+        if len(keep) != len(self.paper_ids):
+            self._take_rows(keep)
+            changed = True
+
+        new_ids = sorted(db_ids.difference(self.row_of))
+        if new_ids:
+            self.add_papers(db, new_ids)
+            changed = True
+        self.full_text = with_text & set(self.row_of)
+        return changed
+
+    def add_papers(self, db: Session, new_ids):
+        if self.featurizer == "hashing":
+            store = _feature_store()
+            store.featurize(db, new_ids)
+            ids = [pid for pid in new_ids if pid in store.row_of]
+            blocks = [self.vectorizer.transform(store.rows(ids))] if ids else []
+        else:
+            ids, blocks = self._transform_texts(db, new_ids)
+        if not ids:
+            return
+        self.matrix = sp.vstack([self.matrix] + blocks, format="csr")
+        for pid in ids:
+            self.row_of[pid] = len(self.paper_ids)
+            self.paper_ids.append(pid)
+        for profile in self.profiles.values():
+            profile.scores = np.concatenate([profile.scores, np.full(len(ids), np.nan)])
 
-def train_and_score(db: Session):
+    def _transform_texts(self, db: Session, new_ids):
+        ids, blocks = [], []
+        for start in range(0, len(new_ids), TEXT_BATCH):
+            chunk = new_ids[start:start + TEXT_BATCH]
+            rows = features.text_query(db).filter(models.Paper.id.in_(chunk)).all()
+            if not rows:
+                continue
+            ids.extend(r[0] for r in rows)
+            blocks.append(self.vectorizer.transform([_paper_text(t, a, b) for _, t, a, b in rows]))
+        return ids, blocks
+
+    def _take_rows(self, keep):
+        self.matrix = self.matrix[keep]
+        self.paper_ids = [self.paper_ids[i] for i in keep]
+        self.row_of = {pid: i for i, pid in enumerate(self.paper_ids)}
+        # Liked papers are never pruned, but keep the profiles honest anyway.
+        liked_by_user = {}
+        for user_id, profile in self.profiles.items():
+            profile.scores = profile.scores[keep]
+            profile._centroids = (frozenset(), None)
+            liked_by_user[user_id] = {pid for pid in profile.liked_ids if pid in self.row_of}
+            profile.liked_ids, profile.profile_sum = set(), None
+        self.set_likes(liked_by_user)
+
+    # --- User profiles ---
+
+    def profile(self, user_id):
+        if user_id not in self.profiles:
+            self.profiles[user_id] = Profile(user_id, len(self.paper_ids))
+        return self.profiles[user_id]
+
+    def _row_sums(self, id_sets):
+        """Sums of the rows of each set of paper IDs, as one sparse (len(id_sets), n_features) product."""
+        rows, cols = [], []
+        for i, paper_ids in enumerate(id_sets):
+            found = [self.row_of[pid] for pid in paper_ids if pid in self.row_of]
+            rows.extend([i] * len(found))
+            cols.extend(found)
+        selector = sp.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(id_sets), len(self.paper_ids)))
+        return sp.csr_matrix(selector @ self.matrix)
+
+    def set_likes(self, liked_by_user):
+        """Sets {user_id: liked paper IDs}; the changed profiles are summed in one product."""
+        changed = {}
+        for user_id, liked_ids in liked_by_user.items():
+            liked_ids = {pid for pid in liked_ids if pid in self.row_of}
+            profile = self.profile(user_id)
+            if liked_ids != profile.liked_ids or profile.profile_sum is None:
+                changed[user_id] = liked_ids
+        if not changed:
+            return
+        sums = self._row_sums(list(changed.values()))
+        for i, (user_id, liked_ids) in enumerate(changed.items()):
+            profile = self.profiles[user_id]
+            profile.liked_ids = liked_ids
+            profile.profile_sum = sums[i]
+
+    def toggle_like(self, user_id, paper_id, is_liked):
+        """Running-sum update of a profile. Returns False if nothing changed."""
+        profile = self.profile(user_id)
+        row = self.row_of.get(paper_id)
+        if row is None or (paper_id in profile.liked_ids) == is_liked:
+            return False
+        if profile.profile_sum is None:
+            profile.profile_sum = self._row_sums([profile.liked_ids])
+        if is_liked:
+            profile.liked_ids.add(paper_id)
+            profile.profile_sum = profile.profile_sum + self.matrix[row]
+        else:
+            profile.liked_ids.discard(paper_id)
+            profile.profile_sum = profile.profile_sum - self.matrix[row]
+        return True
+
+    def set_negatives(self, negatives_by_user):
+        """Sets {user_id: (unliked paper IDs, skipped paper IDs)}."""
+        for user_id, (unliked_ids, skipped_ids) in negatives_by_user.items():
+            profile = self.profile(user_id)
+            profile.unliked_ids = {pid for pid in unliked_ids if pid in self.row_of}
+            profile.skipped_ids = {pid for pid in skipped_ids if pid in self.row_of}
+
+    def centroids(self, user_id):
+        """Cluster centroids of a user's liked papers, cached until their likes change."""
+        profile = self.profile(user_id)
+        liked = frozenset(profile.liked_ids)
+        if profile._centroids[0] != liked or profile._centroids[1] is None:
+            rows = sorted(self.row_of[pid] for pid in liked)
+            profile._centroids = (liked, cluster_profile(self.matrix[rows]))
+        return profile._centroids[1]
+
+    # --- Scoring ---
+
+    def _profile_vectors(self, user_id, mode):
+        """(positive unit rows, negative unit rows, negative weights) of a user, or None."""
+        profile = self.profile(user_id)
+        if not profile.liked_ids:
+            return None
+        if mode == "clusters":
+            positive = sp.csr_matrix(self.centroids(user_id))
+        else:
+            positive = _unit_row(profile.profile_sum)
+            if positive is None:
+                return None
+
+        negative, weights = [], []
+        for paper_ids, weight in ((profile.unliked_ids, UNLIKED_WEIGHT), (profile.skipped_ids, SKIPPED_WEIGHT)):
+            vec = _unit_row(self._row_sums([paper_ids])) if weight and paper_ids else None
+            if vec is not None:
+                negative.append(vec)
+                weights.append(weight)
+        return positive, negative, weights
+
+    def compute_scores(self, mode=None, user_ids=None):
+        """
+        Scores every paper for every user with likes (or just user_ids) in
+        one sparse product: the unit profile vectors of all users (each
+        user's positive centroid(s) followed by their negative-feedback
+        means) are stacked into one matrix. Rows are L2-normalised, so these
+        are cosine similarities; a paper's score is its best positive
+        similarity minus the weighted negative ones. Returns {user_id:
+        scores}.
+        """
+        mode = mode or PROFILE_MODE
+        blocks, layout, width = [], [], 0
+        for user_id in (sorted(self.profiles) if user_ids is None else user_ids):
+            vectors = self._profile_vectors(user_id, mode)
+            if vectors is None:
+                continue
+            positive, negative, weights = vectors
+            blocks.extend([positive] + negative)
+            layout.append((user_id, width, positive.shape[0], np.array(weights)))
+            width += positive.shape[0] + len(negative)
+        if not layout:
+            return {}
+
+        stacked = sp.vstack(blocks, format="csr")
+        if stacked.shape[0] * stacked.shape[1] <= DENSE_PROFILE_LIMIT:
+            stacked = stacked.toarray()
+        sims = self.matrix @ stacked.T
+        sims = sims.toarray() if sp.issparse(sims) else np.asarray(sims)
+        result = {}
+        for user_id, start, k, weights in layout:
+            scores = sims[:, start:start + k].max(axis=1)
+            if len(weights):
+                scores = scores - sims[:, start + k:start + k + len(weights)] @ weights
+            result[user_id] = scores
+        return result
+
+    def write_scores(self, scores_by_user, source="train"):
+        """
+        Publishes the users of {user_id: scores} whose scores moved as one
+        new score generation (see scores.py), or none if nobody's did, and
+        rebuilds the rankings of the papers whose score moved, for those
+        users. Returns the number of changed (user, paper) scores.
+        """
+        current = database.writer.run(score_store.current_generations)
+        changed_by_user = {}
+        for user_id, new_scores in scores_by_user.items():
+            profile = self.profiles[user_id]
+            if profile.generation is None or current.get(user_id) != profile.generation:
+                # Someone else published (or rolled back) since: compare against nothing
+                changed = np.ones(len(self.paper_ids), dtype=bool)
+            else:
+                changed = ~(np.abs(new_scores - profile.scores) <= SCORE_EPS)
+            if changed.any():
+                changed_by_user[user_id] = changed
+        if not changed_by_user:
+            # An unchanged retrain would only push real generations out of KEEP_GENERATIONS
+            return 0
+
+        generation, previous = score_store.publish(
+            self.paper_ids, {user_id: scores_by_user[user_id] for user_id in changed_by_user}, source
+        )
+        changed_rows, updated = set(), 0
+        for user_id, changed in changed_by_user.items():
+            profile = self.profiles[user_id]
+            if previous[user_id] != profile.generation:
+                # Switched by someone else between the comparison and publish()
+                changed = np.ones(len(self.paper_ids), dtype=bool)
+            rows = np.flatnonzero(changed)
+            changed_rows.update(rows.tolist())
+            updated += len(rows)
+            profile.scores = np.asarray(scores_by_user[user_id], dtype=float)
+            profile.generation = generation
+        database.writer.run(rankings.rebuild_for_papers, [self.paper_ids[i] for i in sorted(changed_rows)],
+                            list(changed_by_user))
+        return updated
+
+    def update_scores(self, user_id, new_scores):
+        """
+        Writes back just the scores of user_id that moved by more than
+        LIKE_SCORE_EPS (see scores.upsert) and updates their rankings in
+        place (see rankings.rescore). Used for likes; a user without a
+        generation yet gets one from write_scores. Returns the number of
+        changed scores.
+        """
+        profile = self.profiles[user_id]
+        changed = np.flatnonzero(~(np.abs(new_scores - profile.scores) <= LIKE_SCORE_EPS))
+        generation, rows = score_store.upsert(user_id, self.paper_ids, new_scores, changed, profile.generation)
+        if generation is None:
+            return self.write_scores({user_id: new_scores}, source="like")
+        rows = np.asarray(rows, dtype=int)
+        # Unwritten rows keep the value the DB has, so later likes are compared with it
+        profile.scores[rows] = new_scores[rows]
+        profile.generation = generation
+        if len(rows):
+            database.writer.run(rankings.rescore, user_id,
+                                {self.paper_ids[i]: float(new_scores[i]) for i in rows})
+        return len(rows)
+
+
+_index = None
+_index_lock = threading.Lock()
+_store = None
+
+
+def _feature_store():
+    global _store
+    if _store is None:
+        _store = features.FeatureStore.load()
+    return _store
+
+
+def _user_ids(db: Session):
+    return [uid for (uid,) in db.query(models.User.id).order_by(models.User.id)]
+
+
+def _liked_ids(db: Session, user_ids):
+    """{user_id: liked paper IDs} for user_ids."""
+    liked = {user_id: set() for user_id in user_ids}
+    for user_id, pid in db.query(models.Interaction.user_id, models.Interaction.paper_id).filter(
+        models.Interaction.is_liked == True,
+        models.Interaction.user_id.in_(user_ids)
+    ):
+        liked[user_id].add(pid)
+    return liked
+
+
+def _negative_ids(db: Session, user_ids):
+    """{user_id: (unliked, skipped) paper IDs}, only querying the enabled kinds."""
+    unliked = {user_id: set() for user_id in user_ids}
+    skipped = {user_id: set() for user_id in user_ids}
+    if UNLIKED_WEIGHT:
+        # Zotero-only interactions are not negative
+        for user_id, pid in db.query(models.Interaction.user_id, models.Interaction.paper_id).filter(
+            models.Interaction.is_liked == False,
+            models.Interaction.is_zotero == False,
+            models.Interaction.user_id.in_(user_ids)
+        ):
+            unliked[user_id].add(pid)
+    if SKIPPED_WEIGHT:
+        interacted = set(db.query(models.Interaction.user_id, models.Interaction.paper_id).filter(
+            models.Interaction.user_id.in_(user_ids)
+        ))
+        for user_id, pid in db.query(models.ViewedDate.user_id, models.Paper.id).join(
+            models.Paper, models.Paper.published_date == models.ViewedDate.date
+        ).filter(models.ViewedDate.user_id.in_(user_ids)):
+            if (user_id, pid) not in interacted:
+                skipped[user_id].add(pid)
+    return {user_id: (unliked[user_id], skipped[user_id]) for user_id in user_ids}
+
+
+def _get_index(db: Session, full=False, sync=True):
+    """Returns the in-memory index, loading or (re)fitting it as needed."""
+    global _index
+    if _index is None and not full:
+        _index = ScoringIndex.load()
+        sync = True
+    matrix_changed = False
+    if _index is not None and not full and sync:
+        matrix_changed = _index.sync(db)
+    if _index is None or full or _index.needs_refit() or _index.featurizer != FEATURIZER:
+        print(f"Fitting TF-IDF ({FEATURIZER}) on the full corpus...")
+        _index = ScoringIndex.fit(db)
+        matrix_changed = True
+    if _index is not None and matrix_changed:
+        _index.save(matrix=True)
+    if _index is not None and (matrix_changed or similarity.get_index() is None):
+        similarity.sync(_index.matrix, _index.paper_ids, _index.fit_stamp, _index.refreshed)
+    return _index
+
+
+def train_and_score(db: Session, full: bool = False, progress=None):
+    """
+    Brings the persisted TF-IDF index up to date with the papers table and
+    rescores every paper for every user with likes, against their
+    liked-paper profile (see PROFILE_MODE) and any enabled negative
+    feedback, in one batched product; the scores of all users are published
+    as one new score generation. With full=True the vocabulary is refit
+    from scratch. progress(stage=...) is called as it moves through
+    indexing, scoring and writing. Returns the number of updated scores.
+    """
+    progress = progress or (lambda **kwargs: None)
     print("Starting recommendation training...")
-    
-    # 1. Get all papers to build vocabulary (or just recent ones to save memory)
-    # For a local tool, 10k-20k papers is manageable. 
-    # Let's limit to last 30 days for vocabulary to keep it fast, or all if small.
-    all_papers = db.query(models.Paper).all()
-    if not all_papers:
-        print("No papers to train on.")
-        return
-
-    # 2. Get liked papers
-    liked_interactions = db.query(models.Interaction).filter(models.Interaction.is_liked == True).all()
-    liked_ids = {i.paper_id for i in liked_interactions}
-    
-    if not liked_ids:
-        print("No liked papers to build profile. Skipping.")
-        return
-
-    # Prepare corpus
-    # We combine title and abstract
-    corpus = [f"{p.title} {p.abstract}" for p in all_papers]
-    paper_id_to_idx = {p.id: i for i, p in enumerate(all_papers)}
-    
-    # 3. Vectorize
-    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-    tfidf_matrix = vectorizer.fit_transform(corpus)
-    
-    # 4. Build User Profile
-    # Get indices of liked papers
-    liked_indices = [paper_id_to_idx[pid] for pid in liked_ids if pid in paper_id_to_idx]
-    
-    if not liked_indices:
-        return
-
-    # User vector is the mean of liked paper vectors
-    user_vector = np.asarray(tfidf_matrix[liked_indices].mean(axis=0))
-    
-    # 5. Calculate Similarity for ALL papers
-    # cosine_similarity expects 2D arrays
-    scores = cosine_similarity(user_vector, tfidf_matrix).flatten()
-    
-    # 6. Update DB
-    for i, paper in enumerate(all_papers):
-        paper.score = float(scores[i])
-    
-    db.commit()
-    print("Recommendation scores updated.")
+    with _index_lock:
+        progress(stage="indexing")
+        with metrics.span("vectorize"):
+            index = _get_index(db, full=full)
+        if index is None:
+            print("No papers to train on.")
+            return 0
+
+        user_ids = _user_ids(db)
+        index.set_likes(_liked_ids(db, user_ids))
+        index.set_negatives(_negative_ids(db, user_ids))
+        progress(stage="scoring", papers=len(index.paper_ids), users=len(user_ids))
+        with metrics.span("score"):
+            scores = index.compute_scores(user_ids=user_ids)
+        if not scores:
+            print("No liked papers to build profile. Skipping.")
+            index.save_profile()
+            return 0
+
+        progress(stage="writing scores")
+        with metrics.span("publish_scores"):
+            updated = index.write_scores(scores)
+        index.save_profile()
+    print(f"Recommendation scores updated for {len(scores)} users ({updated} changed).")
+    return updated
+
+
+def record_interaction(db: Session, paper_id: str, is_liked: bool, user_id=models.DEFAULT_USER_ID):
+    """
+    Applies a single like/unlike to user_id's profile running sum and
+    writes back the scores that moved. Returns the number of updated scores.
+    """
+    with _index_lock:
+        index = _get_index(db, sync=False)
+        if index is not None and paper_id not in index.row_of:
+            index = _get_index(db)
+        if index is None or paper_id not in index.row_of:
+            return 0
+        if user_id not in index.profiles:
+            # First use since the index was loaded: the likes (this one
+            # included) come from the DB
+            index.set_likes(_liked_ids(db, [user_id]))
+        elif not index.toggle_like(user_id, paper_id, is_liked):
+            return 0
+        if UNLIKED_WEIGHT or SKIPPED_WEIGHT:
+            index.set_negatives(_negative_ids(db, [user_id]))
+        with metrics.span("rescore_like"):
+            scores = index.compute_scores(user_ids=[user_id])
+            updated = index.update_scores(user_id, scores[user_id]) if scores else 0
+        index.save_profile()
+    return updated
+
+
+def similar_papers(db: Session, paper_id: str, k: int = 10):
+    """
+    Returns [(paper_id, similarity), ...] for the k papers closest to
+    paper_id, or None if the paper is not indexed. Builds the indexes on
+    first use; otherwise they are kept current by scoring runs.
+    """
+    vectors = similarity.get_index()
+    if vectors is None or paper_id not in vectors.row_of:
+        with _index_lock:
+            _get_index(db)
+        vectors = similarity.get_index()
+    if vectors is None:
+        return None
+    return vectors.neighbours(paper_id, k=k)
+
+
+def reset_index():
+    """Drops the in-memory index so the next call reloads it from disk."""
+    global _index, _store
+    with _index_lock:
+        _index = None
+        _store = None
+        similarity.reset()
+
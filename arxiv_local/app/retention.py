@@ -0,0 +1,298 @@
+"""
+Retention: pruning old papers in small transactions, with an optional archive.
+
+Papers older than the retention window (and not liked) are deleted
+DELETE_CHUNK at a time, each chunk in its own short transaction on the
+serialized writer, so likes and page loads are never blocked for long.
+Their catalog links, scores, day_ranks rows, interactions and Zotero queue entries
+go with them. With ARXIV_LOCAL_ARCHIVE_DIR set, every chunk is first
+appended to a compressed JSONL file per announcement month
+(papers-YYYY-MM.jsonl.zst, or .gz when zstandard is not installed), which
+restore() re-imports through the normal ingestion path.
+
+Freed pages are returned to the filesystem with incremental vacuum, also
+in steps. Run from the command line:
+
+    python -m arxiv_local.app.retention prune --days 90
+    python -m arxiv_local.app.retention restore --month 2026-01
+"""
+import argparse
+import datetime
+import glob
+import gzip
+import io
+import json
+import os
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import catalog, fetcher, migrations, rankings, scores
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_DIR = os.getenv("ARXIV_LOCAL_ARCHIVE_DIR", "")
+# Papers deleted (and archived) per transaction
+DELETE_CHUNK = 500
+# Pages released per incremental_vacuum step (4 MB with 4 KiB pages)
+VACUUM_PAGES = 1000
+RESTORE_BATCH = fetcher.INGEST_BATCH
+
+ARCHIVE_COLUMNS = ("id", "title", "authors", "abstract", "published_date", "updated_date",
+                   "arxiv_category", "link", "submitted_at")
+
+
+# --- Database size and vacuum ---
+
+def _pragma(conn, name):
+    return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def db_size(db: Session):
+    """Returns {"bytes": file size in pages, "free_bytes": unused pages} (SQLite only)."""
+    conn = db.connection()
+    page_size = _pragma(conn, "page_size")
+    return {"bytes": _pragma(conn, "page_count") * page_size,
+            "free_bytes": _pragma(conn, "freelist_count") * page_size}
+
+
+def _megabytes(size):
+    return size["bytes"] / 1e6
+
+
+def _enable_incremental_vacuum(db: Session):
+    # Switching an existing file to incremental mode takes one full VACUUM,
+    # which cannot run inside a transaction
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if _pragma(conn, "auto_vacuum") == 2:
+            return False
+        print("Enabling incremental vacuum (one-off full VACUUM)...")
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+    return True
+
+
+def _vacuum_step(db: Session, pages):
+    # sqlite3's execute() steps a statement only once, which frees a single
+    # page; executescript() runs the pragma to completion
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return _pragma(conn, "freelist_count")
+
+
+def vacuum(pages=VACUUM_PAGES):
+    """Releases free pages VACUUM_PAGES at a time. Returns the number of steps."""
+    if database.engine.dialect.name != "sqlite":
+        return 0
+    if database.writer.run(_enable_incremental_vacuum):
+        return 1
+    steps, free = 0, None
+    while True:
+        remaining = database.writer.run(_vacuum_step, pages)
+        steps += 1
+        if not remaining or remaining == free:
+            return steps
+        free = remaining
+
+
+# --- Archive ---
+
+def _archive_path(archive_dir, month, compressed_ext=None):
+    ext = compressed_ext or (".zst" if zstandard else ".gz")
+    return os.path.join(archive_dir, f"papers-{month}.jsonl{ext}")
+
+
+def _append_lines(path, lines):
+    """Appends lines as one new compressed frame/member (both formats allow concatenation)."""
+    data = "".join(lines).encode()
+    if path.endswith(".zst"):
+        data = zstandard.ZstdCompressor().compress(data)
+    else:
+        data = gzip.compress(data)
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _read_lines(path):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} needs the zstandard package")
+        with open(path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            yield from io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            yield from f
+
+
+def _archive_papers(db: Session, paper_ids, archive_dir):
+    """Appends the papers (with authors and categories) to their month files."""
+    rows = db.query(*[getattr(models.Paper, c) for c in ARCHIVE_COLUMNS]).filter(
+        models.Paper.id.in_(paper_ids)
+    ).all()
+    authors = catalog.authors_of(db, paper_ids)
+    categories = catalog.categories_of(db, paper_ids)
+    by_month = {}
+    for row in rows:
+        record = dict(zip(ARCHIVE_COLUMNS, row))
+        record["author_names"] = authors.get(record["id"], catalog.split_authors(record["authors"]))
+        record["categories"] = categories.get(record["id"], [])
+        month = record["published_date"].strftime("%Y-%m") if record["published_date"] else "undated"
+        by_month.setdefault(month, []).append(json.dumps(record, default=str) + "\n")
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, lines in by_month.items():
+        _append_lines(_archive_path(archive_dir, month), lines)
+    return len(rows)
+
+
+def archive_files(archive_dir=None, months=None):
+    archive_dir = archive_dir or ARCHIVE_DIR
+    paths = sorted(glob.glob(os.path.join(archive_dir, "papers-*.jsonl.*")))
+    if months:
+        paths = [p for p in paths if os.path.basename(p).split(".")[0][len("papers-"):] in months]
+    return paths
+
+
+def _parse_record(line):
+    record = json.loads(line)
+    for key in ("published_date", "updated_date"):
+        if record.get(key):
+            record[key] = datetime.date.fromisoformat(record[key])
+    if record.get("submitted_at"):
+        record["submitted_at"] = datetime.datetime.fromisoformat(record["submitted_at"])
+    record["version"] = 1
+    return record
+
+
+def restore(db: Session, months=None, archive_dir=None):
+    """
+    Re-imports archived papers (all, or the given "YYYY-MM" months) through
+    fetcher.ingest_records; papers already in the DB are skipped. Restored
+    papers are scored by the next training run. Returns the number restored.
+    """
+    restored = 0
+    for path in archive_files(archive_dir, months):
+        batch = []
+        for line in _read_lines(path):
+            if line.strip():
+                batch.append(_parse_record(line))
+            if len(batch) >= RESTORE_BATCH:
+                restored += database.writer.run(fetcher.ingest_records, batch)[0]
+                batch = []
+        if batch:
+            restored += database.writer.run(fetcher.ingest_records, batch)[0]
+        print(f"Restored papers from {os.path.basename(path)} ({restored} so far).")
+    return restored
+
+
+# --- Pruning ---
+
+def _prune_chunk(db: Session, cutoff_date, archive_dir):
+    """Deletes (and archives) up to DELETE_CHUNK expired papers. Returns (count, dates)."""
+    liked = select(models.Interaction.paper_id).where(models.Interaction.is_liked == True)
+    rows = db.query(models.Paper.id, models.Paper.published_date).filter(
+        models.Paper.published_date < cutoff_date,
+        models.Paper.id.notin_(liked)
+    ).order_by(models.Paper.published_date, models.Paper.id).limit(DELETE_CHUNK).all()
+    if not rows:
+        return 0, set()
+    paper_ids = [pid for pid, _ in rows]
+    if archive_dir:
+        _archive_papers(db, paper_ids, archive_dir)
+
+    catalog.unlink_papers(db, paper_ids)
+    db.execute(delete(models.DayRank).where(models.DayRank.paper_id.in_(paper_ids)))
+    scores.delete_papers(db, paper_ids)
+    db.execute(delete(models.Interaction).where(models.Interaction.paper_id.in_(paper_ids)))
+    db.execute(delete(models.ZoteroQueue).where(models.ZoteroQueue.paper_id.in_(paper_ids)))
+    # Their cached files go with the next fulltext.collect_garbage()
+    db.execute(delete(models.PaperText).where(models.PaperText.paper_id.in_(paper_ids)))
+    db.execute(delete(models.Paper).where(models.Paper.id.in_(paper_ids)))
+    db.commit()
+    return len(paper_ids), {d for _, d in rows}
+
+
+def _drop_orphans(db: Session):
+    """Removes authors, unliked interactions and queue entries whose papers are gone."""
+    papers = select(models.Paper.id)
+    catalog.prune_authors(db)
+    interactions = db.execute(delete(models.Interaction).where(
+        models.Interaction.paper_id.notin_(papers),
+        models.Interaction.is_liked != True
+    )).rowcount
+    db.execute(delete(models.ZoteroQueue).where(models.ZoteroQueue.paper_id.notin_(papers)))
+    db.commit()
+    return interactions
+
+
+def prune(db: Session, days_to_keep: int = 90, archive_dir=None, progress=None):
+    """
+    Removes unliked papers announced more than days_to_keep days ago, in
+    chunks (archived first when archive_dir or ARCHIVE_DIR is set), then
+    vacuums. Returns a summary with the DB size before and after.
+    """
+    archive_dir = archive_dir if archive_dir is not None else ARCHIVE_DIR
+    cutoff_date = datetime.date.today() - datetime.timedelta(days=days_to_keep)
+    print(f"Running cleanup: Pruning unliked papers older than {cutoff_date}"
+          f"{' (archiving to ' + archive_dir + ')' if archive_dir else ''}...")
+    sqlite = database.engine.dialect.name == "sqlite"
+    before = db_size(db) if sqlite else None
+    db.rollback()
+
+    deleted, dates = 0, set()
+    while True:
+        count, chunk_dates = database.writer.run(_prune_chunk, cutoff_date, archive_dir)
+        if not count:
+            break
+        deleted += count
+        dates |= chunk_dates
+        if progress:
+            progress(deleted=deleted)
+
+    orphans = database.writer.run(_drop_orphans)
+    if dates:
+        database.writer.run(rankings.rebuild_days, dates)
+    summary = {"deleted": deleted, "archived": deleted if archive_dir else 0, "orphan_interactions": orphans}
+    if sqlite:
+        if progress:
+            progress(stage="vacuum")
+        vacuum()
+        after = db_size(db)
+        db.rollback()
+        summary.update(size_before=before["bytes"], size_after=after["bytes"])
+        print(f"Database size: {_megabytes(before):.1f} MB -> {_megabytes(after):.1f} MB")
+    print(f"Cleanup complete. Deleted {deleted} old papers.")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    prune_cmd = commands.add_parser("prune", help="Delete (and archive) papers outside the retention window")
+    prune_cmd.add_argument("--days", type=int, default=90)
+    prune_cmd.add_argument("--archive-dir", default=None, help="Defaults to ARXIV_LOCAL_ARCHIVE_DIR")
+    restore_cmd = commands.add_parser("restore", help="Re-import archived papers")
+    restore_cmd.add_argument("--month", action="append", help="YYYY-MM; repeatable, default all")
+    restore_cmd.add_argument("--archive-dir", default=None)
+    commands.add_parser("size", help="Print the DB size")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    with database.SessionLocal() as db:
+        if args.command == "prune":
+            print(prune(db, days_to_keep=args.days, archive_dir=args.archive_dir))
+        elif args.command == "restore":
+            if not archive_files(args.archive_dir, args.month):
+                parser.error("no archive files found")
+            print(f"Restored {restore(db, months=args.month, archive_dir=args.archive_dir)} papers.")
+        else:
+            size = db_size(db)
+            print(f"{_megabytes(size):.1f} MB ({size['free_bytes'] / 1e6:.1f} MB free)")
+
+
+if __name__ == "__main__":
+    main()
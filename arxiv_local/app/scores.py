@@ -0,0 +1,277 @@
+"""
+Generation-versioned recommendation scores.
+
+Every scoring run writes a complete set of scores, for every user it
+scored, as a new generation of the scores table: a score_generations row
+(status "building"), then the (generation, user_id, paper_id, score) rows
+in bulk executemany batches of WRITE_BATCH. Each user's readers only ever
+see the generation named by their score_pointer row, so publish() switches
+all the scored users to the new set with one UPDATE, after all of it is
+written; until then they keep reading the previous one. A training run
+publishes every user whose scores moved at once, and makes no generation
+when none did (see ScoringIndex.write_scores). A like makes no generation
+either: upsert() writes just the clicking user's scores that moved into
+the generation they already read, in one transaction. Scores live apart
+from the papers, so retraining never rewrites (or locks pages of) paper
+text.
+
+Generations some user still reads and the newest KEEP_GENERATIONS ready
+training runs are kept, however many like generations (made for a user's
+first scores) came after them; older ones are deleted DELETE_CHUNK rows
+per transaction.
+rollback() points a user back at an earlier generation, e.g. after a bad
+model run:
+
+    python -m arxiv_local.app.scores list
+    python -m arxiv_local.app.scores rollback [--user ID] [--generation N]
+"""
+import argparse
+import datetime
+import os
+
+from sqlalchemy import delete, exists, func, insert, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import migrations, rankings
+
+WRITE_BATCH = 5000
+DELETE_CHUNK = 20000
+KEEP_GENERATIONS = int(os.getenv("ARXIV_LOCAL_SCORE_GENERATIONS", "3"))
+
+
+def current_generation(db: Session, user_id=models.DEFAULT_USER_ID):
+    return db.query(models.ScorePointer.generation).filter(models.ScorePointer.id == user_id).scalar()
+
+
+def current_generations(db: Session):
+    """{user_id: generation} for every user with scores."""
+    return dict(db.query(models.ScorePointer.id, models.ScorePointer.generation))
+
+
+def list_generations(db: Session):
+    return db.query(models.ScoreGeneration).order_by(models.ScoreGeneration.id.desc()).all()
+
+
+# --- Writing a generation ---
+
+def _begin(db: Session, source, papers):
+    generation = models.ScoreGeneration(status="building", source=source, papers=papers)
+    db.add(generation)
+    db.commit()
+    return generation.id
+
+
+def _insert_rows(db: Session, rows):
+    db.execute(insert(models.Score), rows)
+    db.commit()
+
+
+def _point_to(db: Session, generation, user_ids):
+    """Switches user_ids to generation in one transaction. Returns {user_id: previous generation}."""
+    previous = {uid: g for uid, g in db.query(models.ScorePointer.id, models.ScorePointer.generation).filter(
+        models.ScorePointer.id.in_(user_ids)
+    )}
+    if previous:
+        db.execute(update(models.ScorePointer).where(models.ScorePointer.id.in_(list(previous))).values(
+            generation=generation
+        ))
+    missing = [uid for uid in user_ids if uid not in previous]
+    if missing:
+        db.execute(insert(models.ScorePointer), [{"id": uid, "generation": generation} for uid in missing])
+    db.query(models.ScoreGeneration).filter(models.ScoreGeneration.id == generation).update(
+        {"status": "ready", "activated_at": datetime.datetime.now()}
+    )
+    db.commit()
+    return {uid: previous.get(uid) for uid in user_ids}
+
+
+def publish(paper_ids, values_by_user, source="train"):
+    """
+    Writes {user_id: values (one per paper ID)} as a new generation,
+    switches those users to it and collects old generations. Returns
+    (generation, {user_id: previous generation}).
+    """
+    user_ids = list(values_by_user)
+    generation = database.writer.run(_begin, source, len(paper_ids))
+    rows = []
+    for user_id, values in values_by_user.items():
+        rows.extend({"generation": generation, "user_id": user_id, "paper_id": pid, "score": float(v)}
+                    for pid, v in zip(paper_ids, values))
+        while len(rows) >= WRITE_BATCH:
+            database.writer.run(_insert_rows, rows[:WRITE_BATCH])
+            del rows[:WRITE_BATCH]
+    if rows:
+        database.writer.run(_insert_rows, rows)
+    previous = database.writer.run(_point_to, generation, user_ids)
+    collect_garbage()
+    return generation, previous
+
+
+def _upsert_rows(db: Session, user_id, expected, paper_ids, values, changed):
+    generation = current_generation(db, user_id)
+    if generation is None:
+        return None, changed
+    if generation != expected:
+        # Rolled back or retrained since the caller's copy: its diff is against other scores
+        changed = range(len(paper_ids))
+    stmt = sqlite_insert(models.Score)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Score.generation, models.Score.user_id, models.Score.paper_id],
+        set_={"score": stmt.excluded.score},
+    )
+    rows = [{"generation": generation, "user_id": user_id, "paper_id": paper_ids[i], "score": float(values[i])}
+            for i in changed]
+    if rows:
+        db.execute(stmt, rows)
+    db.commit()
+    return generation, changed
+
+
+def upsert(user_id, paper_ids, values, changed, expected):
+    """
+    Writes the scores of user_id at the row indexes `changed` into the
+    generation the user reads, in one transaction, provided it is still
+    `expected` (the generation the caller's previous scores came from);
+    otherwise every row is written. Returns (generation, rows written), or
+    (None, changed) if the user has no generation yet and needs publish().
+    """
+    return database.writer.run(_upsert_rows, user_id, expected, paper_ids, values, changed)
+
+
+# --- Garbage collection ---
+
+def _expired(db: Session):
+    """Generations to delete: all but those users read and the newest KEEP_GENERATIONS ready training runs."""
+    current = set(current_generations(db).values())
+    keep = {g for (g,) in db.query(models.ScoreGeneration.id).filter(
+        models.ScoreGeneration.status == "ready",
+        models.ScoreGeneration.source != "like"
+    ).order_by(models.ScoreGeneration.id.desc()).limit(KEEP_GENERATIONS)}
+    keep |= current
+    expired = []
+    for generation, status in db.query(models.ScoreGeneration.id, models.ScoreGeneration.status):
+        if generation in keep:
+            continue
+        if status == "building" and generation > max(current, default=0):
+            # May still be being written
+            continue
+        expired.append(generation)
+    return expired
+
+
+def _delete_chunk(db: Session, generation):
+    """Deletes up to DELETE_CHUNK rows of generation, and its row once empty. Returns the count."""
+    deleted = db.execute(text(
+        "DELETE FROM scores WHERE rowid IN (SELECT rowid FROM scores WHERE generation = :g LIMIT :n)"
+    ), {"g": generation, "n": DELETE_CHUNK}).rowcount
+    if not deleted:
+        db.execute(delete(models.ScoreGeneration).where(models.ScoreGeneration.id == generation))
+    db.commit()
+    return deleted
+
+
+def delete_papers(db: Session, paper_ids):
+    """
+    Deletes the scores of paper_ids in every generation (no commit), e.g.
+    for papers being pruned. Naming every generation and user lets the
+    primary key find the rows instead of scanning the table.
+    """
+    generations = [g for (g,) in db.query(models.ScoreGeneration.id)]
+    user_ids = [u for (u,) in db.query(models.User.id)] + [u for (u,) in db.query(models.ScorePointer.id)]
+    if not generations or not user_ids:
+        return 0
+    return db.execute(delete(models.Score).where(
+        models.Score.generation.in_(generations),
+        models.Score.user_id.in_(set(user_ids)),
+        models.Score.paper_id.in_(paper_ids)
+    )).rowcount
+
+
+def collect_garbage():
+    """Deletes expired generations in short transactions. Returns the generations removed."""
+    expired = database.writer.run(_expired)
+    for generation in expired:
+        while database.writer.run(_delete_chunk, generation):
+            pass
+    return expired
+
+
+# --- Rollback ---
+
+def _has_user(generation, user_id):
+    return exists().where(models.Score.generation == generation, models.Score.user_id == user_id)
+
+
+def _rollback(db: Session, user_id, generation):
+    current = current_generation(db, user_id)
+    if generation is None:
+        generation = db.query(func.max(models.ScoreGeneration.id)).filter(
+            models.ScoreGeneration.status == "ready",
+            models.ScoreGeneration.id < (current or 0),
+            _has_user(models.ScoreGeneration.id, user_id)
+        ).scalar()
+        if generation is None:
+            raise ValueError("no earlier generation to roll back to")
+    else:
+        status = db.query(models.ScoreGeneration.status).filter(
+            models.ScoreGeneration.id == generation, _has_user(models.ScoreGeneration.id, user_id)
+        ).scalar()
+        if status not in ("ready", "rolled_back"):
+            raise ValueError(f"generation {generation} is not available")
+    _point_to(db, generation, [user_id])
+    if current is not None and current != generation and current not in current_generations(db).values():
+        # Nobody reads it any more
+        db.query(models.ScoreGeneration).filter(models.ScoreGeneration.id == current).update(
+            {"status": "rolled_back"}
+        )
+        db.commit()
+    return current, generation
+
+
+def rollback(db: Session, user_id=models.DEFAULT_USER_ID, generation=None):
+    """
+    Points user_id at generation (default: the newest ready one before
+    their current one that has their scores), marks the old one rolled back
+    once no user reads it, and rebuilds the user's rankings. The next
+    scoring run publishes a new generation as usual. Returns (previous,
+    current) generations.
+    """
+    db.rollback()
+    previous, generation = database.writer.run(_rollback, user_id, generation)
+    database.writer.run(rankings.rebuild_all, [user_id])
+    print(f"Scores of user {user_id} rolled back from generation {previous} to {generation}.")
+    return previous, generation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the stored generations")
+    rollback_cmd = commands.add_parser("rollback", help="Switch back to an earlier generation")
+    rollback_cmd.add_argument("--user", type=int, default=models.DEFAULT_USER_ID)
+    rollback_cmd.add_argument("--generation", type=int, default=None)
+    commands.add_parser("gc", help="Delete expired generations")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    with database.SessionLocal() as db:
+        if args.command == "list":
+            readers = {}
+            for user_id, generation in current_generations(db).items():
+                readers.setdefault(generation, []).append(str(user_id))
+            for g in list_generations(db):
+                print(f"{'*' if g.id in readers else ' '} {g.id:6d}  {g.status:<11} {g.source or '':<6} "
+                      f"{g.papers or 0:8d} papers  {g.created_at}  {'users ' + ','.join(readers[g.id]) if g.id in readers else ''}")
+        elif args.command == "rollback":
+            try:
+                rollback(db, args.user, args.generation)
+            except ValueError as e:
+                parser.error(str(e))
+        else:
+            print(f"Removed generations {collect_garbage() or 'none'}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Full-text search over papers with SQLite FTS5.
+
+`papers_fts` is an external-content FTS5 table over title, authors and
+abstract of `papers`, kept in sync by triggers (including the upserts done
+during ingestion and the deletes done by cleanup). Score updates do not
+touch the indexed columns, so rescoring never re-indexes text.
+
+Queries accept plain words, "quoted phrases", prefix terms (galax*) and
+column filters (author:smith or authors:smith, title:"dark energy"); all
+terms must match. Terms without a letter or digit (a stray "-") are ignored.
+Results are ranked with BM25, weighting title over authors over abstract.
+"""
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+FTS_TABLE = "papers_fts"
+# bm25() column weights: title, authors, abstract
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+MAX_PER_PAGE = 100
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, authors, abstract,
+        content='papers', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS papers_fts_ai AFTER INSERT ON papers BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, authors, abstract)
+        VALUES (new.rowid, new.title, new.authors, new.abstract);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS papers_fts_ad AFTER DELETE ON papers BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors, abstract)
+        VALUES ('delete', old.rowid, old.title, old.authors, old.abstract);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS papers_fts_au AFTER UPDATE OF title, authors, abstract ON papers BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors, abstract)
+        VALUES ('delete', old.rowid, old.title, old.authors, old.abstract);
+        INSERT INTO {FTS_TABLE}(rowid, title, authors, abstract)
+        VALUES (new.rowid, new.title, new.authors, new.abstract);
+    END""",
+]
+
+_available = None
+
+
+def ensure_index(engine):
+    """Creates the FTS table and triggers if needed, indexing existing papers once."""
+    global _available
+    if engine.dialect.name != "sqlite":
+        _available = False
+        return False
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+        ).first() is not None
+        try:
+            for statement in _DDL:
+                conn.exec_driver_sql(statement)
+        except Exception as e:
+            # SQLite builds without FTS5 fall back to LIKE scans
+            print(f"FTS5 unavailable ({e}); search will use slow LIKE scans.")
+            _available = False
+            return False
+        if not exists:
+            print("Building full-text search index...")
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _available = True
+    return True
+
+
+def _index_available(db: Session):
+    # ensure_index only runs when a migration needs it; otherwise look once
+    global _available
+    if _available is None:
+        _available = db.get_bind().dialect.name == "sqlite" and db.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"
+        ), {"name": FTS_TABLE}).first() is not None
+    return _available
+
+
+_TOKEN = re.compile(r'(?:(title|authors?|abstract):)?(?:"([^"]*)"|([^\s"]+))')
+# Column filter spellings other than the column name
+_COLUMN_ALIASES = {"author": "authors"}
+
+
+def build_match(query: str):
+    """
+    Translates user input into an FTS5 MATCH expression, quoting every term
+    so FTS5 operators typed by accident cannot cause syntax errors.
+    Returns None if nothing searchable is left.
+    """
+    terms = []
+    for column, phrase, word in _TOKEN.findall(query or ""):
+        prefix = False
+        if phrase:
+            value = phrase
+        else:
+            prefix = word.endswith("*")
+            value = word.rstrip("*")
+        value = re.sub(r"[^\w\s.\-']", " ", value).strip()
+        # Punctuation alone tokenizes to an empty phrase, which matches nothing
+        if not re.search(r"\w", value):
+            continue
+        column = _COLUMN_ALIASES.get(column, column)
+        term = '"' + value.replace('"', '""') + '"' + ("*" if prefix else "")
+        terms.append(f"{column} : {term}" if column else term)
+    return " AND ".join(terms) if terms else None
+
+
+def _filters(date_from, date_to, category):
+    clauses, params = [], {}
+    if date_from:
+        clauses.append("p.published_date >= :date_from")
+        params["date_from"] = str(date_from)
+    if date_to:
+        clauses.append("p.published_date <= :date_to")
+        params["date_to"] = str(date_to)
+    if category:
+        # Cross-listed papers count too
+        clauses.append("EXISTS (SELECT 1 FROM paper_categories pc "
+                       "WHERE pc.paper_id = p.id AND pc.category = :category)")
+        params["category"] = category
+    return clauses, params
+
+
+def search_papers(db: Session, query: str, date_from=None, date_to=None, category=None,
+                  page: int = 1, per_page: int = 25):
+    """
+    Returns {"total": n, "page": page, "per_page": k, "results": [(paper_id, rank), ...]}
+    ordered by relevance (most relevant first).
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    clauses, params = _filters(date_from, date_to, category)
+    params.update(limit=per_page, offset=(page - 1) * per_page)
+
+    if _index_available(db):
+        match = build_match(query)
+        if match is None:
+            return {"total": 0, "page": page, "per_page": per_page, "results": []}
+        params["match"] = match
+        where = " AND ".join([f"{FTS_TABLE} MATCH :match"] + clauses)
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        base = f"FROM {FTS_TABLE} JOIN papers p ON p.rowid = {FTS_TABLE}.rowid WHERE {where}"
+        rows = db.execute(text(
+            f"SELECT p.id, bm25({FTS_TABLE}, {weights}) AS rank {base} ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), params).all()
+        total = db.execute(text(f"SELECT count(*) {base}"), params).scalar()
+    else:
+        words = [w for w in re.findall(r"\w+", query or "")]
+        if not words:
+            return {"total": 0, "page": page, "per_page": per_page, "results": []}
+        for i, w in enumerate(words):
+            params[f"w{i}"] = f"%{w}%"
+            clauses.append(f"(p.title LIKE :w{i} OR p.authors LIKE :w{i} OR p.abstract LIKE :w{i})")
+        base = f"FROM papers p WHERE {' AND '.join(clauses)}"
+        rows = db.execute(text(
+            f"SELECT p.id, 0.0 AS rank {base} ORDER BY p.published_date DESC LIMIT :limit OFFSET :offset"
+        ), params).all()
+        total = db.execute(text(f"SELECT count(*) {base}"), params).scalar()
+
+    return {"total": total, "page": page, "per_page": per_page,
+            "results": [(r[0], r[1]) for r in rows]}
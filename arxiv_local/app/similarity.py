@@ -0,0 +1,221 @@
+"""
+"More like this": approximate nearest neighbours over dense paper vectors.
+
+The TF-IDF rows of the recommender index are reduced with TruncatedSVD
+(LSA) to VECTOR_DIM dense, L2-normalised float32 vectors, stored in
+vectors.npy and memory-mapped at query time. An inverted-file (IVF) index
+groups them under k-means centroids; a query compares against the
+centroids, then scans only the NPROBE closest lists. Small corpora use a
+single list, i.e. an exact scan.
+
+The index follows the recommender's matrix: new papers are projected with
+the stored SVD components and assigned to their nearest centroid, pruned
+papers are dropped, and everything is rebuilt when the vocabulary is refit
+or the corpus has grown by REBUILD_GROWTH since the clustering.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+STATE_DIR = os.path.join(os.getenv("ARXIV_LOCAL_STATE_DIR", "./recommender_state"), "vectors")
+
+VECTOR_DIM = 128
+# Corpora smaller than this are scanned exactly (about a millisecond)
+IVF_MIN_PAPERS = 20000
+MAX_LISTS = 1024
+# With sqrt(n) lists, probing 32 scans a few percent of a large corpus;
+# recall@10 is around 0.9 even on unclustered synthetic text
+NPROBE = 32
+REBUILD_GROWTH = 1.0
+
+
+def _atomic_save(path, array):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """Dense vectors, SVD components and IVF lists for a set of papers."""
+
+    def __init__(self, vectors, paper_ids, components, centroids, assign, fit_stamp, n_clustered):
+        self.vectors = vectors
+        self.paper_ids = list(paper_ids)
+        self.row_of = {pid: i for i, pid in enumerate(self.paper_ids)}
+        self.components = components
+        self.centroids = centroids
+        self.assign = np.asarray(assign, dtype=np.int32)
+        self.fit_stamp = fit_stamp
+        self.n_clustered = n_clustered
+        # Rows of every list, as slices of one argsort
+        self._order = np.argsort(self.assign, kind="stable")
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(self.assign, minlength=len(centroids)))])
+
+    # --- Building ---
+
+    @classmethod
+    def build(cls, matrix, paper_ids, fit_stamp):
+        """Fits the SVD and the IVF clustering on a TF-IDF matrix."""
+        from sklearn.decomposition import TruncatedSVD
+
+        n_docs, n_terms = matrix.shape
+        dim = min(VECTOR_DIM, n_terms - 1, n_docs - 1)
+        if dim < 1:
+            return None
+        svd = TruncatedSVD(n_components=dim, random_state=0)
+        vectors = _normalise(svd.fit_transform(matrix))
+        components = svd.components_.astype(np.float32)
+        centroids, assign = cls._cluster(vectors)
+        return cls(vectors, paper_ids, components, centroids, assign, fit_stamp, len(paper_ids))
+
+    @staticmethod
+    def _cluster(vectors):
+        n = len(vectors)
+        if n < IVF_MIN_PAPERS:
+            return _normalise(vectors.mean(axis=0, keepdims=True)), np.zeros(n, dtype=np.int32)
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_lists = min(MAX_LISTS, int(np.sqrt(n)))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=0, batch_size=4096, n_init=3)
+        assign = kmeans.fit_predict(vectors)
+        return _normalise(kmeans.cluster_centers_), assign.astype(np.int32)
+
+    def project(self, rows):
+        """Maps TF-IDF rows into the vector space."""
+        return _normalise(rows @ self.components.T)
+
+    def needs_rebuild(self, fit_stamp):
+        return fit_stamp != self.fit_stamp or len(self.paper_ids) > self.n_clustered * (1 + REBUILD_GROWTH)
+
+    def updated(self, matrix, paper_ids, changed=()):
+        """
+        Returns an index matching paper_ids (rows of matrix): vectors of
+        papers that are gone are dropped and new (or changed) papers are
+        projected and assigned to their nearest centroid. Returns self if
+        nothing changed.
+        """
+        changed = set(changed)
+        wanted = set(paper_ids) - changed
+        keep = [i for i, pid in enumerate(self.paper_ids) if pid in wanted]
+        new_rows = [i for i, pid in enumerate(paper_ids) if pid not in self.row_of or pid in changed]
+        if len(keep) == len(self.paper_ids) and not new_rows:
+            return self
+
+        vectors = np.asarray(self.vectors[keep])
+        assign = self.assign[keep]
+        ids = [self.paper_ids[i] for i in keep]
+        if new_rows:
+            added = self.project(matrix[new_rows])
+            vectors = np.vstack([vectors, added])
+            assign = np.concatenate([assign, np.argmax(added @ self.centroids.T, axis=1)])
+            ids.extend(paper_ids[i] for i in new_rows)
+        return VectorIndex(vectors, ids, self.components, self.centroids, assign,
+                           self.fit_stamp, self.n_clustered)
+
+    # --- Persistence ---
+
+    def save(self, state_dir=STATE_DIR):
+        os.makedirs(state_dir, exist_ok=True)
+        _atomic_save(os.path.join(state_dir, "vectors.npy"), np.asarray(self.vectors, dtype=np.float32))
+        _atomic_save(os.path.join(state_dir, "components.npy"), self.components)
+        _atomic_save(os.path.join(state_dir, "centroids.npy"), self.centroids)
+        _atomic_save(os.path.join(state_dir, "assign.npy"), self.assign)
+        meta = {"ids": self.paper_ids, "fit_stamp": self.fit_stamp, "n_clustered": self.n_clustered}
+        tmp = os.path.join(state_dir, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(state_dir, "meta.json"))
+
+    @classmethod
+    def load(cls, state_dir=STATE_DIR):
+        """Loads a saved index with the vectors memory-mapped, or None."""
+        try:
+            with open(os.path.join(state_dir, "meta.json")) as f:
+                meta = json.load(f)
+            vectors = np.load(os.path.join(state_dir, "vectors.npy"), mmap_mode="r")
+            components = np.load(os.path.join(state_dir, "components.npy"))
+            centroids = np.load(os.path.join(state_dir, "centroids.npy"))
+            assign = np.load(os.path.join(state_dir, "assign.npy"))
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(vectors) != len(meta["ids"]) or len(assign) != len(vectors):
+            return None
+        return cls(vectors, meta["ids"], components, centroids, assign,
+                   meta.get("fit_stamp"), meta.get("n_clustered", len(vectors)))
+
+    # --- Queries ---
+
+    def neighbours(self, paper_id, k=10, nprobe=NPROBE):
+        """Returns [(paper_id, cosine similarity), ...] for the k nearest papers."""
+        row = self.row_of.get(paper_id)
+        if row is None:
+            return None
+        query = np.asarray(self.vectors[row])
+        lists = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        candidates = np.concatenate([self._order[self._offsets[l]:self._offsets[l + 1]] for l in lists])
+        # Sorted rows read the memory map front to back
+        candidates = np.sort(candidates[candidates != row])
+        if not len(candidates):
+            return []
+        sims = np.asarray(self.vectors[candidates]) @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(self.paper_ids[candidates[i]], float(sims[i])) for i in top]
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """The current index (loaded from disk on first use), or None if never built."""
+    global _current
+    if _current is None:
+        with _lock:
+            if _current is None:
+                _current = VectorIndex.load()
+    return _current
+
+
+def sync(matrix, paper_ids, fit_stamp, changed=()):
+    """
+    Brings the saved index in line with the recommender matrix (changed:
+    IDs whose rows were re-transformed), rebuilding it when the vocabulary
+    changed or the corpus outgrew the clustering.
+    """
+    global _current
+    index = get_index()
+    if index is None or index.needs_rebuild(fit_stamp):
+        print("Building similarity index...")
+        index = VectorIndex.build(matrix, paper_ids, fit_stamp)
+        if index is None:
+            return None
+    else:
+        updated = index.updated(matrix, paper_ids, changed)
+        if updated is index:
+            return index
+        index = updated
+        if index.needs_rebuild(fit_stamp):
+            print("Rebuilding similarity index...")
+            index = VectorIndex.build(matrix, paper_ids, fit_stamp)
+    index.save()
+    with _lock:
+        # Reopen so queries read the saved vectors through the memory map
+        _current = VectorIndex.load() or index
+    return _current
+
+
+def reset():
+    global _current
+    with _lock:
+        _current = None
@@ -0,0 +1,211 @@
+// Page script for index.html.
+//
+// On a day page (#paper-list has data-date) scores, flags and order are
+// kept current without reloading: after a like or a finished training job
+// the page asks /api/scores for the rows changed since the revision it
+// shows and moves the existing cards into the new order. MathJax does not
+// typeset the whole page on load; titles are typeset as their cards scroll
+// into view and abstracts when they are first opened.
+
+const paperList = document.getElementById('paper-list');
+const dayDate = paperList ? paperList.dataset.date : null;
+
+// --- Lazy MathJax ---
+
+const pendingMath = [];
+
+function typeset(elements) {
+    elements = elements.filter(el => el && !el.dataset.typeset);
+    elements.forEach(el => { el.dataset.typeset = "1"; });
+    if (!elements.length) return;
+    if (window.MathJax && MathJax.typesetPromise) {
+        MathJax.typesetPromise(elements).catch(console.error);
+    } else {
+        // MathJax is still loading; mathReady() picks these up
+        pendingMath.push(...elements);
+    }
+}
+
+function mathReady() {
+    MathJax.startup.defaultReady();
+    if (pendingMath.length) {
+        MathJax.typesetPromise(pendingMath.splice(0)).catch(console.error);
+    }
+}
+
+const titleObserver = new IntersectionObserver(entries => {
+    const visible = entries.filter(e => e.isIntersecting).map(e => e.target);
+    visible.forEach(card => titleObserver.unobserve(card));
+    typeset(visible.map(card => card.querySelector('.paper-title')));
+}, { rootMargin: "300px" });
+document.querySelectorAll('.paper-card').forEach(card => titleObserver.observe(card));
+
+// --- Buttons ---
+
+function setLiked(paperId, liked) {
+    const btn = document.getElementById(`like-btn-${paperId}`);
+    if (!btn) return;
+    btn.innerHTML = liked ? "♥ Liked" : "♡ Like";
+    btn.classList.toggle("liked", liked);
+    btn.classList.toggle("text-muted", !liked);
+}
+
+function setZotero(paperId, added) {
+    const btn = document.getElementById(`zotero-btn-${paperId}`);
+    if (!btn) return;
+    btn.innerHTML = added ? "Z Added" : "Z Add";
+    btn.classList.toggle("zotero-added", added);
+    btn.classList.toggle("text-muted", !added);
+}
+
+async function toggleLike(paperId, event) {
+    event.stopPropagation(); // Prevent toggling abstract when clicking like
+    const response = await fetch(`/like/${paperId}`, { method: 'POST' });
+    const data = await response.json();
+    setLiked(paperId, data.is_liked);
+    // Rescoring runs in the background after the response
+    refreshSoon();
+}
+
+async function addToZotero(paperId, event) {
+    event.stopPropagation();
+    const btn = document.getElementById(`zotero-btn-${paperId}`);
+    btn.innerHTML = "Adding...";
+
+    try {
+        const response = await fetch(`/zotero/${paperId}`, { method: 'POST' });
+        if (!response.ok) {
+            const text = await response.text();
+            throw new Error(`Server returned ${response.status}: ${text}`);
+        }
+        const data = await response.json();
+
+        if (data.status === "success") {
+            setZotero(paperId, true);
+        } else {
+            alert("Error: " + (data.message || "Unknown error"));
+            btn.innerHTML = "Z Add";
+        }
+    } catch (error) {
+        console.error(error);
+        alert("Error: " + error.message);
+        btn.innerHTML = "Z Add";
+    }
+}
+
+async function syncZotero() {
+    const response = await fetch('/sync_zotero', { method: 'POST' });
+    const data = await response.json();
+    alert(data.message);
+    if (data.job_id) {
+        watchJobs(data.job_id);
+    }
+}
+
+function toggleAbstract(paperId) {
+    const abs = document.getElementById(`abstract-${paperId}`);
+    if (abs.style.display === "block") {
+        abs.style.display = "none";
+    } else {
+        abs.style.display = "block";
+        typeset([abs]);
+    }
+}
+
+async function trainModel() {
+    if(confirm("This re-calculates similarity scores based on your likes. It may take a moment. Continue?")) {
+        await startJob('/train');
+    }
+}
+
+// --- Incremental score updates ---
+
+async function refreshScores() {
+    if (!dayDate) return false;
+    const since = paperList.dataset.revision || 0;
+    const response = await fetch(`/api/scores?since=${since}&date=${dayDate}`);
+    const data = await response.json();
+    for (const change of data.changes) {
+        const badge = document.getElementById(`score-${change.id}`);
+        if (badge) badge.textContent = (change.score || 0).toFixed(2);
+        setLiked(change.id, change.is_liked);
+        setZotero(change.id, change.is_zotero);
+    }
+    if (data.order) {
+        if (data.order.some(id => !document.getElementById(`paper-${id}`))) {
+            // Papers were added to this day: only a full render has their cards
+            window.location.reload();
+            return true;
+        }
+        const wanted = new Set(data.order);
+        paperList.querySelectorAll('.paper-card').forEach(card => {
+            if (!wanted.has(card.dataset.id)) card.remove();
+        });
+        const current = Array.from(paperList.querySelectorAll('.paper-card'), card => card.dataset.id);
+        if (current.join() !== data.order.join()) {
+            // appendChild moves the existing nodes, keeping typeset math and open abstracts
+            data.order.forEach(id => paperList.appendChild(document.getElementById(`paper-${id}`)));
+        }
+    }
+    paperList.dataset.revision = data.revision;
+    return data.changes.length > 0;
+}
+
+let refreshTimers = [];
+function refreshSoon() {
+    // The background rescore usually lands within a few seconds
+    refreshTimers.forEach(clearTimeout);
+    refreshTimers = [300, 1500, 4000, 10000].map(delay => setTimeout(refreshScores, delay));
+}
+
+// --- Background jobs: show progress while any runs, update when they finish ---
+
+async function startJob(url) {
+    const response = await fetch(url, { method: 'POST' });
+    const data = await response.json();
+    if (data.status === "already running") {
+        document.getElementById('job-status').textContent = "Already running...";
+    }
+    watchJobs(data.job_id);
+}
+
+function describeJob(job) {
+    const counts = Object.entries(job.progress || {}).map(([k, v]) => `${v} ${k}`).join(", ");
+    return `${job.kind}: ${job.stage || job.status}` + (counts ? ` (${counts})` : "");
+}
+
+let watching = false;
+const seen = new Set();
+async function watchJobs(jobId) {
+    if (jobId) seen.add(jobId);
+    if (watching) return;
+    watching = true;
+    const status = document.getElementById('job-status');
+    while (true) {
+        const jobs = await (await fetch('/jobs?limit=10')).json();
+        const active = jobs.filter(j => j.status === "queued" || j.status === "running");
+        if (!active.length) {
+            const finished = jobs.filter(j => seen.has(j.id));
+            const failed = finished.filter(j => j.status === "failed");
+            watching = false;
+            status.textContent = "";
+            if (failed.length) {
+                alert(failed.map(j => `${j.kind} failed: ${j.error}`).join("\n"));
+            }
+            if (seen.size) {
+                seen.clear();
+                // A fetch can add days and papers; anything else only moves scores
+                if (dayDate && !finished.some(j => j.kind === "fetch")) {
+                    await refreshScores();
+                } else {
+                    window.location.reload();
+                }
+            }
+            return;
+        }
+        active.forEach(j => seen.add(j.id));
+        status.textContent = active.map(describeJob).join("; ");
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+watchJobs();
@@ -0,0 +1,109 @@
+"""
+Reader profiles.
+
+Everyone shares the fetched papers, the vocabulary and the features;
+likes, viewed dates, scores and rankings are kept per user. There is one
+Zotero library (configured in .env), so Zotero sync, its retry queue and
+the Zotero flags belong to ZOTERO_USER, the default profile; the other
+profiles do not get the Zotero buttons.
+There are no passwords: the profile is picked with the switcher in the
+sidebar and remembered in the USER_COOKIE cookie, so this suits a group
+sharing one server on a trusted network. Requests without a (known)
+profile use DEFAULT_USER_ID, which owns everything recorded before
+profiles existed.
+
+    python -m arxiv_local.app.users list
+    python -m arxiv_local.app.users add NAME
+"""
+import argparse
+import threading
+
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import migrations, rankings
+
+DEFAULT_USER_ID = models.DEFAULT_USER_ID
+ZOTERO_USER = DEFAULT_USER_ID
+ZOTERO_ONLY = "Zotero is linked to the default profile only."
+USER_COOKIE = "arxiv_local_user"
+MAX_NAME = 40
+
+# IDs of the existing users, loaded on first use; requests resolve their
+# cookie against it without a query
+_ids = None
+_lock = threading.Lock()
+
+
+def list_users(db: Session):
+    """Returns [(id, name), ...] in creation order."""
+    return db.query(models.User.id, models.User.name).order_by(models.User.id).all()
+
+
+def user_ids():
+    global _ids
+    with _lock:
+        if _ids is None:
+            with database.SessionLocal() as db:
+                _ids = frozenset(uid for (uid,) in db.query(models.User.id))
+        return _ids
+
+
+def reset():
+    global _ids
+    with _lock:
+        _ids = None
+
+
+def resolve(value):
+    """The user ID named by a cookie value, or DEFAULT_USER_ID."""
+    try:
+        user_id = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_USER_ID
+    return user_id if user_id in user_ids() else DEFAULT_USER_ID
+
+
+def _insert_user(db: Session, name):
+    user = models.User(name=name)
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+def create_user(db: Session, name):
+    """Adds a profile and builds its rankings. Returns its ID."""
+    name = " ".join((name or "").split())[:MAX_NAME]
+    if not name:
+        raise ValueError("a profile needs a name")
+    if db.query(models.User.id).filter(models.User.name == name).first() is not None:
+        raise ValueError(f"profile {name!r} already exists")
+    db.rollback()
+    user_id = database.writer.run(_insert_user, name)
+    database.writer.run(rankings.rebuild_all, [user_id])
+    reset()
+    return user_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the profiles")
+    add = commands.add_parser("add", help="Add a profile")
+    add.add_argument("name")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    with database.SessionLocal() as db:
+        if args.command == "list":
+            for user_id, name in list_users(db):
+                print(f"{user_id:4d}  {name}")
+        else:
+            try:
+                print(f"Added profile {args.name!r} with ID {create_user(db, args.name)}.")
+            except ValueError as e:
+                parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
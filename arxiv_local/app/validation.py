@@ -0,0 +1,197 @@
+"""
+Data-quality checks and repairs for stored papers.
+
+Each check is registered with the Paper columns it reads, a find(row)
+function that returns a description of the problem (or None) and, when the
+problem can be repaired, a fix(row) function that returns the corrected
+column values. scan() streams the union of the columns of the selected
+checks in SCAN_BATCH-row chunks, runs every check on each row in that one
+pass, and writes fixes as bulk UPDATEs of at most FIX_BATCH papers on the
+serialized writer. Memory stays flat however large the DB is.
+
+fetcher runs the checks (with fixes) on every ingested batch through
+ingest_hook(). From the command line:
+
+    python -m arxiv_local.app.validation                 # report only
+    python -m arxiv_local.app.validation --fix
+    python -m arxiv_local.app.validation --check math_delimiters --fix
+"""
+import argparse
+from collections import Counter
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .database import models, database
+from . import announcements, catalog, migrations, rankings
+
+SCAN_BATCH = 2000
+FIX_BATCH = 500
+
+
+class Check:
+    def __init__(self, name, columns, find, fix=None):
+        self.name = name
+        self.columns = tuple(columns)
+        self.find = find
+        self.fix = fix
+
+
+CHECKS = {}
+
+
+def register(name, columns, fix=None):
+    """
+    Decorator adding a check: find(row) -> problem description or None,
+    fix(row) -> {column: value}. row has attributes id and columns.
+    """
+    def decorator(find):
+        CHECKS[name] = Check(name, columns, find, fix)
+        return find
+    return decorator
+
+
+# --- Checks ---
+
+# What ingestion appends to a field with an odd number of $ (see
+# fetcher._balance_math); the abstract gets a space so the last word stays apart
+DOLLAR_CLOSERS = {"title": "$", "abstract": " $", "authors": "$"}
+
+
+def _odd_dollars(row):
+    return [c for c in DOLLAR_CLOSERS if getattr(row, c) and getattr(row, c).count("$") % 2 != 0]
+
+
+def _fix_dollars(row):
+    return {c: getattr(row, c) + DOLLAR_CLOSERS[c] for c in _odd_dollars(row)}
+
+
+@register("math_delimiters", DOLLAR_CLOSERS, fix=_fix_dollars)
+def _find_dollars(row):
+    fields = _odd_dollars(row)
+    return f"unbalanced $ in {', '.join(fields)}" if fields else None
+
+
+def _text(row):
+    return (row.title or "") + " " + (row.abstract or "")
+
+
+@register("latex_brackets", ("title", "abstract"))
+def _find_brackets(row):
+    text = _text(row)
+    problems = []
+    for opener, closer in (("\\[", "\\]"), ("\\(", "\\)")):
+        opened, closed = text.count(opener), text.count(closer)
+        if opened != closed:
+            problems.append(f"{opener}{closer} {opened} vs {closed}")
+    return "unbalanced " + ", ".join(problems) if problems else None
+
+
+@register("latex_environments", ("title", "abstract"))
+def _find_environments(row):
+    text = _text(row)
+    begins, ends = text.count("\\begin{"), text.count("\\end{")
+    return f"{begins} \\begin vs {ends} \\end" if begins != ends else None
+
+
+def _calendar_date(row):
+    return announcements.announcement_date(row.submitted_at) if row.submitted_at else None
+
+
+@register("announcement_date", ("submitted_at", "published_date"),
+          fix=lambda row: {"published_date": _calendar_date(row)})
+def _find_date(row):
+    expected = _calendar_date(row)
+    if expected is None or expected == row.published_date:
+        return None
+    return f"dated {row.published_date}, calendar says {expected}"
+
+
+# --- Scanning ---
+
+def _apply_fixes(db: Session, rows):
+    # ORM bulk UPDATE by primary key: one executemany per set of columns
+    db.execute(update(models.Paper), rows)
+    # A repaired byline is relinked in the same transaction, so paper_authors matches it
+    bylines = [{"id": r["id"], "author_names": catalog.split_authors(r["authors"])} for r in rows if "authors" in r]
+    if bylines:
+        catalog.relink_authors(db, bylines)
+    db.commit()
+    return len(rows)
+
+
+def _print_issue(paper_id, check, problem):
+    print(f"{check}: {paper_id}: {problem}")
+
+
+def scan(db: Session, checks=None, fix=False, paper_ids=None, report=_print_issue):
+    """
+    Runs the named checks (default all) over every paper, or over paper_ids,
+    calling report(paper_id, check, problem) for each problem found. With
+    fix=True repairable problems are written back. Returns
+    {"scanned": n, "issues": {check: n}, "fixed": {check: n}}.
+    """
+    selected = [CHECKS[name] for name in checks] if checks else list(CHECKS.values())
+    columns = list(dict.fromkeys(c for check in selected for c in check.columns))
+    stmt = select(models.Paper.id, *[getattr(models.Paper, c) for c in columns])
+    if paper_ids is not None:
+        stmt = stmt.where(models.Paper.id.in_(list(paper_ids)))
+
+    issues, fixed = Counter(), Counter()
+    scanned = 0
+    pending = []
+    dates = set()
+    # The read transaction keeps its snapshot while fixes are committed on the writer
+    for batch in db.execute(stmt.order_by(models.Paper.id)).yield_per(SCAN_BATCH).partitions():
+        for row in batch:
+            values = {}
+            for check in selected:
+                problem = check.find(row)
+                if problem is None:
+                    continue
+                issues[check.name] += 1
+                if report:
+                    report(row.id, check.name, problem)
+                if fix and check.fix:
+                    values.update(check.fix(row))
+                    fixed[check.name] += 1
+            if values:
+                if "published_date" in values:
+                    dates.update((row.published_date, values["published_date"]))
+                pending.append({"id": row.id, **values})
+        scanned += len(batch)
+        while len(pending) >= FIX_BATCH:
+            database.writer.run(_apply_fixes, pending[:FIX_BATCH])
+            del pending[:FIX_BATCH]
+    db.rollback()
+    if pending:
+        database.writer.run(_apply_fixes, pending)
+    if dates:
+        database.writer.run(rankings.rebuild_days, dates)
+    return {"scanned": scanned, "issues": dict(issues), "fixed": dict(fixed)}
+
+
+def ingest_hook(db: Session, paper_ids):
+    """Post-ingestion hook: checks and repairs the papers of one ingested batch."""
+    summary = scan(db, fix=True, paper_ids=paper_ids, report=None)
+    if summary["issues"]:
+        print(f"Validation: {summary['issues']} in a batch of {len(paper_ids)} papers, fixed {summary['fixed']}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="append", choices=sorted(CHECKS), help="Repeatable; default all")
+    parser.add_argument("--fix", action="store_true", help="Write repairs back")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    with database.SessionLocal() as db:
+        summary = scan(db, checks=args.check, fix=args.fix, report=None if args.quiet else _print_issue)
+    print(f"Scanned {summary['scanned']} papers. Issues: {summary['issues'] or 'none'}. "
+          f"Fixed: {summary['fixed'] or 'none'}.")
+
+
+if __name__ == "__main__":
+    main()
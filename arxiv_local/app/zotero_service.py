@@ -1,19 +1,97 @@
+import copy
+import datetime
 import os
-from pyzotero import zotero
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from .database import models, database
+from . import catalog
 
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 ZOTERO_USER_ID = os.getenv("ZOTERO_USER_ID")
 ZOTERO_API_KEY = os.getenv("ZOTERO_API_KEY")
 ZOTERO_COLLECTION_ID = os.getenv("ZOTERO_COLLECTION_ID")
+# Optional API base URL override, e.g. a local fake server for testing
+ZOTERO_ENDPOINT = os.getenv("ZOTERO_ENDPOINT")
+
+# The Zotero write API accepts at most 50 items per create_items call
+BATCH_SIZE = 50
+SYNC_WORKERS = 4
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0 # seconds, doubled on every retry
+# Papers that keep failing are retried by later syncs, but not more often than this
+RETRY_DELAY = datetime.timedelta(minutes=10)
+
+_client = None
+_template = None
+_client_lock = threading.Lock()
 
 def get_zotero_client():
+    """Returns the shared client (created on first use), or None without credentials."""
+    global _client
     if not ZOTERO_USER_ID or not ZOTERO_API_KEY:
         return None
-    return zotero.Zotero(ZOTERO_USER_ID, 'user', ZOTERO_API_KEY)
+    with _client_lock:
+        if _client is None:
+            # pyzotero is slow to import; only load it when Zotero is configured and used
+            from pyzotero import zotero
+            _client = zotero.Zotero(ZOTERO_USER_ID, 'user', ZOTERO_API_KEY)
+            if ZOTERO_ENDPOINT:
+                _client.endpoint = ZOTERO_ENDPOINT.rstrip("/")
+        return _client
+
+def _item_template(zot):
+    # Fetched once per process; pyzotero would otherwise revalidate it over HTTP
+    global _template
+    with _client_lock:
+        if _template is None:
+            _template = zot.item_template('journalArticle')
+        return copy.deepcopy(_template)
+
+def build_item(zot, paper, author_names=None):
+    """
+    Fills a journalArticle template from a Paper. author_names is the
+    normalized byline (see catalog.authors_of); without it the display
+    string is split.
+    """
+    template = _item_template(zot)
+    template['title'] = paper.title
+    template['abstractNote'] = paper.abstract
+    template['url'] = paper.link
+    template['publicationTitle'] = "arXiv"
+    template['date'] = str(paper.published_date)
+    template['extra'] = f"arXiv: {paper.id}"
+
+    # Authors
+    if author_names is None:
+        author_names = catalog.split_authors(paper.authors)
+    authors_list = author_names
+    template['creators'] = []
+    for author in authors_list:
+        # Simple splitting of name into first/last if possible
+        parts = author.rsplit(" ", 1)
+        if len(parts) == 2:
+            template['creators'].append({
+                "creatorType": "author",
+                "firstName": parts[0],
+                "lastName": parts[1]
+            })
+        else:
+            template['creators'].append({
+                "creatorType": "author",
+                "firstName": "",
+                "lastName": author
+            })
+
+    # Add to collection if specified
+    if ZOTERO_COLLECTION_ID:
+        template['collections'] = [ZOTERO_COLLECTION_ID]
+    return template
 
-def add_arxiv_paper(paper):
+def add_arxiv_paper(paper, author_names=None):
     """
     Adds an ArXiv paper to Zotero.
     'paper' is a Paper model instance.
@@ -23,43 +101,13 @@ def add_arxiv_paper(paper):
         if not zot:
             return {"status": "error", "message": "Zotero credentials not configured in .env"}
 
-        # Prepare item metadata
-        template = zot.item_template('journalArticle')
-        template['title'] = paper.title
-        template['abstractNote'] = paper.abstract
-        template['url'] = paper.link
-        template['publicationTitle'] = "arXiv"
-        template['date'] = str(paper.published_date)
-        template['extra'] = f"arXiv: {paper.id}"
-        
-        # Authors
-        authors_list = paper.authors.split(", ")
-        template['creators'] = []
-        for author in authors_list:
-            # Simple splitting of name into first/last if possible
-            parts = author.rsplit(" ", 1)
-            if len(parts) == 2:
-                template['creators'].append({
-                    "creatorType": "author",
-                    "firstName": parts[0],
-                    "lastName": parts[1]
-                })
-            else:
-                template['creators'].append({
-                    "creatorType": "author",
-                    "firstName": "",
-                    "lastName": author
-                })
-
-        # Add to collection if specified
-        if ZOTERO_COLLECTION_ID:
-            template['collections'] = [ZOTERO_COLLECTION_ID]
+        template = build_item(zot, paper, author_names)
 
         # Create the item
         print(f"Adding paper {paper.id} to Zotero...")
         resp = zot.create_items([template])
         print(f"Zotero response: {resp}")
-        
+
         if isinstance(resp, dict) and 'success' in resp and resp['success']:
             return {"status": "success", "zotero_id": resp['success']['0']}
         elif isinstance(resp, list) and len(resp) > 0:
@@ -71,3 +119,124 @@ def add_arxiv_paper(paper):
     except Exception as e:
         print(f"Error adding to Zotero: {str(e)}")
         return {"status": "error", "message": f"Internal error: {str(e)}"}
+
+# --- Batch sync ---
+
+def _create_with_backoff(zot, items):
+    """
+    Sends one create_items batch, retrying throttled or failed requests with
+    exponential backoff. A server-supplied Backoff/Retry-After delay (which
+    pyzotero records on the client) takes precedence over our own.
+    Returns {batch index: (zotero key or None, error or None)}.
+    """
+    last_error = None
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            wait = max(BACKOFF_BASE * 2 ** (attempt - 1), zot.backoff_until - time.time())
+            time.sleep(wait)
+        try:
+            resp = zot.create_items(items)
+        except Exception as e:
+            last_error = f"{type(e).__name__}: {e}"
+            continue
+        if not isinstance(resp, dict) or not ('success' in resp or 'failed' in resp):
+            # A throttled (429) request comes back without a write result
+            last_error = f"Unexpected Zotero response: {resp!r}"[:500]
+            continue
+
+        results = {}
+        for idx, key in (resp.get('success') or {}).items():
+            results[int(idx)] = (key, None)
+        for idx, key in (resp.get('unchanged') or {}).items():
+            results[int(idx)] = (key, None)
+        for idx, failure in (resp.get('failed') or {}).items():
+            results[int(idx)] = (None, f"{failure.get('code')}: {failure.get('message')}")
+        for idx in range(len(items)):
+            results.setdefault(idx, (None, "Missing from Zotero response"))
+        return results
+    return {idx: (None, last_error) for idx in range(len(items))}
+
+def pending_paper_ids(db: Session, user_id=models.DEFAULT_USER_ID, now=None):
+    """Papers user_id liked that are not yet in Zotero, minus retry-queue entries that are not due yet."""
+    now = now or datetime.datetime.now()
+    liked = {r[0] for r in db.query(models.Interaction.paper_id).filter(
+        models.Interaction.user_id == user_id,
+        models.Interaction.is_liked == True,
+        models.Interaction.is_zotero == False
+    )}
+    not_due = {r[0] for r in db.query(models.ZoteroQueue.paper_id).filter(
+        models.ZoteroQueue.next_attempt_at > now
+    )}
+    return sorted(liked - not_due)
+
+def sync_papers(db: Session, paper_ids, workers=SYNC_WORKERS, user_id=models.DEFAULT_USER_ID):
+    """
+    Adds papers to Zotero in create_items batches of up to BATCH_SIZE, sent
+    from a bounded thread pool over one shared client. Successes are marked
+    is_zotero for user_id (the default profile, which the one Zotero library
+    belongs to); failures are recorded in the zotero_queue table for a
+    later sync.
+    Returns {"synced": [...ids], "failed": {id: error}}.
+    """
+    zot = get_zotero_client()
+    if not zot:
+        return {"synced": [], "failed": {}, "message": "Zotero credentials not configured in .env"}
+
+    papers = []
+    for start in range(0, len(paper_ids), 500):
+        papers.extend(db.query(models.Paper).filter(models.Paper.id.in_(paper_ids[start:start + 500])))
+    if not papers:
+        return {"synced": [], "failed": {}}
+
+    # Build payloads up front; this also primes the template cache once
+    try:
+        names = catalog.authors_of(db, [p.id for p in papers])
+        items = [build_item(zot, p, names.get(p.id)) for p in papers]
+    except Exception as e:
+        failed = {p.id: f"Item template: {type(e).__name__}: {e}" for p in papers}
+        database.writer.run(_record_results, [], failed, user_id)
+        print(f"Zotero sync failed: {e}")
+        return {"synced": [], "failed": failed}
+    batches = [(papers[i:i + BATCH_SIZE], items[i:i + BATCH_SIZE]) for i in range(0, len(papers), BATCH_SIZE)]
+
+    print(f"Syncing {len(papers)} papers to Zotero in {len(batches)} batches...")
+    synced, failed = [], {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        futures = [(batch_papers, pool.submit(_create_with_backoff, zot, batch_items))
+                   for batch_papers, batch_items in batches]
+        for batch_papers, future in futures:
+            for idx, (key, error) in future.result().items():
+                if error is None:
+                    synced.append(batch_papers[idx].id)
+                else:
+                    failed[batch_papers[idx].id] = error
+
+    database.writer.run(_record_results, synced, failed, user_id)
+    print(f"Zotero sync complete: {len(synced)} added, {len(failed)} queued for retry.")
+    return {"synced": synced, "failed": failed}
+
+def _record_results(db: Session, synced, failed, user_id=models.DEFAULT_USER_ID):
+    for start in range(0, len(synced), 500):
+        chunk = synced[start:start + 500]
+        db.query(models.Interaction).filter(
+            models.Interaction.user_id == user_id, models.Interaction.paper_id.in_(chunk)
+        ).update(
+            {models.Interaction.is_zotero: True}, synchronize_session=False
+        )
+        db.query(models.ZoteroQueue).filter(models.ZoteroQueue.paper_id.in_(chunk)).delete(
+            synchronize_session=False
+        )
+
+    now = datetime.datetime.now()
+    queued = {q.paper_id: q for q in db.query(models.ZoteroQueue).filter(
+        models.ZoteroQueue.paper_id.in_(list(failed))
+    )} if failed else {}
+    for paper_id, error in failed.items():
+        entry = queued.get(paper_id)
+        if entry is None:
+            entry = models.ZoteroQueue(paper_id=paper_id, attempts=0)
+            db.add(entry)
+        entry.attempts = (entry.attempts or 0) + 1
+        entry.last_error = error
+        entry.next_attempt_at = now + RETRY_DELAY
+    db.commit()
@@ -0,0 +1,332 @@
+"""
+Offline evaluation and benchmark harness for the recommender.
+
+Generates a synthetic astro-ph-like corpus (topic vocabularies, authors and
+categories, ~--per-day papers per announcement day) in a throwaway DB and
+plants a user who is interested in a few topics. The first --warmup-days
+are ingested and the user likes some of their relevant papers; then each of
+the --eval-days is replayed as it would happen in the app:
+
+    fetch   the day's papers are ingested (fetcher ingest path)
+    train   train_and_score picks them up and rescores
+    render  GET /?date=<day> is rendered cold and then served from cache
+    rank    the day's ranking is scored against the planted interests
+    like    the user likes relevant papers among the top of the list
+
+Ranking metrics (precision@k, NDCG@k, per-day hit rate) are reported with
+wall time, DB write time (time spent in the serialized writer) and peak RSS
+for each path, and written as JSON so runs can be compared across commits:
+
+    python -m arxiv_local.eval_benchmark --papers 50000 --output before.json
+    python -m arxiv_local.eval_benchmark --papers 50000 --compare before.json
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Topic vocabularies (primary category, words); every abstract also draws
+# from the shared BACKGROUND words, as real astro-ph abstracts do.
+TOPICS = [
+    ("astro-ph.EP", "exoplanet transit radial velocity host star planet atmosphere transmission spectrum hot jupiter super earth habitable zone kepler tess"),
+    ("astro-ph.EP", "protoplanetary disk dust grain planetesimal accretion gap ring snowline alma pebble migration debris"),
+    ("astro-ph.CO", "cosmic microwave background polarization inflation tensor anisotropy planck lensing power spectrum reionization"),
+    ("astro-ph.CO", "dark energy baryon acoustic oscillation supernova hubble constant tension expansion redshift survey cosmological parameter"),
+    ("astro-ph.CO", "dark matter halo subhalo simulation n-body weak lensing mass function concentration substructure"),
+    ("astro-ph.GA", "galaxy formation star formation rate quenching stellar mass metallicity feedback outflow morphology"),
+    ("astro-ph.GA", "milky way stellar stream halo gaia proper motion kinematics bulge disk chemical abundance"),
+    ("astro-ph.GA", "active galactic nucleus quasar supermassive black hole accretion jet broad line region reverberation"),
+    ("astro-ph.HE", "gamma ray burst afterglow jet relativistic prompt emission fermi swift synchrotron"),
+    ("astro-ph.HE", "gravitational wave binary merger neutron star black hole ligo virgo kilonova waveform"),
+    ("astro-ph.HE", "pulsar magnetar radio timing glitch fast radio burst dispersion measure magnetosphere"),
+    ("astro-ph.SR", "stellar evolution red giant asteroseismology oscillation mode convection rotation main sequence"),
+    ("astro-ph.SR", "solar flare corona coronal mass ejection magnetic field sunspot wind chromosphere"),
+    ("astro-ph.SR", "white dwarf binary cataclysmic variable mass transfer nova accretion disk orbital period"),
+    ("astro-ph.IM", "telescope instrument spectrograph calibration detector pipeline adaptive optics interferometer"),
+    ("astro-ph.IM", "machine learning neural network classification photometric redshift anomaly detection training data"),
+]
+BACKGROUND = ("we present observations data model results using analysis find show study sample high low "
+              "mass emission distribution properties evidence suggest measured estimate consistent "
+              "new first large scale signal spectra population survey sources structure light").split()
+# Share of topic words; lower makes the ranking task harder (0.12 keeps
+# precision@10 well away from both 0 and 1 with the default settings)
+TOPIC_SHARE = 0.12
+ABSTRACT_WORDS = 110
+TITLE_WORDS = 9
+SURNAMES = ["Smith", "Chen", "Garcia", "Muller", "Rossi", "Kim", "Singh", "Tanaka", "Novak", "Silva",
+            "Okafor", "Ivanova"]
+FIRST_DAY = datetime.date(2024, 1, 8)
+
+
+def announcement_days(n_days):
+    """Weekdays from FIRST_DAY on (arXiv announces Sunday-Thursday evenings, dated Mon-Fri)."""
+    days, day = [], FIRST_DAY
+    while len(days) < n_days:
+        if day.weekday() < 5:
+            days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+class SyntheticCorpus:
+    """Deterministic per-day paper records with planted topics."""
+
+    def __init__(self, per_day, seed=0, n_authors=5000):
+        self.per_day = per_day
+        self.seed = seed
+        rng = random.Random(seed)
+        self.topic_words = [words.split() for _, words in TOPICS]
+        # Each topic has its own community of authors, with some overlap
+        authors = [f"{rng.choice('ABCDEFGHJKLMNPRSTVW')}. {rng.choice(SURNAMES)}{i}" for i in range(n_authors)]
+        self.authors = [rng.sample(authors, n_authors // 4) for _ in TOPICS]
+        self.topics = {}
+
+    def day(self, index, date):
+        """Returns the normalized feed records of one announcement day."""
+        rng = random.Random(self.seed * 1_000_003 + index)
+        records = []
+        for n in range(self.per_day):
+            topic = rng.randrange(len(TOPICS))
+            cross = rng.randrange(len(TOPICS)) if rng.random() < 0.2 else None
+            words = self.topic_words[topic]
+
+            def text(k):
+                return " ".join(rng.choice(words) if rng.random() < TOPIC_SHARE else rng.choice(BACKGROUND)
+                                for _ in range(k))
+
+            paper_id = f"{date:%y%m}.{index % 100:02d}{n:03d}{index // 100:d}"
+            names = rng.sample(self.authors[topic], rng.randint(1, 6))
+            categories = [TOPICS[topic][0]] + ([TOPICS[cross][0]] if cross is not None else [])
+            submitted = datetime.datetime.combine(date - datetime.timedelta(days=1), datetime.time(12),
+                                                  tzinfo=datetime.timezone.utc)
+            records.append({
+                "id": paper_id, "version": 1, "submitted": submitted,
+                "title": text(TITLE_WORDS).capitalize(), "abstract": text(ABSTRACT_WORDS),
+                "authors": ", ".join(names), "author_names": names,
+                "published_date": date, "updated_date": date,
+                "arxiv_category": categories[0], "categories": list(dict.fromkeys(categories)),
+                "link": f"http://arxiv.org/abs/{paper_id}v1",
+            })
+            self.topics[paper_id] = topic
+        return records
+
+
+def plant_interests(n_interests, seed):
+    """Topic -> relevance weight for the simulated user (first interest strongest)."""
+    topics = random.Random(seed + 7).sample(range(len(TOPICS)), n_interests)
+    return {t: 1.0 / (rank + 1) for rank, t in enumerate(topics)}
+
+
+def ranking_metrics(ranked_ids, relevant, k):
+    top = ranked_ids[:k]
+    hits = [1.0 if pid in relevant else 0.0 for pid in top]
+    dcg = sum(h / math.log2(i + 2) for i, h in enumerate(hits))
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(min(k, len(relevant))))
+    return {
+        f"precision@{k}": sum(hits) / k,
+        f"ndcg@{k}": dcg / ideal if ideal else 0.0,
+        f"hit@{k}": 1.0 if any(hits) else 0.0,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux (bytes on macOS)
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+class StageTimer:
+    """Accumulates wall time, DB write time and call counts per stage."""
+
+    def __init__(self):
+        self.stages = {}
+        self.current = None
+
+    def stage(self, name):
+        timer = self
+
+        class _Stage:
+            def __enter__(self):
+                self.t0 = time.perf_counter()
+                self.previous, timer.current = timer.current, name
+                timer.stages.setdefault(name, {"wall_s": 0.0, "db_write_s": 0.0, "calls": 0, "samples_ms": []})
+                return self
+
+            def __exit__(self, *exc):
+                elapsed = time.perf_counter() - self.t0
+                entry = timer.stages[name]
+                entry["wall_s"] += elapsed
+                entry["calls"] += 1
+                entry["samples_ms"].append(elapsed * 1e3)
+                entry["peak_rss_mb"] = peak_rss_mb()
+                timer.current = self.previous
+
+        return _Stage()
+
+    def wrap_writer(self, writer):
+        """Attributes time spent in writer.run to the current stage."""
+        run = writer.run
+
+        def timed_run(func, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return run(func, *args, **kwargs)
+            finally:
+                if self.current:
+                    self.stages[self.current]["db_write_s"] += time.perf_counter() - t0
+        writer.run = timed_run
+
+    def report(self):
+        out = {}
+        for name, entry in self.stages.items():
+            samples = sorted(entry.pop("samples_ms"))
+            entry["p50_ms"] = samples[len(samples) // 2] if samples else None
+            entry["max_ms"] = samples[-1] if samples else None
+            out[name] = entry
+        return out
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="arxiv_local_eval_")
+    os.environ["ARXIV_LOCAL_DB_URL"] = f"sqlite:///{workdir}/eval.db"
+    os.environ["ARXIV_LOCAL_STATE_DIR"] = os.path.join(workdir, "recommender_state")
+    if args.profile_mode:
+        os.environ["ARXIV_LOCAL_PROFILE_MODE"] = args.profile_mode
+
+    from fastapi.testclient import TestClient
+    from arxiv_local.app import main as app_main, fetcher, recommender, rankings, page_cache, migrations
+    from arxiv_local.app.database import database, models
+
+    migrations.migrate(database.engine)
+
+    timer = StageTimer()
+    timer.wrap_writer(database.writer)
+    corpus = SyntheticCorpus(args.per_day, seed=args.seed)
+    interests = plant_interests(args.interests, args.seed)
+    rng = random.Random(args.seed + 1)
+    n_days = max(args.papers // args.per_day, args.eval_days + 1)
+    days = announcement_days(n_days)
+    warmup, replay = days[:-args.eval_days], days[-args.eval_days:]
+    client = TestClient(app_main.app)
+
+    def relevant_ids(records):
+        return {r["id"] for r in records if corpus.topics[r["id"]] in interests}
+
+    def like(paper_ids):
+        for pid in paper_ids:
+            with timer.stage("like"):
+                app_main._toggle_like(pid)
+
+    with database.SessionLocal() as db:
+        # Backlog: everything before the replay window, with some likes
+        print(f"Ingesting {len(warmup)} days ({len(warmup) * args.per_day} papers)...")
+        liked_before = []
+        for i, day in enumerate(warmup):
+            records = corpus.day(i, day)
+            with timer.stage("fetch_backlog"):
+                fetcher._ingest_stream(db, records, {})
+            if i >= len(warmup) - args.warmup_days:
+                liked_before += [pid for pid in relevant_ids(records) if rng.random() < args.like_prob / 4]
+        like(liked_before)
+        with timer.stage("train_initial"):
+            recommender.train_and_score(db)
+
+        per_day = []
+        for j, day in enumerate(replay):
+            records = corpus.day(len(warmup) + j, day)
+            with timer.stage("fetch"):
+                fetcher._ingest_stream(db, records, {})
+            with timer.stage("train"):
+                recommender.train_and_score(db)
+
+            page_cache.pages.invalidate()
+            with timer.stage("render_cold"):
+                resp = client.get("/", params={"date": day.isoformat()})
+            with timer.stage("render_cached"):
+                client.get("/", params={"date": day.isoformat()})
+            assert resp.status_code == 200, resp.status_code
+
+            ranked = [p.id for p, *_ in rankings.get_day(db, day, models.DEFAULT_USER_ID)]
+            relevant = relevant_ids(records)
+            metrics = ranking_metrics(ranked, relevant, args.k)
+            metrics.update(date=day.isoformat(), papers=len(ranked), relevant=len(relevant))
+            per_day.append(metrics)
+
+            # The user reads the top of the list and likes some relevant papers
+            like([pid for pid in ranked[:args.read_depth] if pid in relevant and rng.random() < args.like_prob])
+
+    keys = [f"precision@{args.k}", f"ndcg@{args.k}", f"hit@{args.k}"]
+    summary = {key: sum(d[key] for d in per_day) / len(per_day) for key in keys}
+    summary["per_day_hit_rate"] = summary.pop(f"hit@{args.k}")
+    return {
+        "revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "corpus": {"papers": len(days) * args.per_day, "days": len(days), "liked_before_replay": len(liked_before),
+                   "interests": {f"{TOPICS[t][0]}:{TOPICS[t][1].split()[0]}": w for t, w in interests.items()}},
+        "metrics": summary,
+        "per_day": per_day,
+        "timings": timer.report(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(current, baseline):
+    print(f"\nAgainst {baseline.get('revision')}:")
+    for key, value in current["metrics"].items():
+        old = baseline.get("metrics", {}).get(key)
+        if old is not None:
+            print(f"  {key:<18} {old:8.3f} -> {value:8.3f}")
+    for stage, entry in current["timings"].items():
+        old = baseline.get("timings", {}).get(stage)
+        if old:
+            print(f"  {stage:<18} {old['wall_s']:8.2f}s -> {entry['wall_s']:8.2f}s  "
+                  f"(writes {old['db_write_s']:.2f}s -> {entry['db_write_s']:.2f}s)")
+    print(f"  {'peak RSS':<18} {baseline.get('peak_rss_mb', 0):8.0f}MB -> {current['peak_rss_mb']:8.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=20000, help="Corpus size (10k-500k)")
+    parser.add_argument("--per-day", type=int, default=80, help="Papers per announcement day")
+    parser.add_argument("--eval-days", type=int, default=10, help="Days replayed at the end")
+    parser.add_argument("--warmup-days", type=int, default=20, help="Backlog days the user liked papers on")
+    parser.add_argument("--interests", type=int, default=3, help="Planted interest topics")
+    parser.add_argument("--like-prob", type=float, default=0.5, help="Chance the user likes a relevant paper they read")
+    parser.add_argument("--read-depth", type=int, default=20, help="How far down each day the user reads")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--profile-mode", choices=["mean", "clusters"], default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"Wrote {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
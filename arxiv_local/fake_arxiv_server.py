@@ -0,0 +1,125 @@
+"""
+Local stand-in for the arXiv query API, for exercising the fetcher without
+touching export.arxiv.org.
+
+Serves a deterministic, newest-first astro-ph Atom feed and honours the
+start/max_results paging parameters. Every 7th entry is a v2 revision.
+
+    python -m arxiv_local.fake_arxiv_server --port 8765 --total 3000
+
+then point the harvester at it:
+
+    fetcher.harvest_papers(db, api_url="http://127.0.0.1:8765/api/query?", delay=0)
+"""
+import argparse
+import datetime
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+WORDS = ("galaxy star planet exoplanet cosmology dark matter energy black hole neutron "
+         "pulsar supernova cluster halo disk gas dust transit lensing inflation spectra "
+         "telescope survey accretion magnetar quasar nebula metallicity").split()
+CATEGORIES = ["astro-ph.GA", "astro-ph.CO", "astro-ph.EP", "astro-ph.HE", "astro-ph.IM", "astro-ph.SR"]
+
+
+class FeedState:
+    """The synthetic corpus: `total` entries, one every `spacing` minutes back from `newest`."""
+
+    def __init__(self, total=3000, newest=None, spacing_minutes=20, seed=0):
+        self.total = total
+        self.newest = newest or datetime.datetime(2026, 3, 20, 18, 0, tzinfo=datetime.timezone.utc)
+        self.spacing = datetime.timedelta(minutes=spacing_minutes)
+        self.seed = seed
+        self.requests = [] # (start, max_results) per request, for assertions
+
+    def entry(self, i):
+        # IDs and content follow from the timestamp, so moving `newest`
+        # forward (a new announcement day) keeps older entries unchanged.
+        ts = self.newest - i * self.spacing
+        seq = int(ts.timestamp()) // int(self.spacing.total_seconds())
+        rnd = random.Random(self.seed * 1_000_003 + seq)
+        paper_id = f"{ts:%y%m}.{seq % 100000:05d}"
+        version = "v2" if seq % 7 == 6 else "v1"
+        cats = rnd.sample(CATEGORIES, rnd.randint(1, 3))
+        title = " ".join(rnd.choices(WORDS, k=8)).capitalize()
+        if seq % 11 == 0:
+            title += " at $z\\sim 2"  # unbalanced math, as seen in real feeds
+        return {
+            "id": f"{paper_id}{version}",
+            "published": ts,
+            "updated": ts + (datetime.timedelta(days=2) if version != "v1" else datetime.timedelta(0)),
+            "title": title,
+            "summary": " ".join(rnd.choices(WORDS, k=150)),
+            "authors": [f"{rnd.choice('ABCDEFGH')}. Author{rnd.randint(0, 400)}" for _ in range(rnd.randint(1, 6))],
+            "categories": cats,
+        }
+
+    def render(self, start, max_results):
+        stop = min(self.total, start + max_results)
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom" '
+            'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">',
+            f"<opensearch:totalResults>{self.total}</opensearch:totalResults>",
+            f"<opensearch:startIndex>{start}</opensearch:startIndex>",
+            f"<opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>",
+        ]
+        for i in range(start, stop):
+            e = self.entry(i)
+            authors = "".join(f"<author><name>{escape(a)}</name></author>" for a in e["authors"])
+            cats = "".join(f'<category term="{c}" scheme="http://arxiv.org/schemas/atom"/>' for c in e["categories"])
+            parts.append(
+                f"<entry><id>http://arxiv.org/abs/{e['id']}</id>"
+                f"<updated>{e['updated']:%Y-%m-%dT%H:%M:%SZ}</updated>"
+                f"<published>{e['published']:%Y-%m-%dT%H:%M:%SZ}</published>"
+                f"<title>{escape(e['title'])}</title>"
+                f"<summary>  {escape(e['summary'])}\n</summary>{authors}"
+                f'<link href="http://arxiv.org/abs/{e["id"]}" rel="alternate" type="text/html"/>'
+                f'<link title="pdf" href="http://arxiv.org/pdf/{e["id"]}" rel="related" type="application/pdf"/>'
+                f'<arxiv:primary_category term="{e["categories"][0]}" scheme="http://arxiv.org/schemas/atom"/>'
+                f"{cats}</entry>"
+            )
+        parts.append("</feed>")
+        return "\n".join(parts).encode("utf-8")
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            start = int(query.get("start", ["0"])[0])
+            max_results = int(query.get("max_results", ["10"])[0])
+            state.requests.append((start, max_results))
+            body = state.render(start, max_results)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/atom+xml; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(state=None, host="127.0.0.1", port=0):
+    """Starts the server on a daemon thread. Returns (server, api_url, state)."""
+    state = state or FeedState()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/api/query?", state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--total", type=int, default=3000)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FeedState(total=args.total)))
+    print(f"Serving fake arXiv API on http://{args.host}:{args.port}/api/query?")
+    server.serve_forever()
@@ -0,0 +1,131 @@
+"""
+Local stand-in for arXiv's file server (/e-print/<id>v<n> and
+/pdf/<id>v<n>), for exercising the full-text pipeline offline.
+
+E-prints are gzipped tarballs with a main .tex file that \\input{}s a
+section file, plus a figure; every 5th paper is a single gzipped .tex file
+instead, as arXiv serves single-file submissions. Papers can be made to
+fail: those whose number is a multiple of `missing_every` get a 404, the
+first `throttle` requests get a 503 with Retry-After, and with `delay` each
+response is held back that many seconds.
+
+    python -m arxiv_local.fake_files_server --port 8767
+
+then run the app with
+
+    ARXIV_LOCAL_FULLTEXT=1 ARXIV_FILES_URL=http://127.0.0.1:8767
+"""
+import argparse
+import gzip
+import io
+import random
+import re
+import tarfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ("galaxy star planet exoplanet cosmology dark matter energy black hole neutron "
+         "pulsar supernova cluster halo disk gas dust transit lensing inflation spectra "
+         "telescope survey accretion magnetar quasar nebula metallicity").split()
+
+
+class FilesState:
+    """Server behaviour and the requests it has seen."""
+
+    def __init__(self, missing_every=0, throttle=0, delay=0.0, seed=0):
+        self.missing_every = missing_every
+        self.throttle = throttle
+        self.delay = delay
+        self.seed = seed
+        self.requests = []  # (monotonic time, path) per request, for assertions
+        self._lock = threading.Lock()
+
+    def _words(self, rnd, n):
+        return " ".join(rnd.choices(WORDS, k=n))
+
+    def tex(self, paper_id):
+        rnd = random.Random(f"{self.seed}:{paper_id}")
+        return (
+            "\\documentclass{aastex631}\n\\usepackage{graphicx}\n"
+            f"\\title{{{self._words(rnd, 6)}}}\n\\begin{{document}}\n"
+            f"\\begin{{abstract}}\n{self._words(rnd, 40)}\n\\end{{abstract}}\n\\maketitle\n"
+            f"\\section{{Introduction}}\n{self._words(rnd, 200)} \\citep{{smith2020}} % a comment\n"
+            "We find $M_\\star \\sim 10^{10}\\,M_\\odot$ for the \\emph{sample}.\n"
+            "\\begin{equation}\nL = 4 \\pi R^2 \\sigma T^4\n\\end{equation}\n"
+            "\\input{methods}\n\\begin{thebibliography}{}\n\\bibitem{smith2020} Smith 2020\n"
+            "\\end{thebibliography}\n\\end{document}\n"
+        ), f"\\section{{Methods}}\n{self._words(rnd, 150)}\n"
+
+    def eprint(self, paper_id, number):
+        main, methods = self.tex(paper_id)
+        if number % 5 == 0:
+            return gzip.compress((main.replace("\\input{methods}", methods)).encode())
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            for name, data in (("ms.tex", main.encode()), ("methods.tex", methods.encode()),
+                               ("fig1.png", bytes(range(256)) * 40)):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+    def respond(self, path):
+        """Returns (status, headers, body) for a request path."""
+        with self._lock:
+            self.requests.append((time.monotonic(), path))
+            throttled = len(self.requests) <= self.throttle
+        if throttled:
+            return 503, {"Retry-After": "1"}, b"busy"
+        match = re.fullmatch(r"/(e-print|pdf)/(.+?)(v\d+)?", path)
+        if not match:
+            return 404, {}, b"not found"
+        kind, paper_id = match.group(1), match.group(2)
+        number = int(re.sub(r"\D", "", paper_id) or 0)
+        if self.missing_every and number % self.missing_every == 0:
+            return 404, {}, b"not found"
+        if kind == "pdf":
+            # Not a real PDF, but it has the header the pipeline sniffs
+            return 200, {"Content-Type": "application/pdf"}, b"%PDF-1.5\n" + self.tex(paper_id)[0].encode()
+        return 200, {"Content-Type": "application/x-eprint-tar"}, self.eprint(paper_id, number)
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, headers, body = state.respond(self.path)
+            if state.delay:
+                time.sleep(state.delay)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(state=None, host="127.0.0.1", port=0):
+    """Starts the server on a daemon thread. Returns (server, base URL, state)."""
+    state = state or FilesState()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}", state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--missing-every", type=int, default=0)
+    parser.add_argument("--throttle", type=int, default=0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    state = FilesState(missing_every=args.missing_every, throttle=args.throttle, delay=args.delay)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Serving fake arXiv files on http://{args.host}:{args.port}")
+    server.serve_forever()
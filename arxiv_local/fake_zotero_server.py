@@ -0,0 +1,142 @@
+"""
+Local stand-in for the Zotero web API, for exercising the Zotero sync
+without a real library.
+
+Implements the two calls the app makes: GET /items/new (item template) and
+POST /users/<id>/items (create_items). It can inject latency, rate limiting
+(429 with Retry-After, or a Backoff header on successful writes) and
+per-item failures.
+
+    python -m arxiv_local.fake_zotero_server --port 8766
+
+then run the app with
+
+    ZOTERO_USER_ID=1 ZOTERO_API_KEY=x ZOTERO_ENDPOINT=http://127.0.0.1:8766
+"""
+import argparse
+import json
+import random
+import string
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+TEMPLATE = {
+    "itemType": "journalArticle", "title": "", "creators": [{"creatorType": "author", "firstName": "", "lastName": ""}],
+    "abstractNote": "", "publicationTitle": "", "volume": "", "issue": "", "pages": "", "date": "",
+    "series": "", "seriesTitle": "", "seriesText": "", "journalAbbreviation": "", "language": "",
+    "DOI": "", "ISSN": "", "shortTitle": "", "url": "", "accessDate": "", "archive": "",
+    "archiveLocation": "", "libraryCatalog": "", "callNumber": "", "rights": "", "extra": "",
+    "tags": [], "collections": [], "relations": {},
+}
+
+
+class ZoteroState:
+    """
+    Server behaviour and what it has seen. Items whose "extra" field
+    contains any of fail_markers are rejected with a per-item 400; the first
+    `throttle` write requests get a 429. With `backoff`, successful writes
+    ask the client to wait that many seconds before the next request.
+    """
+
+    def __init__(self, latency=0.0, throttle=0, retry_after=1, fail_markers=(), backoff=0):
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.fail_markers = tuple(fail_markers)
+        self.backoff = backoff
+        self.items = []
+        self.write_requests = 0
+        self.writes = [] # (monotonic time, item count) per write request, for assertions
+        self.template_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def create(self, payload):
+        success, failed = {}, {}
+        for idx, item in enumerate(payload):
+            if any(m in item.get("extra", "") for m in self.fail_markers):
+                failed[str(idx)] = {"key": None, "code": 400, "message": "Rejected by fake server"}
+                continue
+            key = "".join(random.choices(string.ascii_uppercase + string.digits, k=8))
+            with self.lock:
+                self.items.append(dict(item, key=key))
+            success[str(idx)] = key
+        return {
+            "success": success,
+            "successful": {i: {"key": k, "data": payload[int(i)]} for i, k in success.items()},
+            "unchanged": {},
+            "failed": failed,
+        }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body, headers=()):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Last-Modified-Version", "1")
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if urlparse(self.path).path.rstrip("/").endswith("/items/new"):
+                state.template_requests += 1
+                return self._send_json(200, TEMPLATE)
+            self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"[]")
+            if not urlparse(self.path).path.rstrip("/").endswith("/items"):
+                return self._send_json(404, {"error": "not found"})
+            if len(payload) > 50:
+                return self._send_json(413, {"error": "Too many items"})
+
+            with state.lock:
+                state.write_requests += 1
+                state.writes.append((time.monotonic(), len(payload)))
+                throttled = state.write_requests <= state.throttle
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                if throttled:
+                    return self._send_json(429, {"error": "Too many requests"},
+                                           [("Retry-After", str(state.retry_after))])
+                if state.latency:
+                    time.sleep(state.latency)
+                self._send_json(200, state.create(payload),
+                                [("Backoff", str(state.backoff))] if state.backoff else ())
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(state=None, host="127.0.0.1", port=0):
+    """Starts the server on a daemon thread. Returns (server, endpoint, state)."""
+    state = state or ZoteroState()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}", state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per write request")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(ZoteroState(latency=args.latency)))
+    print(f"Serving fake Zotero API on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,61 @@
+"""
+Benchmark for the recommender's featurization.
+
+Generates synthetic abstracts (see eval_benchmark.SyntheticCorpus) and
+times the single-threaded TfidfVectorizer fit against the hashing
+featurizer with 1, 2, 4, ... worker processes, plus the IDF refit from
+already stored counts (what a full retrain costs once every paper is in
+the feature store). Hashing time should fall roughly with the number of
+workers, up to the number of cores.
+
+    python -m arxiv_local.featurize_benchmark --papers 200000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import time
+
+from arxiv_local.eval_benchmark import SyntheticCorpus, announcement_days
+
+
+def synthetic_texts(n, seed=0):
+    from arxiv_local.app import features
+
+    corpus = SyntheticCorpus(per_day=1000, seed=seed)
+    texts = []
+    for index, date in enumerate(announcement_days((n + 999) // 1000)):
+        texts.extend(features.paper_text(r["title"], r["abstract"]) for r in corpus.day(index, date))
+    return texts[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=200000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+    from arxiv_local.app import features
+
+    print(f"Generating {args.papers} abstracts ({os.cpu_count()} cores)...")
+    texts = synthetic_texts(args.papers)
+    batches = [texts[i:i + features.HASH_BATCH] for i in range(0, len(texts), features.HASH_BATCH)]
+
+    t0 = time.perf_counter()
+    TfidfVectorizer(stop_words="english", max_features=5000).fit_transform(texts)
+    baseline = time.perf_counter() - t0
+    print(f"{'TfidfVectorizer':>16} {baseline:>8.2f} s")
+
+    counts = None
+    for workers in args.workers:
+        t0 = time.perf_counter()
+        counts = features.hash_batches(batches, workers=workers, parallel=workers > 1)
+        seconds = time.perf_counter() - t0
+        print(f"{f'hashing x{workers}':>16} {seconds:>8.2f} s  speedup {baseline / seconds:>5.2f}")
+
+    t0 = time.perf_counter()
+    TfidfTransformer().fit_transform(counts)
+    print(f"{'IDF refit':>16} {time.perf_counter() - t0:>8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
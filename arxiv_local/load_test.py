@@ -0,0 +1,161 @@
+"""
+Load test: latency of GET / while Zotero calls and a background fetch are
+in flight.
+
+Runs the app under uvicorn against a throwaway DB, with the fake arXiv and
+fake Zotero servers standing in for the real APIs (the fake Zotero answers
+each write after --zotero-latency seconds). Readers page through the
+history while other clients add papers to Zotero and toggle likes, and one
+/fetch is triggered at the start. Prints latency percentiles for /.
+
+    python -m arxiv_local.load_test --duration 20 --readers 16
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def reader(client, dates, stop_at, latencies, errors):
+    while time.perf_counter() < stop_at:
+        date = random.choice(dates)
+        t0 = time.perf_counter()
+        try:
+            resp = await client.get("/", params={"date": date})
+            resp.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+        except Exception as e:
+            errors.append(f"GET /: {e!r}")
+
+
+async def zotero_adder(client, paper_ids, stop_at, counts, errors):
+    while time.perf_counter() < stop_at:
+        try:
+            resp = await client.post(f"/zotero/{random.choice(paper_ids)}")
+            resp.raise_for_status()
+            counts["zotero"] += 1
+        except Exception as e:
+            errors.append(f"POST /zotero: {e!r}")
+
+
+async def liker(client, paper_ids, stop_at, counts, errors):
+    while time.perf_counter() < stop_at:
+        t0 = time.perf_counter()
+        try:
+            resp = await client.post(f"/like/{random.choice(paper_ids)}")
+            resp.raise_for_status()
+            counts["like"] += 1
+            counts["like_latencies"].append(time.perf_counter() - t0)
+        except Exception as e:
+            errors.append(f"POST /like: {e!r}")
+        await asyncio.sleep(0.5)
+
+
+async def run_load(base_url, dates, paper_ids, args):
+    import httpx
+
+    latencies, errors = [], []
+    counts = {"zotero": 0, "like": 0, "like_latencies": []}
+    limits = httpx.Limits(max_connections=args.readers + args.zotero_clients + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        # Warm up one request so startup cost is not counted
+        await client.get("/")
+        resp = await client.post("/fetch", follow_redirects=False)
+        print(f"Triggered background fetch: HTTP {resp.status_code}")
+
+        stop_at = time.perf_counter() + args.duration
+        tasks = [reader(client, dates, stop_at, latencies, errors) for _ in range(args.readers)]
+        tasks += [zotero_adder(client, paper_ids, stop_at, counts, errors) for _ in range(args.zotero_clients)]
+        tasks.append(liker(client, paper_ids, stop_at, counts, errors))
+        await asyncio.gather(*tasks)
+    return latencies, errors, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--zotero-clients", type=int, default=4)
+    parser.add_argument("--zotero-latency", type=float, default=1.0)
+    parser.add_argument("--papers", type=int, default=3000, help="Papers preloaded before the test")
+    parser.add_argument("--new-papers", type=int, default=2000, help="Papers the background fetch finds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="arxiv_local_load_")
+    os.environ["ARXIV_LOCAL_DB_URL"] = f"sqlite:///{workdir}/load.db"
+    os.environ["ARXIV_LOCAL_STATE_DIR"] = os.path.join(workdir, "recommender_state")
+
+    from arxiv_local import fake_arxiv_server, fake_zotero_server
+
+    # Date the feed up to now so the fetch's 90-day cleanup keeps it
+    now = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+    feed_server, api_url, feed = fake_arxiv_server.serve(
+        fake_arxiv_server.FeedState(total=args.papers + args.new_papers, newest=now))
+    zotero_srv, zotero_url, zotero_state = fake_zotero_server.serve(
+        fake_zotero_server.ZoteroState(latency=args.zotero_latency))
+    os.environ["ARXIV_API_URL"] = api_url
+    os.environ.update(ZOTERO_USER_ID="1", ZOTERO_API_KEY="load-test", ZOTERO_ENDPOINT=zotero_url)
+
+    import uvicorn
+    from arxiv_local.app import main as app_main, fetcher, migrations
+    from arxiv_local.app.database import database, models
+
+    # The server's lifespan would migrate too, but the preload runs first
+    migrations.migrate(database.engine)
+    fetcher.HARVEST_PAGE_DELAY = 0
+    # Preload the older part of the feed; the newest entries are left for /fetch
+    newest = feed.newest
+    feed.newest = newest - args.new_papers * feed.spacing
+    feed.total = args.papers
+    with database.SessionLocal() as db:
+        fetcher.harvest_papers(db, max_results=args.papers, page_size=500, delay=0)
+        dates = [d.isoformat() for (d,) in db.query(models.RankedDay.date)]
+        paper_ids = [pid for (pid,) in db.query(models.Paper.id)]
+    feed.newest = newest
+    feed.total = args.papers + args.new_papers
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    print(f"Load: {args.readers} readers, {args.zotero_clients} Zotero clients "
+          f"({args.zotero_latency}s per call), 1 background fetch, {args.duration}s")
+    latencies, errors, counts = asyncio.run(run_load(f"http://127.0.0.1:{port}", dates, paper_ids, args))
+    server.should_exit = True
+
+    ms = [x * 1000 for x in latencies]
+    print(f"GET / requests: {len(ms)}  ({len(ms) / args.duration:.0f}/s)")
+    print(f"  p50 {percentile(ms, 50):.1f} ms  p95 {percentile(ms, 95):.1f} ms  "
+          f"p99 {percentile(ms, 99):.1f} ms  max {max(ms, default=float('nan')):.1f} ms")
+    like_ms = [x * 1000 for x in counts["like_latencies"]]
+    print(f"POST /like: p50 {percentile(like_ms, 50):.1f} ms  max {max(like_ms, default=float('nan')):.1f} ms")
+    print(f"Zotero adds: {counts['zotero']}  likes: {counts['like']}  "
+          f"fake Zotero writes: {zotero_state.write_requests}  feed requests: {len(feed.requests)}")
+    if errors:
+        print(f"{len(errors)} errors, first: {errors[0]}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Benchmark for the recommender's profile scoring.
+
+Builds synthetic L2-normalised document-term matrices of increasing size
+(documents drawn from a few topics) and times ScoringIndex.compute_scores
+in "mean" and "clusters" mode, with and without negative feedback. The
+time per paper should stay flat as the corpus grows, i.e. scoring is linear
+in corpus size. Also reports the R-precision for held-out papers of the
+liked topics (the share of them ranked within the top len(held-out)), to
+show what the multi-centroid profile buys for a user with several separate
+interests.
+
+With --users N it instead times scoring N users with different interests
+in one batched product (as a training run does) against scoring them one
+by one.
+
+    python -m arxiv_local.profile_benchmark --sizes 25000 50000 100000 200000
+    python -m arxiv_local.profile_benchmark --users 50 --sizes 6000
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+N_FEATURES = 5000
+N_TOPICS = 20
+TOPIC_WORDS = 150
+WORDS_PER_DOC = 80
+TOPIC_SHARE = 0.4
+# Topics the simulated user likes
+INTERESTS = 3
+USER = 1
+
+
+def synthetic_corpus(n, seed=0):
+    """Returns (csr matrix, topic of each row)."""
+    rng = np.random.default_rng(seed)
+    topic_vocab = rng.integers(0, N_FEATURES, size=(N_TOPICS, TOPIC_WORDS))
+    topics = rng.integers(0, N_TOPICS, size=n)
+    n_topic = int(WORDS_PER_DOC * TOPIC_SHARE)
+    topical = topic_vocab[topics[:, None], rng.integers(0, TOPIC_WORDS, size=(n, n_topic))]
+    background = rng.integers(0, N_FEATURES, size=(n, WORDS_PER_DOC - n_topic))
+    cols = np.hstack([topical, background]).ravel()
+    rows = np.repeat(np.arange(n), WORDS_PER_DOC)
+    matrix = sp.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(n, N_FEATURES))
+    matrix.sum_duplicates()
+    matrix.data = 1 + np.log(matrix.data)
+    return normalize(matrix), topics
+
+
+def best_of(func, repeats=3):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def run(n, n_liked, seed=0):
+    from arxiv_local.app import recommender
+
+    matrix, topics = synthetic_corpus(n, seed)
+    ids = [f"p{i}" for i in range(n)]
+    index = recommender.ScoringIndex(None, matrix, ids, n)
+
+    # A user with several interests: likes from the first INTERESTS
+    # topics, unevenly (most likes go to the first one); the rest of those
+    # topics is held out
+    rng = np.random.default_rng(seed + 1)
+    interest = np.flatnonzero(topics < INTERESTS)
+    share = 0.5 ** np.arange(1, INTERESTS + 1)
+    liked = np.concatenate([
+        rng.choice(np.flatnonzero(topics == t), size=max(2, int(n_liked * s / share.sum())), replace=False)
+        for t, s in enumerate(share)
+    ])
+    held_out = np.setdiff1d(interest, liked)
+    index.set_likes({USER: [ids[i] for i in liked]})
+    skipped = rng.choice(np.flatnonzero(topics >= INTERESTS), size=min(2000, n // 10), replace=False)
+    unliked = rng.choice(np.flatnonzero(topics == INTERESTS), size=5, replace=False)
+
+    top = len(held_out)
+    row = {"papers": n}
+    # Clustering depends on the likes only and is cached; it is timed below
+    index.centroids(USER)
+    for mode in ("mean", "clusters"):
+        seconds, scores = best_of(lambda: index.compute_scores(mode)[USER])
+        best = np.argpartition(-scores, top - 1)[:top]
+        row[mode] = seconds
+        row[f"{mode}_hits"] = np.isin(held_out, best).mean()
+    row["k"] = len(index.centroids(USER))
+
+    weights = recommender.UNLIKED_WEIGHT, recommender.SKIPPED_WEIGHT
+    recommender.UNLIKED_WEIGHT, recommender.SKIPPED_WEIGHT = 0.3, 0.1
+    try:
+        index.set_negatives({USER: ([ids[i] for i in unliked], [ids[i] for i in skipped])})
+        row["clusters+neg"], _ = best_of(lambda: index.compute_scores("clusters"))
+    finally:
+        recommender.UNLIKED_WEIGHT, recommender.SKIPPED_WEIGHT = weights
+    t0 = time.perf_counter()
+    index.profiles[USER]._centroids = (frozenset(), None)
+    index.centroids(USER)
+    row["cluster_fit"] = time.perf_counter() - t0
+    return row
+
+
+def run_users(n, n_users, n_liked, seed=0):
+    """Times batched against per-user scoring of n_users users."""
+    from arxiv_local.app import recommender
+
+    matrix, topics = synthetic_corpus(n, seed)
+    ids = [f"p{i}" for i in range(n)]
+    index = recommender.ScoringIndex(None, matrix, ids, n)
+    rng = np.random.default_rng(seed + 1)
+    likes = {}
+    for user_id in range(1, n_users + 1):
+        interests = rng.choice(N_TOPICS, size=INTERESTS, replace=False)
+        pool = np.flatnonzero(np.isin(topics, interests))
+        likes[user_id] = [ids[i] for i in rng.choice(pool, size=min(n_liked, len(pool)), replace=False)]
+    t0 = time.perf_counter()
+    index.set_likes(likes)
+    row = {"papers": n, "users": n_users, "set_likes": time.perf_counter() - t0}
+    for mode in ("mean", "clusters"):
+        for user_id in likes:
+            index.centroids(user_id)
+        row[mode], batched = best_of(lambda: index.compute_scores(mode))
+        row[f"{mode}_loop"], looped = best_of(lambda: {
+            user_id: index.compute_scores(mode, user_ids=[user_id])[user_id] for user_id in likes
+        })
+        assert all(np.allclose(batched[u], looped[u]) for u in likes)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25000, 50000, 100000, 200000])
+    parser.add_argument("--liked", type=int, default=60)
+    parser.add_argument("--users", type=int, default=0, help="Time batched scoring of this many users")
+    args = parser.parse_args()
+
+    if args.users:
+        print(f"{'papers':>8} {'users':>6} {'likes ms':>9} {'mean ms':>9} {'loop ms':>9} "
+              f"{'clust ms':>9} {'loop ms':>9}")
+        for n in args.sizes:
+            r = run_users(n, args.users, args.liked)
+            print(f"{n:>8} {r['users']:>6} {r['set_likes'] * 1e3:>9.1f} {r['mean'] * 1e3:>9.1f} "
+                  f"{r['mean_loop'] * 1e3:>9.1f} {r['clusters'] * 1e3:>9.1f} {r['clusters_loop'] * 1e3:>9.1f}")
+        return
+
+    print(f"{'papers':>8} {'mean ms':>9} {'clust ms':>9} {'+neg ms':>9} {'ns/paper':>9} "
+          f"{'k':>3} {'fit ms':>7} {'R-prec mean':>11} {'R-prec clust':>12}")
+    for n in args.sizes:
+        r = run(n, args.liked)
+        print(f"{n:>8} {r['mean'] * 1e3:>9.1f} {r['clusters'] * 1e3:>9.1f} {r['clusters+neg'] * 1e3:>9.1f} "
+              f"{r['clusters+neg'] / n * 1e9:>9.0f} {r['k']:>3} {r['cluster_fit'] * 1e3:>7.0f} "
+              f"{r['mean_hits']:>11.3f} {r['clusters_hits']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Cold-start benchmark for the web app.
+
+Imports arxiv_local.app.main in --runs fresh interpreters under
+`python -X importtime` and reports the median import time and the slowest
+imports. The import must stay cheap: the heavy dependencies (HEAVY) are
+loaded only when training or Zotero is used, and the DB is not opened
+until the lifespan hook runs. The script exits with status 1 when
+
+    - importing main pulls in one of HEAVY,
+    - importing main creates the DB file,
+    - the median exceeds --budget-ms (ARXIV_LOCAL_STARTUP_BUDGET_MS,
+      default 2000), or
+    - with --compare, the median is more than --tolerance slower than the
+      saved report.
+
+    python -m arxiv_local.startup_benchmark --output startup.json
+    python -m arxiv_local.startup_benchmark --compare startup.json
+
+tests/test_startup.py runs the same checks in the test suite.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from arxiv_local.eval_benchmark import git_revision
+
+TARGET = "arxiv_local.app.main"
+HEAVY = ("sklearn", "scipy", "numpy", "pyzotero", "dotenv", "httpx", "pypdf")
+# Default --budget-ms; also the limit tests/test_startup.py holds the import to
+BUDGET_MS = float(os.getenv("ARXIV_LOCAL_STARTUP_BUDGET_MS", "2000"))
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """Returns {module: cumulative microseconds} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure_once(workdir):
+    db_path = os.path.join(workdir, "startup.db")
+    env = dict(os.environ, ARXIV_LOCAL_DB_URL=f"sqlite:///{db_path}",
+               ARXIV_LOCAL_STATE_DIR=os.path.join(workdir, "recommender_state"))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+                          cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {TARGET} failed:\n{proc.stderr[-2000:]}")
+    modules = parse_importtime(proc.stderr)
+    touched_db = os.path.exists(db_path)
+    if touched_db:
+        os.remove(db_path)
+    return modules, touched_db
+
+
+def run(runs=5, top=10):
+    """Imports TARGET in runs fresh interpreters. Returns the report (see check())."""
+    times, slowest = [], {}
+    heavy, touched_db = set(), False
+    with tempfile.TemporaryDirectory(prefix="arxiv_local_startup_") as workdir:
+        for _ in range(runs):
+            modules, touched = measure_once(workdir)
+            times.append(modules[TARGET] / 1000)
+            touched_db |= touched
+            heavy |= {m for m in modules if m.split(".")[0] in HEAVY}
+            for name, us in modules.items():
+                if name != TARGET:
+                    slowest.setdefault(name, []).append(us / 1000)
+    top = sorted(((statistics.median(v), k) for k, v in slowest.items()), reverse=True)[:top]
+    return {
+        "revision": git_revision(),
+        "runs": runs,
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "max_ms": max(times),
+        "slowest": {name: round(ms, 1) for ms, name in top},
+        "heavy_imports": sorted({m.split(".")[0] for m in heavy}),
+        "touched_db": touched_db,
+    }
+
+
+def check(report, budget_ms=BUDGET_MS, baseline=None, tolerance=0.25):
+    """Returns the list of failures (empty when startup is within limits)."""
+    failures = []
+    if report["heavy_imports"]:
+        failures.append(f"importing {TARGET} loads {', '.join(report['heavy_imports'])}")
+    if report["touched_db"]:
+        failures.append(f"importing {TARGET} opened the DB")
+    if budget_ms and report["median_ms"] > budget_ms:
+        failures.append(f"median {report['median_ms']:.0f} ms exceeds the {budget_ms:.0f} ms budget")
+    if baseline:
+        limit = baseline["median_ms"] * (1 + tolerance)
+        print(f"\nAgainst {baseline.get('revision')}: {baseline['median_ms']:.0f} ms -> {report['median_ms']:.0f} ms")
+        if report["median_ms"] > limit:
+            failures.append(f"median {report['median_ms']:.0f} ms is more than {tolerance:.0%} "
+                            f"slower than {baseline['median_ms']:.0f} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS,
+                        help="Fail above this median import time (0 for no limit)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against --compare")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args.runs, args.top)
+    print(f"import {TARGET}: median {report['median_ms']:.0f} ms "
+          f"(min {report['min_ms']:.0f}, max {report['max_ms']:.0f}) over {args.runs} runs")
+    for name, ms in report["slowest"].items():
+        print(f"  {ms:8.1f} ms  {name}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    failures = check(report, args.budget_ms, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
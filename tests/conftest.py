@@ -0,0 +1,83 @@
+"""
+Shared fixtures. The app reads its DB URL and state directories from the
+environment when it is imported, so they are pointed at a scratch
+directory before anything from arxiv_local is imported.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+SCRATCH = tempfile.mkdtemp(prefix="arxiv_local_tests_")
+os.environ["ARXIV_LOCAL_DB_URL"] = f"sqlite:///{os.path.join(SCRATCH, 'test.db')}"
+os.environ["ARXIV_LOCAL_STATE_DIR"] = os.path.join(SCRATCH, "recommender_state")
+os.environ["ARXIV_LOCAL_FULLTEXT_DIR"] = os.path.join(SCRATCH, "fulltext_cache")
+os.environ["ARXIV_LOCAL_FEATURE_WORKERS"] = "1"
+os.environ["ARXIV_LOCAL_SCHEDULE"] = ""
+os.environ["ARXIV_LOCAL_FULLTEXT"] = "0"
+# Empty, so a developer's .env cannot point the tests at a real library
+for name in ("ZOTERO_USER_ID", "ZOTERO_API_KEY", "ZOTERO_COLLECTION_ID", "ZOTERO_ENDPOINT"):
+    os.environ[name] = ""
+
+from arxiv_local.app.database import database, models  # noqa: E402
+from arxiv_local.app import migrations, recommender, similarity, users  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _scratch():
+    yield
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+@pytest.fixture
+def db():
+    """A session on the migrated test DB, emptied (but for the default user) after each test."""
+    migrations.migrate(database.engine)
+    session = database.SessionLocal()
+    yield session
+    session.rollback()
+    session.close()
+    with database.engine.begin() as conn:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+        conn.execute(models.User.__table__.insert().values(id=models.DEFAULT_USER_ID, name="default"))
+    users.reset()
+    recommender.reset_index()
+    similarity.reset()
+    shutil.rmtree(os.environ["ARXIV_LOCAL_STATE_DIR"], ignore_errors=True)
+
+
+def add_papers(db, n, start=0, day=None, prefix="2601"):
+    """Adds n synthetic papers, 60 per announcement day from day (default 2026-01-05)."""
+    import datetime
+    import random
+
+    words = ("galaxy star planet exoplanet cosmology dark matter energy black hole neutron "
+             "pulsar supernova cluster halo disk gas dust transit lensing inflation").split()
+    day = day or datetime.date(2026, 1, 5)
+    rnd = random.Random(start)
+    ids = []
+    for i in range(start, start + n):
+        d = day + datetime.timedelta(days=(i - start) // 60)
+        pid = f"{prefix}.{i:05d}"
+        db.add(models.Paper(id=pid, title=" ".join(rnd.choices(words, k=8)),
+                            authors=", ".join(f"A. Author{rnd.randint(0, 50)}" for _ in range(3)),
+                            abstract=" ".join(rnd.choices(words, k=80)), published_date=d, updated_date=d,
+                            arxiv_category="astro-ph.GA", link=f"http://arxiv.org/abs/{pid}v1"))
+        ids.append(pid)
+    db.commit()
+    return ids
+
+
+class FakeJob:
+    """Stands in for jobs.Job when calling a task function directly."""
+
+    def __init__(self):
+        self.stage = None
+        self.progress = {}
+
+    def update(self, stage=None, **counters):
+        if stage is not None:
+            self.stage = stage
+        self.progress.update(counters)
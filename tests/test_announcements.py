@@ -0,0 +1,94 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from arxiv_local.app import announcements, rankings
+from arxiv_local.app.database import models
+
+from conftest import add_papers
+
+D = datetime.date
+UTC = datetime.datetime  # naive timestamps are UTC
+
+
+@pytest.fixture(scope="module")
+def cal():
+    return announcements.Calendar(2026, 2026)
+
+
+@pytest.mark.parametrize("submitted, listed", [
+    # Winter (EST): the 14:00 cutoff is 19:00 UTC
+    (UTC(2026, 3, 4, 18, 59, 59), D(2026, 3, 5)),
+    (UTC(2026, 3, 4, 19, 0, 0), D(2026, 3, 6)),
+    # Summer (EDT, from 8 March): 18:00 UTC
+    (UTC(2026, 3, 11, 17, 59, 59), D(2026, 3, 12)),
+    (UTC(2026, 3, 11, 18, 0, 0), D(2026, 3, 13)),
+    (UTC(2026, 3, 11, 18, 30), D(2026, 3, 13)),
+    # Back to EST on 1 November: 18:30 UTC misses the last summer cutoff
+    # but makes the first winter one
+    (UTC(2026, 10, 30, 17, 59), D(2026, 11, 2)),
+    (UTC(2026, 10, 30, 18, 30), D(2026, 11, 3)),
+    (UTC(2026, 11, 2, 18, 30), D(2026, 11, 3)),
+    (UTC(2026, 11, 2, 19, 0), D(2026, 11, 4)),
+    # Friday's window is listed on Monday; after it, and over the weekend, Tuesday
+    (UTC(2026, 3, 6, 18, 0), D(2026, 3, 9)),
+    (UTC(2026, 3, 6, 20, 0), D(2026, 3, 10)),
+    (UTC(2026, 3, 7, 12, 0), D(2026, 3, 10)),
+    (UTC(2026, 3, 8, 23, 0), D(2026, 3, 10)),
+])
+def test_cutoff_follows_daylight_saving(cal, submitted, listed):
+    assert cal.announcement_date(submitted) == listed
+    aware = submitted.replace(tzinfo=datetime.timezone.utc).astimezone(announcements.TIMEZONE)
+    assert cal.announcement_date(aware) == listed
+
+
+def test_holiday_extends_the_window():
+    christmas = announcements.Calendar(2026, 2026, holidays={D(2026, 12, 25)})
+    thursday = UTC(2026, 12, 24, 12, 0)
+    assert announcements.Calendar(2026, 2026).announcement_date(thursday) == D(2026, 12, 25)
+    assert christmas.announcement_date(thursday) == D(2026, 12, 28)
+    assert not christmas.is_announcement_day(D(2026, 12, 25))
+    # The window closing on the Friday is unaffected
+    assert christmas.announcement_date(UTC(2026, 12, 25, 12, 0)) == D(2026, 12, 28)
+
+
+def test_holidays_from_list_or_file(tmp_path):
+    path = tmp_path / "holidays.txt"
+    path.write_text("2026-12-25  # Christmas\n\n2027-01-01\n")
+    expected = {D(2026, 12, 25), D(2027, 1, 1)}
+    assert announcements.load_holidays(str(path)) == expected
+    assert announcements.load_holidays("2026-12-25, 2027-01-01") == expected
+
+
+def test_vectorized_and_scalar_lookups_agree():
+    cal = announcements.Calendar(2026, 2026, holidays={D(2026, 7, 3), D(2026, 12, 25)})
+    # Every 37 minutes through the year, plus the seconds around each deadline
+    stamps = np.arange(np.datetime64("2026-01-01T00:00:00"), np.datetime64("2026-12-31T00:00:00"),
+                       np.timedelta64(37, "m"))
+    deadlines = np.array(cal.deadline_list, dtype=np.int64).astype("datetime64[s]")
+    deadlines = deadlines[(deadlines >= stamps[0]) & (deadlines <= stamps[-1])]
+    stamps = np.concatenate([stamps, deadlines - 1, deadlines, deadlines + 1]).astype("datetime64[s]")
+
+    vectorized = cal.announcement_dates(stamps)
+    scalar = [cal.announcement_date(t) for t in stamps.astype(datetime.datetime)]
+    assert vectorized.astype(datetime.date).tolist() == scalar
+
+
+def test_redate_rewrites_stored_dates(db, monkeypatch):
+    ids = add_papers(db, 3, day=D(2026, 12, 21))
+    submitted = [UTC(2026, 12, 24, 12, 0), UTC(2026, 12, 23, 12, 0), None]
+    for pid, ts in zip(ids, submitted):
+        db.get(models.Paper, pid).submitted_at = ts
+    db.commit()
+    rankings.rebuild_all(db)
+    christmas = announcements.Calendar(2026, 2026, holidays={D(2026, 12, 25)})
+    assert announcements.check(db, christmas) == {"checked": 2, "mismatched": 2, "undated": 1}
+
+    assert announcements.redate(db, christmas) == 2
+
+    dates = {p.id: p.published_date for p in db.query(models.Paper)}
+    assert dates == {ids[0]: D(2026, 12, 28), ids[1]: D(2026, 12, 24), ids[2]: D(2026, 12, 21)}
+    assert rankings.day_order(db, D(2026, 12, 28), models.DEFAULT_USER_ID) == [ids[0]]
+    assert announcements.check(db, christmas)["mismatched"] == 0
+    assert announcements.redate(db, christmas) == 0
@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+from arxiv_local import fake_arxiv_server
+from arxiv_local.app import fetcher
+from arxiv_local.app.database import models
+
+NEWEST = datetime.datetime(2026, 3, 20, 18, 0, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def feed():
+    """Starts a stand-in feed; returns serve(state) -> (api_url, state)."""
+    servers = []
+
+    def serve(state):
+        server, api_url, state = fake_arxiv_server.serve(state)
+        servers.append(server)
+        return api_url, state
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+
+
+def _harvest(db, api_url, **kwargs):
+    return fetcher.harvest_papers(db, api_url=api_url, delay=0, **kwargs)
+
+
+def _v1_ids(state, entries):
+    return {e["id"][:-2] for e in map(state.entry, range(entries)) if e["id"].endswith("v1")}
+
+
+def test_revisions_are_skipped(db, feed):
+    api_url, state = feed(fake_arxiv_server.FeedState(total=140, newest=NEWEST))
+    expected = _v1_ids(state, 140)
+    assert 0 < len(expected) < 140
+
+    assert _harvest(db, api_url, page_size=50) == len(expected)
+    assert {pid for (pid,) in db.query(models.Paper.id)} == expected
+
+
+def test_incremental_harvest_stops_at_newest_stored_paper(db, feed):
+    api_url, state = feed(fake_arxiv_server.FeedState(total=300, newest=NEWEST))
+    _harvest(db, api_url, page_size=50)
+    # Two days later (20-minute spacing: 144 new entries), the same corpus continues
+    api_url, later = feed(fake_arxiv_server.FeedState(total=600, newest=NEWEST + datetime.timedelta(days=2)))
+
+    new = _harvest(db, api_url, page_size=50)
+
+    # Pages reach back past the previous newest paper and no further
+    assert [start for start, _ in later.requests] == [0, 50, 100, 150]
+    assert new == len(_v1_ids(later, 144))
+    log = db.query(models.FetchLog).order_by(models.FetchLog.id.desc()).first()
+    assert log.status == "complete" and log.stop_before == NEWEST.date()
+
+
+def test_interrupted_harvest_resumes_from_checkpoint(db, feed, monkeypatch):
+    api_url, state = feed(fake_arxiv_server.FeedState(total=250, newest=NEWEST))
+    open_feed = fetcher.open_feed
+
+    def failing_open_feed(url):
+        if len(state.requests) == 2:
+            raise OSError("connection reset")
+        return open_feed(url)
+
+    monkeypatch.setattr(fetcher, "open_feed", failing_open_feed)
+    with pytest.raises(OSError):
+        _harvest(db, api_url, page_size=50)
+    log = db.query(models.FetchLog).one()
+    assert (log.status, log.next_start, log.entries_seen) == ("running", 100, 100)
+
+    monkeypatch.setattr(fetcher, "open_feed", open_feed)
+    db.expire_all()
+    new = _harvest(db, api_url, page_size=50)
+
+    # Picks up at the page that failed; the first two are not downloaded
+    # again (the last, empty page ends the feed)
+    assert [start for start, _ in state.requests] == [0, 50, 100, 150, 200, 250]
+    assert new == len(_v1_ids(state, 250)) == db.query(models.Paper).count()
+    db.refresh(log)
+    assert (log.status, log.entries_seen) == ("complete", 250)
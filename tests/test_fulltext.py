@@ -0,0 +1,144 @@
+import datetime
+import hashlib
+import os
+
+import numpy as np
+import pytest
+from conftest import FakeJob, add_papers
+
+from arxiv_local import fake_arxiv_server, fake_files_server
+from arxiv_local.app import features, fetcher, fulltext, jobs, main, recommender
+from arxiv_local.app.database import models
+
+
+MISSING_EVERY = 7
+
+
+def _missing(paper_id):
+    # Papers the stand-in server answers with a 404
+    return int(paper_id.replace(".", "")) % MISSING_EVERY == 0
+
+
+def _paths(state):
+    return [path for _, path in state.requests]
+
+
+@pytest.fixture
+def files_server(monkeypatch, tmp_path):
+    server, url, state = fake_files_server.serve(fake_files_server.FilesState(missing_every=MISSING_EVERY))
+    monkeypatch.setattr(fulltext, "FILES_URL", url)
+    monkeypatch.setattr(fulltext, "CACHE_DIR", str(tmp_path / "fulltext_cache"))
+    monkeypatch.setattr(fulltext, "HOST_INTERVAL", 0)
+    yield state
+    server.shutdown()
+
+
+def test_fetch_job_scores_first_and_leaves_full_text_to_a_capped_job(db, files_server, monkeypatch):
+    newest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    server, api_url, _ = fake_arxiv_server.serve(fake_arxiv_server.FeedState(total=150, newest=newest))
+    monkeypatch.setattr(fetcher, "ARXIV_API_URL", api_url)
+    monkeypatch.setattr(fetcher, "HARVEST_PAGE_DELAY", 0)
+    monkeypatch.setattr(fulltext, "ENABLED", True)
+    monkeypatch.setattr(fulltext, "PER_RUN", 20)
+    submitted = []
+    monkeypatch.setattr(jobs.runner, "submit", lambda kind, func, **params: submitted.append((kind, func)) or (7, True))
+    try:
+        result = main.task_fetch_and_score(FakeJob())
+    finally:
+        server.shutdown()
+
+    # Nothing was downloaded by the fetch job itself
+    assert result["new_papers"] > 20 and result["full_text_job"] == 7
+    assert files_server.requests == []
+    assert submitted == [("fulltext", main.task_fetch_full_text)]
+
+    newest_ids = [pid for (pid,) in db.query(models.Paper.id).order_by(
+        models.Paper.published_date.desc(), models.Paper.id.desc()).limit(20)]
+    db.add(models.Interaction(user_id=models.DEFAULT_USER_ID, paper_id=newest_ids[0], is_liked=True))
+    db.commit()
+    stats = main.task_fetch_full_text(FakeJob())
+    assert len(files_server.requests) == 20
+    assert stats["downloaded"] + stats["failed"] == 20 and stats["extracted"] > 0
+    # ...and rescored with the text
+    assert stats["scores_updated"] > 0
+    assert {pid for (pid,) in db.query(models.PaperText.paper_id)} == set(newest_ids)
+
+
+def test_file_is_cached_by_digest_for_the_paper_version(db, files_server):
+    pid = next(pid for pid in add_papers(db, 10) if not _missing(pid))
+    paper = db.get(models.Paper, pid)
+    paper.link = paper.link[:-2] + "v3"
+    db.commit()
+
+    fulltext.fetch_missing(db)
+
+    row = db.get(models.PaperText, pid)
+    assert (row.version, row.status, row.kind) == (3, "ok", "source")
+    assert f"/e-print/{pid}v3" in _paths(files_server)
+    path = fulltext.FileCache().path(row.digest)
+    assert path == os.path.join(fulltext.CACHE_DIR, "blobs", row.digest[:2], row.digest)
+    with open(path, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == row.digest
+    assert os.listdir(os.path.join(fulltext.CACHE_DIR, "tmp")) == []
+
+
+def test_cached_files_are_not_downloaded_again(db, files_server):
+    ids = [pid for pid in add_papers(db, 10) if not _missing(pid)]
+    assert fulltext.fetch_missing(db)["extracted"] == len(ids)
+    requests = len(files_server.requests)
+
+    # Nothing left to do
+    assert fulltext.fetch_missing(db)["downloaded"] == 0
+    # Interrupted between download and extraction: extracted from the cache
+    row = db.get(models.PaperText, ids[0])
+    row.status, row.body = "downloaded", None
+    db.commit()
+    assert fulltext.fetch_missing(db) == {"downloaded": 0, "failed": 0, "extracted": 1, "empty": 0}
+    assert len(files_server.requests) == requests
+    db.refresh(row)
+    assert row.status == "ok" and row.body
+
+
+def test_failed_downloads_wait_unless_retry_failed(db, files_server):
+    ids = add_papers(db, 30)
+    missing = sorted(pid for pid in ids if _missing(pid))
+    assert missing
+
+    stats = fulltext.fetch_missing(db)
+
+    assert stats["failed"] == len(missing)
+    failed = db.query(models.PaperText).filter(models.PaperText.status == "failed").all()
+    assert sorted(r.paper_id for r in failed) == missing
+    assert all(r.attempts == 1 and r.last_error == "HTTP 404" and r.next_attempt_at > datetime.datetime.now()
+               for r in failed)
+
+    requests = len(files_server.requests)
+    assert fulltext.fetch_missing(db)["failed"] == 0
+    assert len(files_server.requests) == requests
+
+    assert fulltext.fetch_missing(db, retry_failed=True)["failed"] == len(missing)
+    assert sorted(_paths(files_server)[requests:]) == [f"/e-print/{pid}v1" for pid in missing]
+    db.expire_all()
+    assert {r.attempts for r in db.query(models.PaperText).filter(models.PaperText.status == "failed")} == {2}
+
+
+def test_truncated_body_reaches_the_features(db, files_server, monkeypatch):
+    monkeypatch.setattr(fulltext, "BODY_CHARS", 300)
+    ids = add_papers(db, 30)
+    db.add(models.Interaction(user_id=models.DEFAULT_USER_ID, paper_id=ids[1], is_liked=True))
+    db.commit()
+    recommender.train_and_score(db)
+
+    fulltext.fetch_missing(db)
+    recommender.train_and_score(db)
+
+    index = recommender._get_index(db, sync=False)
+    with_text = {pid for pid in ids if not _missing(pid)}
+    assert index.full_text == with_text
+    for pid, title, abstract, body in features.text_query(db).filter(models.Paper.id.in_(ids)):
+        assert (body is not None) == (pid in with_text)
+        if body is None:
+            continue
+        assert 0 < len(body) <= 300 and "Introduction" in body
+        expected = index.vectorizer.transform([features.paper_text(title, abstract, body)])
+        assert np.allclose(index.matrix[index.row_of[pid]].toarray(), expected.toarray())
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from arxiv_local.app import jobs, main
+from arxiv_local.app.database import models
+
+
+def _wait_idle(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while jobs.runner.active():
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("path, task", [("/fetch", "task_fetch_and_score"), ("/train", "task_train_only")])
+def test_second_submission_joins_the_running_job(db, monkeypatch, path, task):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(job, **params):
+        started.set()
+        assert release.wait(5)
+        return {"done": True}
+
+    monkeypatch.setattr(main, task, blocking)
+    client = TestClient(main.app)
+    try:
+        first = client.post(path).json()
+        assert first["status"] == "started"
+        assert started.wait(5)
+        second = client.post(path).json()
+        assert second == {"status": "already running", "job_id": first["job_id"]}
+    finally:
+        release.set()
+        _wait_idle()
+
+    assert db.query(models.Job).count() == 1
+    assert jobs.get_job(db, first["job_id"])["status"] == "succeeded"
+    # Once it is done, the next submission starts a new job
+    third = client.post(path).json()
+    _wait_idle()
+    assert third["status"] == "started" and third["job_id"] != first["job_id"]
@@ -0,0 +1,56 @@
+import sqlite3
+
+from sqlalchemy import create_engine, inspect
+
+from arxiv_local.app import migrations
+from arxiv_local.app.database import models
+
+# The schema before versioning (user_version 0)
+BASELINE_SCHEMA = """
+CREATE TABLE papers (id VARCHAR PRIMARY KEY, title VARCHAR, authors VARCHAR, abstract TEXT,
+                     published_date DATE, updated_date DATE, arxiv_category VARCHAR, link VARCHAR, score FLOAT);
+CREATE TABLE interactions (id INTEGER PRIMARY KEY, paper_id VARCHAR, is_liked BOOLEAN, is_zotero BOOLEAN,
+                           viewed_date DATETIME);
+CREATE TABLE fetch_logs (id INTEGER PRIMARY KEY, fetch_date DATETIME, category VARCHAR, status VARCHAR);
+CREATE TABLE viewed_dates (date DATE PRIMARY KEY, viewed_at DATETIME);
+"""
+
+
+def _baseline_db(path):
+    con = sqlite3.connect(path)
+    con.executescript(BASELINE_SCHEMA)
+    con.executemany("INSERT INTO papers VALUES (?, 't', 'A. Author', 'galaxy', ?, ?, 'astro-ph.GA', NULL, ?)",
+                    [(f"2601.0000{i}", "2026-01-05", "2026-01-05", i / 10) for i in range(5)])
+    con.execute("INSERT INTO interactions (paper_id, is_liked, is_zotero) VALUES ('2601.00001', 1, 0)")
+    con.executemany("INSERT INTO viewed_dates VALUES (?, '2026-01-06 10:00:00')", [("2026-01-05",), ("2026-01-06",)])
+    con.commit()
+    con.close()
+    return create_engine(f"sqlite:///{path}")
+
+
+def _query(engine, sql):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(sql).fetchall()
+
+
+def test_baseline_db_data_moves_to_default_user(tmp_path):
+    engine = _baseline_db(tmp_path / "baseline.db")
+    assert migrations.migrate(engine) == [v for v, _, _ in migrations.MIGRATIONS]
+
+    for table in ("viewed_dates", "scores", "day_ranks"):
+        assert "user_id" in inspect(engine).get_pk_constraint(table)["constrained_columns"], table
+    user = models.DEFAULT_USER_ID
+    assert _query(engine, "SELECT user_id, date FROM viewed_dates ORDER BY date") == \
+        [(user, "2026-01-05"), (user, "2026-01-06")]
+    assert _query(engine, "SELECT user_id, paper_id FROM interactions") == [(user, "2601.00001")]
+    assert _query(engine, "SELECT count(*), min(user_id), max(user_id) FROM scores") == [(5, user, user)]
+    assert _query(engine, "SELECT paper_id FROM day_ranks WHERE user_id = 1 ORDER BY rank LIMIT 1") == \
+        [("2601.00004",)]
+
+    # A second profile can view the same day
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO users (id, name) VALUES (2, 'second')")
+        conn.exec_driver_sql("INSERT INTO viewed_dates (user_id, date) VALUES (2, '2026-01-05')")
+    assert _query(engine, "SELECT count(*) FROM viewed_dates WHERE date = '2026-01-05'") == [(2,)]
+    assert migrations.migrate(engine) == []
+
@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+
+from arxiv_local.app import main, page_cache, rankings, users
+from arxiv_local.app.database import models
+
+from conftest import add_papers
+
+
+def test_put_after_invalidation_is_not_stored():
+    cache = page_cache.PageCache()
+    epoch = cache.epoch
+    cache.invalidate_prefix("2:")
+    etag = cache.put("1:2026-01-05", b"old page", epoch)
+    assert etag and cache.get("1:2026-01-05") is None
+
+    cache.put("1:2026-01-05", b"page", cache.epoch)
+    assert cache.get("1:2026-01-05")[1] == b"page"
+
+
+def test_change_during_render_is_not_cached(db, monkeypatch):
+    add_papers(db, 3)
+    rankings.rebuild_all(db)
+    page_cache.pages.invalidate()
+    get_day = rankings.get_day
+
+    def get_day_while_liked(*args, **kwargs):
+        ranked = get_day(*args, **kwargs)
+        # A like lands after the page read its papers
+        main.invalidate_user_pages(models.DEFAULT_USER_ID)
+        return ranked
+
+    monkeypatch.setattr(rankings, "get_day", get_day_while_liked)
+    assert TestClient(main.app).get("/?date=2026-01-05").status_code == 200
+    assert page_cache.pages.get(f"{models.DEFAULT_USER_ID}:2026-01-05") is None
+
+
+def test_like_drops_only_the_liking_users_pages(db, monkeypatch):
+    monkeypatch.setattr(main, "task_rescore_like", lambda paper_id, user_id: None)
+    ids = add_papers(db, 3)
+    rankings.rebuild_all(db)
+    other = users.create_user(db, "other")
+    page_cache.pages.invalidate()
+    client = TestClient(main.app)
+    for user_id in (models.DEFAULT_USER_ID, other):
+        client.cookies.set(users.USER_COOKIE, str(user_id))
+        client.get("/?date=2026-01-05")
+    assert page_cache.pages.get(f"{other}:2026-01-05")
+
+    client.post(f"/like/{ids[0]}")
+
+    assert page_cache.pages.get(f"{other}:2026-01-05") is None
+    assert page_cache.pages.get(f"{models.DEFAULT_USER_ID}:2026-01-05")
@@ -0,0 +1,133 @@
+from conftest import add_papers
+
+from arxiv_local.app import rankings, recommender, scores
+from arxiv_local.app.database import models
+
+
+def _like(db, paper_id, user_id=models.DEFAULT_USER_ID):
+    db.add(models.Interaction(user_id=user_id, paper_id=paper_id, is_liked=True))
+    db.commit()
+    return recommender.record_interaction(db, paper_id, True, user_id)
+
+
+def _stored(db, generation):
+    return dict(db.query(models.Score.paper_id, models.Score.score).filter(
+        models.Score.generation == generation, models.Score.user_id == models.DEFAULT_USER_ID
+    ))
+
+
+def test_like_writes_only_moved_scores_into_current_generation(db):
+    ids = add_papers(db, 300)
+    db.add(models.Interaction(user_id=models.DEFAULT_USER_ID, paper_id=ids[0], is_liked=True))
+    db.commit()
+    assert recommender.train_and_score(db) == len(ids)
+    generation = scores.current_generation(db)
+    before = _stored(db, generation)
+
+    updated = _like(db, ids[1])
+
+    # No new generation; the rows that moved were updated in place
+    assert [g.id for g in scores.list_generations(db)] == [generation]
+    after = _stored(db, generation)
+    moved = {pid for pid in ids if after[pid] != before[pid]}
+    assert 0 < updated == len(moved) < len(ids)
+    assert all(abs(after[pid] - before[pid]) > recommender.LIKE_SCORE_EPS for pid in moved)
+    expected = recommender._get_index(db, sync=False).compute_scores(user_ids=[models.DEFAULT_USER_ID])
+    for pid, value in zip(recommender._get_index(db, sync=False).paper_ids, expected[models.DEFAULT_USER_ID]):
+        assert abs(after[pid] - value) <= recommender.LIKE_SCORE_EPS
+    ranked = db.query(models.DayRank.paper_id).filter(
+        models.DayRank.user_id == models.DEFAULT_USER_ID, models.DayRank.rank == 1,
+        models.DayRank.date == db.get(models.Paper, ids[0]).published_date
+    ).scalar()
+    assert ranked == max(ids[:60], key=after.get)
+
+    # Ranks follow the stored scores on every day
+    for day in {p.published_date for p in db.query(models.Paper)}:
+        order = rankings.day_order(db, day, models.DEFAULT_USER_ID)
+        assert order == sorted(order, key=lambda pid: (-after[pid], pid))
+
+
+def test_rescore_rebuilds_only_reordered_days(db):
+    ids = add_papers(db, 120)
+    user = models.DEFAULT_USER_ID
+    values = [1 - i / 1000 for i in range(120)]
+    generation, _ = scores.publish(ids, {user: values}, "train")
+    rankings.rebuild_all(db)
+    revision = rankings.current_revision(db)
+
+    # Day 1 keeps its order, day 2's last paper moves to the top
+    values[0], values[119] = 0.9995, 2.0
+    scores.upsert(user, ids, values, [0, 119], generation)
+    rebuilt = rankings.rescore(db, user, {ids[0]: 0.9995, ids[119]: 2.0})
+
+    day1, day2 = (db.get(models.Paper, ids[i]).published_date for i in (0, 119))
+    assert rebuilt == {day2}
+    assert rankings.day_order(db, day1, user) == ids[:60]
+    assert rankings.day_order(db, day2, user) == [ids[119]] + ids[60:119]
+    _, changes = rankings.changes_since(db, revision, user, day1)
+    assert [(pid, score) for _, _, pid, score, _, _ in changes] == [(ids[0], 0.9995)]
+
+
+def test_like_after_rollback_rewrites_the_rolled_back_generation(db):
+    ids = add_papers(db, 120)
+    db.add(models.Interaction(user_id=models.DEFAULT_USER_ID, paper_id=ids[0], is_liked=True))
+    db.commit()
+    recommender.train_and_score(db)
+    first = scores.current_generation(db)
+    _like(db, ids[1])
+    recommender.train_and_score(db, full=True)
+    scores.rollback(db)
+    assert scores.current_generation(db) == first
+
+    # The index's copy of the scores is from the newer generation: every row is written
+    assert _like(db, ids[2]) == len(ids)
+    assert len(_stored(db, first)) == len(ids)
+
+
+def test_retrain_publishes_only_users_whose_scores_moved(db):
+    ids = add_papers(db, 120)
+    db.add(models.User(id=2, name="second"))
+    db.add(models.Interaction(user_id=models.DEFAULT_USER_ID, paper_id=ids[0], is_liked=True))
+    db.commit()
+    recommender.train_and_score(db)
+    first = scores.current_generation(db)
+
+    # Nothing moved: no generation that would push older ones out
+    assert recommender.train_and_score(db) == 0
+    assert [g.id for g in scores.list_generations(db)] == [first]
+
+    # Only the second user's scores are new
+    db.add(models.Interaction(user_id=2, paper_id=ids[5], is_liked=True))
+    db.commit()
+    assert recommender.train_and_score(db) == len(ids)
+    assert scores.current_generation(db) == first
+    second = scores.current_generation(db, 2)
+    assert second != first
+    assert {u for (u,) in db.query(models.Score.user_id).filter(models.Score.generation == second)} == {2}
+
+
+def test_like_rescore_is_not_timed_with_the_request(db, monkeypatch):
+    import threading
+    import time
+    from fastapi.testclient import TestClient
+    from arxiv_local.app import concurrency, main, metrics
+
+    ids = add_papers(db, 2)
+    release, rescored = threading.Event(), []
+
+    def slow_rescore(paper_id, user_id):
+        release.wait(5)
+        rescored.append((paper_id, user_id))
+
+    monkeypatch.setattr(main, "task_rescore_like", slow_rescore)
+    labels = ("POST", "/like/{paper_id}", "200")
+    before = metrics.request_seconds.count(*labels)
+    start = time.perf_counter()
+    assert TestClient(main.app).post(f"/like/{ids[0]}").json() == {"status": "success", "is_liked": True}
+    assert time.perf_counter() - start < 2
+    assert metrics.request_seconds.count(*labels) == before + 1
+    assert not rescored
+
+    release.set()
+    concurrency.after_executor.submit(lambda: None).result(5)
+    assert rescored == [(ids[0], models.DEFAULT_USER_ID)]
@@ -0,0 +1,30 @@
+import datetime
+
+from arxiv_local.app import rankings, retention, scores
+from arxiv_local.app.database import models
+
+from conftest import add_papers
+
+
+def test_prune_removes_scores_and_rankings_of_pruned_papers(db):
+    old = add_papers(db, 5, day=datetime.date.today() - datetime.timedelta(days=200))
+    recent = add_papers(db, 5, start=5, day=datetime.date.today() - datetime.timedelta(days=10))
+    db.add(models.User(id=2, name="second"))
+    db.add(models.Interaction(user_id=1, paper_id=old[0], is_liked=True))
+    db.commit()
+    paper_ids = old + recent
+    # Two generations for both users, so every kept one must be cleaned
+    for _ in range(2):
+        scores.publish(paper_ids, {1: [0.5] * 10, 2: [0.2] * 10}, "train")
+    rankings.rebuild_days(db, {p.published_date for p in db.query(models.Paper)})
+    db.commit()
+
+    summary = retention.prune(db, days_to_keep=90)
+
+    assert summary["deleted"] == 4
+    gone = set(old[1:])
+    assert not db.query(models.Score).filter(models.Score.paper_id.in_(gone)).count()
+    assert not db.query(models.DayRank).filter(models.DayRank.paper_id.in_(gone)).count()
+    kept = {pid for (pid,) in db.query(models.Score.paper_id).distinct()}
+    assert kept == {old[0], *recent}
+    assert db.query(models.Score).count() == 2 * 2 * 6
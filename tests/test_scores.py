@@ -0,0 +1,21 @@
+from arxiv_local.app import scores
+from arxiv_local.app.database import models
+
+
+def test_like_generations_do_not_push_out_training_runs(db, monkeypatch):
+    monkeypatch.setattr(scores, "KEEP_GENERATIONS", 2)
+    db.add(models.User(id=2, name="second"))
+    db.commit()
+    paper_ids = ["2601.00001", "2601.00002"]
+    trained = [scores.publish(paper_ids, {1: [0.1, 0.2]}, "train")[0] for _ in range(3)]
+    # A new user's first scores come from a like, as do other users' later on
+    for value in (0.3, 0.4, 0.5):
+        scores.publish(paper_ids, {2: [value, value]}, "like")
+
+    kept = {g.id: g.source for g in scores.list_generations(db)}
+    assert trained[0] not in kept
+    assert [g for g in trained[1:] if g in kept] == trained[1:]
+    assert list(kept.values()).count("like") == 1  # only the one user 2 reads
+
+    assert scores.rollback(db, 1) == (trained[2], trained[1])
+    assert scores.current_generation(db, 1) == trained[1]
@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+from arxiv_local.app import fetcher, retention, search
+from arxiv_local.app.database import models
+
+TODAY = datetime.date.today()
+
+
+@pytest.mark.parametrize("query, match", [
+    ("dark energy", '"dark" AND "energy"'),
+    ('"dark energy" survey', '"dark energy" AND "survey"'),
+    ("galax*", '"galax"*'),
+    ("author:smith", 'authors : "smith"'),
+    ("authors:smith", 'authors : "smith"'),
+    ('title:"dark energy"', 'title : "dark energy"'),
+    ("abstract:galax*", 'abstract : "galax"*'),
+    # FTS5 operators and syntax are searched as plain words
+    ("dark AND NOT energy", '"dark" AND "AND" AND "NOT" AND "energy"'),
+    ("NEAR(dark energy)", '"NEAR dark" AND "energy"'),
+    ("o'brien", '"o\'brien"'),
+    ("dark-energy", '"dark-energy"'),
+    # Stray quotes and punctuation-only terms
+    ('"dark energy', '"dark" AND "energy"'),
+    ('dark"energy', '"dark" AND "energy"'),
+    ("dark - energy", '"dark" AND "energy"'),
+    ("unknown:word", '"unknown word"'),
+])
+def test_build_match(query, match):
+    assert search.build_match(query) == match
+
+
+@pytest.mark.parametrize("query", ["", None, '"', '""', "*", "( )", "-", "title:*", '" "', "\\ %"])
+def test_build_match_nothing_searchable(query):
+    assert search.build_match(query) is None
+
+
+def _record(pid, title, authors, day=TODAY):
+    names = authors.split(", ")
+    return {"id": pid, "version": 1, "title": title, "authors": authors, "author_names": names,
+            "abstract": "We measure the lensing signal of galaxy clusters.", "published_date": day,
+            "updated_date": day, "arxiv_category": "astro-ph.CO", "categories": ["astro-ph.CO"],
+            "link": f"http://arxiv.org/abs/{pid}v1",
+            "submitted_at": datetime.datetime.combine(day, datetime.time(12))}
+
+
+def _ids(db, query, **kwargs):
+    return [pid for pid, _ in search.search_papers(db, query, **kwargs)["results"]]
+
+
+@pytest.fixture
+def ingested(db):
+    old = TODAY - datetime.timedelta(days=200)
+    fetcher.ingest_records(db, [
+        _record("2601.00001", "Dark energy from supernovae", "J. Smith, K. Jones"),
+        _record("2601.00002", "Galaxy cluster masses", "L. Brown"),
+        _record("2601.00003", "Dark matter halos of dwarf galaxies", "M. Smithson", day=old),
+    ])
+    return db
+
+
+def test_search_after_ingest(ingested):
+    db = ingested
+    assert sorted(_ids(db, "dark")) == ["2601.00001", "2601.00003"]
+    assert _ids(db, "author:smith") == ["2601.00001"]
+    assert sorted(_ids(db, "author:smith*")) == ["2601.00001", "2601.00003"]
+    assert _ids(db, 'title:"galaxy cluster"') == ["2601.00002"]
+    # The abstract is indexed too, but a title filter ignores it
+    assert len(_ids(db, "lensing")) == 3
+    assert _ids(db, "title:lensing") == []
+    assert _ids(db, "dark", date_from=TODAY) == ["2601.00001"]
+
+
+def test_search_follows_title_updates(ingested):
+    db = ingested
+    db.query(models.Paper).filter(models.Paper.id == "2601.00002").update({"title": "Weak lensing of clusters"})
+    db.commit()
+    assert _ids(db, "title:galaxy") == []
+    assert _ids(db, "title:weak") == ["2601.00002"]
+
+
+def test_search_forgets_pruned_papers(ingested):
+    db = ingested
+    retention.prune(db, days_to_keep=90)
+    assert _ids(db, "dark") == ["2601.00001"]
+    assert _ids(db, "halos") == []
+
+
+@pytest.mark.parametrize("query", [
+    '"', '"dark', 'dark"', "dark AND", "OR", "NOT dark", "NEAR(", "(dark", "dark)", "*dark", "dark**",
+    "title:", "title:*", "author:", ":dark", "{title authors}: dark", "dark^", "^", "-dark", "dark - -",
+    "'", "\\", "%", "a:b:c", "dark NEAR/2 energy", "\x00",
+])
+def test_malformed_queries_do_not_raise(ingested, query):
+    result = search.search_papers(ingested, query)
+    assert result["total"] == len(result["results"])
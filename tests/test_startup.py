@@ -0,0 +1,17 @@
+from arxiv_local import startup_benchmark
+
+
+def test_app_import_stays_light_and_fast():
+    # Every run imports the app in a fresh interpreter, with a DB URL of its own
+    report = startup_benchmark.run(runs=3, top=5)
+
+    assert report["heavy_imports"] == []
+    assert not report["touched_db"]
+    assert report["median_ms"] <= startup_benchmark.BUDGET_MS
+    assert startup_benchmark.check(report) == []
+
+
+def test_check_reports_regressions():
+    report = {"median_ms": 900.0, "heavy_imports": ["sklearn"], "touched_db": True}
+    failures = startup_benchmark.check(report, budget_ms=500, baseline={"median_ms": 400.0})
+    assert len(failures) == 4
@@ -0,0 +1,21 @@
+from arxiv_local.app import catalog, validation
+from arxiv_local.app.database import models
+
+from conftest import add_papers
+
+
+def test_author_repair_relinks_the_byline(db):
+    pid, other = add_papers(db, 2)
+    names = ["A. One", "B. $Two"]
+    db.query(models.Paper).filter(models.Paper.id == pid).update({models.Paper.authors: ", ".join(names)})
+    catalog.link_papers(db, [{"id": pid, "author_names": names, "arxiv_category": "astro-ph.GA",
+                              "categories": ["astro-ph.GA", "astro-ph.CO"]},
+                             {"id": other, "author_names": ["C. Three"], "arxiv_category": "astro-ph.GA"}])
+    db.commit()
+
+    summary = validation.scan(db, checks=["math_delimiters"], fix=True, report=None)
+
+    assert summary["fixed"] == {"math_delimiters": 1}
+    assert db.get(models.Paper, pid).authors == "A. One, B. $Two$"
+    assert catalog.authors_of(db, [pid, other]) == {pid: ["A. One", "B. $Two$"], other: ["C. Three"]}
+    assert catalog.categories_of(db, [pid])[pid] == ["astro-ph.GA", "astro-ph.CO"]
@@ -0,0 +1,122 @@
+import datetime
+import time
+
+import pytest
+from conftest import add_papers
+
+from arxiv_local import fake_zotero_server
+from arxiv_local.app import zotero_service
+from arxiv_local.app.database import models
+
+
+@pytest.fixture
+def zotero(monkeypatch):
+    """Points the Zotero client at a fresh stand-in server; returns serve(**state options) -> state."""
+    servers = []
+
+    def serve(**options):
+        server, endpoint, state = fake_zotero_server.serve(fake_zotero_server.ZoteroState(**options))
+        servers.append(server)
+        monkeypatch.setattr(zotero_service, "ZOTERO_ENDPOINT", endpoint)
+        monkeypatch.setattr(zotero_service, "_client", None)
+        monkeypatch.setattr(zotero_service, "_template", None)
+        return state
+
+    monkeypatch.setattr(zotero_service, "ZOTERO_USER_ID", "1")
+    monkeypatch.setattr(zotero_service, "ZOTERO_API_KEY", "key")
+    monkeypatch.setattr(zotero_service, "BACKOFF_BASE", 0.01)
+    yield serve
+    for server in servers:
+        server.shutdown()
+
+
+def _liked(db, n):
+    ids = add_papers(db, n)
+    db.add_all(models.Interaction(user_id=models.DEFAULT_USER_ID, paper_id=pid, is_liked=True) for pid in ids)
+    db.commit()
+    return ids
+
+
+def _in_zotero(db):
+    return {pid for (pid,) in db.query(models.Interaction.paper_id).filter(models.Interaction.is_zotero == True)}
+
+
+def test_sync_sends_batches_of_fifty_with_one_template_request(db, zotero):
+    state = zotero()
+    ids = _liked(db, 120)
+
+    result = zotero_service.sync_papers(db, zotero_service.pending_paper_ids(db))
+
+    assert sorted(result["synced"]) == ids and result["failed"] == {}
+    assert sorted(n for _, n in state.writes) == [20, 50, 50]
+    assert state.template_requests == 1
+    db.expire_all()
+    assert _in_zotero(db) == set(ids)
+    assert zotero_service.pending_paper_ids(db) == []
+
+
+def test_throttled_writes_wait_for_retry_after(db, zotero):
+    state = zotero(throttle=2, retry_after=1)
+    ids = _liked(db, 30)
+
+    start = time.monotonic()
+    result = zotero_service.sync_papers(db, ids)
+
+    assert sorted(result["synced"]) == ids
+    assert state.write_requests == 3
+    # The server's Retry-After, not BACKOFF_BASE, set the pace
+    assert state.writes[-1][0] - start >= 1.0
+
+
+def test_backoff_header_spaces_out_later_batches(db, zotero):
+    state = zotero(backoff=1)
+    ids = _liked(db, 100)
+
+    result = zotero_service.sync_papers(db, ids, workers=1)
+
+    assert len(result["synced"]) == 100
+    (first, _), (second, _) = state.writes
+    assert second - first >= 1.0
+
+
+def test_failed_items_are_queued_and_drained_by_a_later_sync(db, zotero):
+    state = zotero(fail_markers=("2601.00003",))
+    ids = _liked(db, 10)
+
+    result = zotero_service.sync_papers(db, ids)
+
+    assert list(result["failed"]) == ["2601.00003"]
+    queued = db.query(models.ZoteroQueue).one()
+    assert (queued.paper_id, queued.attempts) == ("2601.00003", 1)
+    assert "Rejected by fake server" in queued.last_error
+    # Not retried before its next attempt is due
+    assert zotero_service.pending_paper_ids(db) == []
+    later = queued.next_attempt_at + datetime.timedelta(seconds=1)
+    assert zotero_service.pending_paper_ids(db, now=later) == ["2601.00003"]
+
+    state.fail_markers = ()
+    assert zotero_service.sync_papers(db, ["2601.00003"])["synced"] == ["2601.00003"]
+    db.expire_all()
+    assert db.query(models.ZoteroQueue).count() == 0
+    assert _in_zotero(db) == set(ids)
+
+
+def test_zotero_belongs_to_the_default_profile(db, zotero):
+    from fastapi.testclient import TestClient
+    from arxiv_local.app import main, users
+
+    state = zotero()
+    ids = _liked(db, 3)
+    other = users.create_user(db, "other")
+    client = TestClient(main.app)
+    client.cookies.set(users.USER_COOKIE, str(other))
+
+    assert client.post("/sync_zotero").json() == {"status": "error", "message": users.ZOTERO_ONLY}
+    assert client.post(f"/zotero/{ids[0]}").json()["status"] == "error"
+    assert state.write_requests == 0
+    page = client.get("/?date=2026-01-05").text
+    assert "Sync Liked to Z" not in page and "zotero-btn-" not in page
+
+    client.cookies.set(users.USER_COOKIE, str(models.DEFAULT_USER_ID))
+    assert client.post(f"/zotero/{ids[0]}").json()["status"] == "success"
+    assert "Sync Liked to Z" in client.get("/?date=2026-01-05").text